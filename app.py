@@ -1,15 +1,68 @@
-import os
 import streamlit as st
-from PIL import Image
 import pandas as pd
 import io
+import hashlib
+import os
+import time
 from ocr_demo import ReceiptScanner
+from preprocess import Preprocessor
+from instrumentation import Instrumentation, LoggingSink, METRICS
+from scan_cache import ScanCache
+from scan_scheduler import ScanScheduler, QueueFull
+from near_duplicates import NearDuplicateIndex, hash_distance, phash
+from quality import QualityGate
+from image_io import decode_image
+from receipt_store import ReceiptStore, HISTORY_COLUMNS, format_cents
+from receipt_parser import PARSER_VERSION
+from merchant_index import MerchantIndex
+from preview import PreviewCache, PreviewLoader
 
 # --- Page Config ---
 st.set_page_config(page_title="Receipt Scanner", layout="wide")
 
 st.title("🧾 Receipt Scanner & Parser")
 
+# --- OCR Engine ---
+SCAN_CACHE_DIR = ".scan_cache"
+# Perceptual hashes of scanned receipts, kept next to the receipt store
+NEAR_DUPLICATE_INDEX = "receipts.phash"
+
+@st.cache_resource
+def get_scanner():
+    # Shared across sessions, so a re-upload of the same receipt skips OCR
+    scanner = ReceiptScanner(
+        cache=ScanCache(cache_dir=SCAN_CACHE_DIR),
+        preprocessor=Preprocessor(deskew=True),
+        instrumentation=Instrumentation(sinks=[METRICS, LoggingSink()]),
+        near_duplicates=NearDuplicateIndex(NEAR_DUPLICATE_INDEX),
+    )
+    # Blurry or empty images get feedback in milliseconds instead of an OCR pass
+    scanner.quality_gate = QualityGate()
+    # Load the model while the user is still on the login page
+    scanner.warm_up(background=True)
+    return scanner
+
+scanner = get_scanner()
+
+# One OCR pass at a time across all sessions; more would just fight over the CPU
+SCAN_CONCURRENCY = 1
+SCAN_QUEUE_SIZE = 32
+
+@st.cache_resource
+def get_scheduler():
+    return ScanScheduler(scanner, max_concurrency=SCAN_CONCURRENCY, max_queue=SCAN_QUEUE_SIZE)
+
+scheduler = get_scheduler()
+
+# Uploads are shown as cached thumbnails; the full image only goes to OCR
+PREVIEW_SIZE = (600, 1200)
+
+@st.cache_resource
+def get_previews():
+    return PreviewLoader(PreviewCache(max_entries=128), max_size=PREVIEW_SIZE)
+
+previews = get_previews()
+
 # --- Authentication ---
 if "logged_in" not in st.session_state:
     st.session_state.logged_in = False
@@ -46,43 +99,88 @@ if st.sidebar.button("Log Out"):
 st.write("Upload a receipt image to extract structured data.")
 
 # --- Database Setup ---
+# Legacy flat-file store, imported once into the SQLite store
 DB_FILE = "receipts_db.csv"
+STORE_FILE = "receipts.db"
 
-def load_db():
-    if os.path.exists(DB_FILE):
-        return pd.read_csv(DB_FILE)
-    return pd.DataFrame(columns=["Username", "Merchant", "Date", "Total", "Items"])
-
-def save_to_db(username, merchant, date, total, items):
-    df = load_db()
-    # Flatten items to string
-    items_str = "; ".join([f"{i['name']} ({i['price']})" for i in items])
-    new_entry = pd.DataFrame([{
-        "Username": username,
-        "Merchant": merchant,
-        "Date": date,
-        "Total": total,
-        "Items": items_str
-    }])
-    df = pd.concat([df, new_entry], ignore_index=True)
-    df.to_csv(DB_FILE, index=False)
+@st.cache_resource
+def get_store():
+    store = ReceiptStore(STORE_FILE)
+    store.migrate_from_csv(DB_FILE)
+    return store
+
+store = get_store()
+
+# Optional "merchant_id,name" list of known merchants
+MERCHANTS_FILE = "merchants.csv"
+
+@st.cache_resource
+def get_merchant_index():
+    index = MerchantIndex()
+    if os.path.exists(MERCHANTS_FILE):
+        index.load_csv(MERCHANTS_FILE)
+    for name in store.merchant_names():
+        index.learn(name)
+    # From here on scan results, cached ones included, resolve to known merchants
+    scanner.merchant_index = index
+    return index
+
+merchant_index = get_merchant_index()
+
+def save_to_db(username, merchant, date, total, items, boxes=None):
+    # Known merchants resolve to their id; new ones are added to the index
+    try:
+        merchant_id = merchant_index.learn(merchant) if merchant else None
+    except ValueError:
+        # Nothing to match on (no letters or digits)
+        merchant_id = None
+    # The raw boxes let reparse.py re-run a newer parser without OCR
+    store.save_receipt(username, merchant, date, total, items, boxes=boxes, parser_version=PARSER_VERSION,
+                       merchant_id=merchant_id)
 
 # --- Initialize Session State ---
 if "scan_results" not in st.session_state:
     st.session_state.scan_results = None
 if "last_image_id" not in st.session_state:
     st.session_state.last_image_id = None
+if "scan_future" not in st.session_state:
+    st.session_state.scan_future = None
+if "scan_preview" not in st.session_state:
+    # Preview of the current upload, kept across reruns; its full-resolution
+    # array is released once the upload has results
+    st.session_state.scan_preview = None
+if "camera_burst" not in st.session_state:
+    # Recent camera captures of one receipt as (frame_id, bytes, phash, QualityReport)
+    st.session_state.camera_burst = []
+if "near_duplicate" not in st.session_state:
+    # (file_id, match) for the current image; match is None when it looks new
+    st.session_state.near_duplicate = None
 
-# --- OCR Engine ---
-@st.cache_resource
-def get_scanner():
-    return ReceiptScanner()
-
-try:
-    scanner = get_scanner()
-except Exception as e:
-    st.error(f"Failed to load OCR engine: {e}")
+if scanner.status == "failed":
+    st.error(f"Failed to load OCR engine: {scanner.load_error}")
+    if st.button("Retry loading OCR engine"):
+        scanner.warm_up()
+        st.rerun()
     st.stop()
+elif scanner.status != "ready":
+    st.sidebar.info("⏳ OCR engine loading in the background...")
+
+cache_stats = scanner.cache.stats()
+st.sidebar.caption(
+    f"OCR cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+    f"({cache_stats['hit_rate']:.0%})"
+)
+scan_metrics = METRICS.snapshot()
+if scan_metrics["scans"]:
+    total_stats = scan_metrics["stages"]["total"]
+    st.sidebar.caption(
+        f"Scans: {scan_metrics['scans']} · p50 {total_stats['p50_ms']:.0f} ms · p95 {total_stats['p95_ms']:.0f} ms"
+    )
+queue_stats = scheduler.stats()
+st.sidebar.caption(
+    f"Scan queue: {queue_stats['queued']} waiting · {queue_stats['running']} running · "
+    f"wait p95 {queue_stats['wait_p95_ms'] / 1000:.1f} s"
+)
 
 # --- Input Section ---
 st.subheader("1. Digitize Receipt")
@@ -97,46 +195,148 @@ if input_method == "Upload Image":
 elif input_method == "Use Camera":
     image_file = st.camera_input("Take a picture")
 
-# Detect Image Change
+# Camera captures are checked before OCR. The latest picture is scanned when
+# it passes; otherwise the best of the last few pictures of the same receipt
+CAMERA_BURST = 3
+# Captures further apart than this (pHash bits) show a different receipt and
+# start a new burst; the same limit flags an upload as already scanned
+CAMERA_SAME_RECEIPT_BITS = NearDuplicateIndex().max_distance
+
+def pick_camera_frame(frame_bytes):
+    """Adds a capture to the burst. Returns the bytes of the frame to scan, or None."""
+    burst = st.session_state.camera_burst
+    frame_id = hashlib.sha256(frame_bytes).hexdigest()
+    if not burst or burst[-1][0] != frame_id:
+        img_array = decode_image(frame_bytes)
+        frame_hash = phash(img_array)
+        if burst and hash_distance(frame_hash, burst[-1][2]) > CAMERA_SAME_RECEIPT_BITS:
+            burst.clear()
+        burst.append((frame_id, frame_bytes, frame_hash, scanner.quality_gate.assess(img_array)))
+        del burst[:-CAMERA_BURST]
+
+    latest = burst[-1][3]
+    if latest.ok:
+        return frame_bytes
+    for _, message in latest.problems:
+        st.warning(message)
+    usable = [frame for frame in burst if frame[3].ok]
+    if not usable:
+        st.caption(f"Checked in {latest.elapsed_ms:.0f} ms. Take another picture.")
+        return None
+    best = max(usable, key=lambda frame: frame[3].score)
+    st.info("Using your earlier picture of this receipt instead.")
+    return best[1]
+
+image_bytes = None
 if image_file:
-    # Use size + name as a simple unique ID for the file
-    file_id = f"{image_file.name}-{image_file.size}"
+    image_bytes = image_file.getvalue()
+    if input_method == "Use Camera":
+        image_bytes = pick_camera_frame(image_bytes)
+
+# Detect Image Change
+if image_bytes:
+    # Hash the content so a renamed re-upload is recognised as the same receipt
+    file_id = hashlib.sha256(image_bytes).hexdigest()
     if file_id != st.session_state.last_image_id:
         st.session_state.last_image_id = file_id
         st.session_state.scan_results = None # Reset results
+        if st.session_state.scan_future is not None:
+            # Drops the old job if it hasn't started and nobody else is waiting on it
+            st.session_state.scan_future.cancel()
+            st.session_state.scan_future = None
+        if st.session_state.scan_preview is not None:
+            st.session_state.scan_preview.release()
+            st.session_state.scan_preview = None
 
-if image_file is not None:
+if image_bytes is not None:
     # --- Preview Section ---
     st.subheader("2. Preview & Scan")
     
-    # Display Image based on source
+    # Display Image based on source. An upload is checked and scanned through
+    # its Preview, so the pixels decoded for the thumbnail (all of a PNG) are
+    # reused instead of decoding the bytes again
+    scan_source = image_bytes
     if input_method == "Upload Image":
         col1, col2 = st.columns([1, 2])
         with col1:
-             image = Image.open(image_file)
-             st.image(image, caption="Uploaded Receipt", use_container_width=True)
+            preview = st.session_state.scan_preview
+            if preview is None or preview.key != file_id:
+                preview = previews.request(image_bytes, key=file_id).result()
+                st.session_state.scan_preview = preview
+            width, height = preview.size
+            st.image(preview.thumbnail, caption=f"Uploaded Receipt ({width}×{height})", use_container_width=True)
+        scan_source = preview
     
     # Run Scan if not already done
-    if st.session_state.scan_results is None:
-        # Save temp
-        with open("temp_receipt.png", "wb") as f:
-            f.write(image_file.getbuffer())
+    awaiting_choice = False
+    if st.session_state.scan_results is None and st.session_state.scan_future is None:
+        # A recompressed or resized copy has different bytes, so the scan cache
+        # misses; the perceptual hash still finds it before any OCR runs
+        if st.session_state.near_duplicate is None or st.session_state.near_duplicate[0] != file_id:
+            st.session_state.near_duplicate = (file_id, scanner.find_near_duplicate(scan_source))
+        match = st.session_state.near_duplicate[1]
+        if match is not None and match["result"] is not None:
+            st.warning("This looks like a receipt you have already scanned.")
+            col_reuse, col_rescan = st.columns(2)
+            if col_reuse.button("Use previous result"):
+                st.session_state.scan_results = match["result"]
+                st.rerun()
+            elif col_rescan.button("Scan anyway"):
+                st.session_state.near_duplicate = (file_id, None)
+            else:
+                awaiting_choice = True
 
-        with st.spinner("Scanning..."):
+    if st.session_state.scan_results is None and not awaiting_choice:
+        future = st.session_state.scan_future
+        if future is None:
+            try:
+                # Scan straight from the upload buffer; nothing is written to disk.
+                # Another session uploading the same receipt shares this job.
+                future = scheduler.submit(st.session_state.username, scan_source, key=file_id)
+                st.session_state.scan_future = future
+            except QueueFull as e:
+                st.warning(f"{e}. Please try again in a moment.")
+
+        if future is not None and not future.done():
+            # Poll instead of blocking: the script thread stays free between reruns
+            if scanner.status != "ready":
+                st.info("⏳ Loading OCR engine...")
+            else:
+                eta = scheduler.estimated_wait(st.session_state.username)
+                queued = scheduler.stats()["queued"]
+                st.info(f"⏳ Scanning... ({queued} in queue" + (f", ~{eta:.0f} s)" if eta else ")"))
+            time.sleep(0.5)
+            st.rerun()
+        elif future is not None:
+            st.session_state.scan_future = None
             try:
-                results = scanner.scan("temp_receipt.png")
-                st.session_state.scan_results = results
+                st.session_state.scan_results = future.result()
             except Exception as e:
                 st.error(f"An error occurred during scanning: {e}")
 
     # Display Results
     results = st.session_state.scan_results
+    if results is not None and st.session_state.scan_preview is not None:
+        # The thumbnail stays for display; the full-resolution pixels aren't needed any more
+        st.session_state.scan_preview.release()
     
     if results:
         if "error" in results:
             st.error(results["error"])
         else:
-            st.success("Scan Complete!")
+            meta = results.get('meta', {})
+            validation = results.get('validation', {})
+            if validation.get('status') == 'mismatch':
+                failed = [c for c in validation['checks'] if not c['ok']]
+                st.warning(
+                    "The amounts don't add up ("
+                    + "; ".join(f"{c['check']}: {format_cents(c['found'])} vs {format_cents(c['expected'])}" for c in failed)
+                    + "). Check the numbers against the receipt before saving."
+                )
+            if 'total_ms' in meta:
+                st.success(f"Scan Complete! ({meta['total_ms'] / 1000:.2f} s)")
+            else:
+                st.success("Scan Complete!")
 
             # Layout: Metrics & Table
             col1, col2, col3 = st.columns(3)
@@ -153,6 +353,16 @@ if image_file is not None:
             else:
                 st.info("No line items detected.")
             
+            if meta.get('timings_ms'):
+                with st.expander("⏱️ Scan timings"):
+                    st.dataframe(
+                        pd.DataFrame(
+                            [{"Stage": k, "ms": round(v, 1)} for k, v in meta['timings_ms'].items()]
+                        ),
+                        use_container_width=True,
+                    )
+                    st.caption(" · ".join(f"{k}: {v}" for k, v in meta.get('counters', {}).items()))
+
             # --- Actions ---
             st.subheader("3. Actions")
             col_a, col_b = st.columns(2)
@@ -164,39 +374,140 @@ if image_file is not None:
                         results.get('merchant'),
                         results.get('date'),
                         results.get('total'),
-                        items
+                        items,
+                        boxes=results.get('raw_boxes'),
                     )
                     st.toast("Receipt saved to database!", icon="✅")
 
-else:
+elif image_file is None:
     st.info("Please upload an image to begin.")
 
+# --- Spending Dashboard ---
+st.markdown("---")
+st.subheader("📊 Spending Dashboard")
+
+# Reads the rollup tables kept up to date by each save, never the receipts
+@st.cache_data(max_entries=64)
+def load_dashboard(username, version):
+    return {
+        "summary": store.spending_summary(username),
+        "months": store.spending_rollup(username, "month"),
+        "merchants": store.spending_rollup(username, "merchant", limit=10),
+        "items": store.spending_rollup(username, "item", limit=10),
+    }
+
+dashboard = load_dashboard(st.session_state.username, store.version())
+summary = dashboard["summary"]
+if summary["receipts"]:
+    col_count, col_spend = st.columns(2)
+    col_count.metric("Receipts", summary["receipts"])
+    col_spend.metric("Total spend", format_cents(summary["total_cents"]))
+
+    months = pd.DataFrame(dashboard["months"], columns=["Month", "Receipts", "Cents"])
+    months = months[months["Month"] != ""]
+    if not months.empty:
+        st.bar_chart(months.assign(Spend=months["Cents"] / 100).set_index("Month")["Spend"])
+
+    col_merchants, col_items = st.columns(2)
+    with col_merchants:
+        st.caption("Top merchants")
+        st.dataframe(pd.DataFrame(
+            [(m or "Unknown", n, format_cents(c)) for m, n, c in dashboard["merchants"]],
+            columns=["Merchant", "Receipts", "Spend"],
+        ), use_container_width=True, hide_index=True)
+    with col_items:
+        st.caption("Top items")
+        st.dataframe(pd.DataFrame(
+            [(name, n, format_cents(c)) for name, n, c in dashboard["items"]],
+            columns=["Item", "Count", "Spend"],
+        ), use_container_width=True, hide_index=True)
+else:
+    st.write("Save a receipt to see your spending summary.")
+
 # --- History Section ---
 st.markdown("---")
 st.subheader(f"📂 Receipt History ({st.session_state.username})")
 
-if os.path.exists(DB_FILE):
-    history_df = pd.read_csv(DB_FILE)
-    
-    # Filter by user if column exists
-    if "Username" in history_df.columns:
-        user_history = history_df[history_df["Username"] == st.session_state.username]
-    else:
-        # Backward compatibility for old DB (show nothing or everything? Better show nothing to stay safe)
-        st.warning("Database format is old. Showing empty history. New saves will be visible.")
-        user_history = pd.DataFrame()
-
-    if not user_history.empty:
-        st.dataframe(user_history, use_container_width=True)
-        
-        csv_bytes = user_history.to_csv(index=False).encode('utf-8')
-        st.download_button(
-            label="📥 Download My History (CSV)",
-            data=csv_bytes,
-            file_name=f"receipts_{st.session_state.username}.csv",
-            mime="text/csv",
-        )
-    else:
-        st.write("No history found for this user.")
+# Cached per store version: reruns (button clicks etc.) don't touch the DB
+# until a save bumps the version
+@st.cache_data(max_entries=64)
+def load_history_page(username, start_date, end_date, sort_by, descending, page, page_size, version):
+    total = store.count_history(username, start_date, end_date)
+    rows = store.query_history(
+        username, start_date, end_date, sort_by=sort_by,
+        descending=descending, page=page, page_size=page_size,
+    )
+    return total, rows
+
+# Exports are only built when asked for; rebuilding them on every rerun
+# after a save would cost O(history) per save
+def export_history_csv(username, start_date, end_date, sort_by, descending):
+    # Rows are streamed from the DB cursor in chunks instead of going through a DataFrame
+    buf = io.BytesIO()
+    for chunk in store.iter_history_csv(username, start_date, end_date, sort_by, descending):
+        buf.write(chunk.encode('utf-8'))
+    return buf.getvalue()
+
+def export_history_parquet(username, start_date, end_date, table):
+    # Typed columns (amounts in cents, real dates) for offline analytics
+    buf = io.BytesIO()
+    store.export_parquet(buf, table, username=username, start_date=start_date, end_date=end_date)
+    return buf.getvalue()
+
+# format -> (file name prefix, extension, mime type)
+EXPORT_FORMATS = {
+    "CSV": ("receipts", "csv", "text/csv"),
+    "Receipts (Parquet)": ("receipts", "parquet", "application/vnd.apache.parquet"),
+    "Items (Parquet)": ("items", "parquet", "application/vnd.apache.parquet"),
+}
+
+HISTORY_PAGE_SIZE = 25
+
+col_from, col_to, col_sort, col_order = st.columns(4)
+start_date = col_from.date_input("From", value=None)
+end_date = col_to.date_input("To", value=None)
+sort_by = col_sort.selectbox("Sort by", ["date", "merchant", "total", "saved"])
+descending = col_order.selectbox("Order", ["Newest first", "Oldest first"]) == "Newest first"
+
+start_key = start_date.isoformat() if start_date else None
+end_key = end_date.isoformat() if end_date else None
+store_version = store.version()
+
+total_rows, _ = load_history_page(
+    st.session_state.username, start_key, end_key, sort_by, descending, 0, HISTORY_PAGE_SIZE, store_version
+)
+
+if total_rows:
+    page_count = (total_rows + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+    page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1) - 1
+    _, rows = load_history_page(
+        st.session_state.username, start_key, end_key, sort_by, descending, page, HISTORY_PAGE_SIZE, store_version
+    )
+    user_history = pd.DataFrame(rows, columns=HISTORY_COLUMNS)
+    st.dataframe(user_history, use_container_width=True)
+    st.caption(f"{total_rows} receipts")
+
+    col_format, col_prepare, col_download = st.columns(3)
+    export_format = col_format.selectbox("Export", list(EXPORT_FORMATS))
+    # A prepared export is offered until the filters, format or data change
+    export_key = (st.session_state.username, start_key, end_key, sort_by, descending, export_format, store_version)
+    if col_prepare.button("Prepare export"):
+        prefix, extension, mime = EXPORT_FORMATS[export_format]
+        try:
+            if extension == "csv":
+                data = export_history_csv(st.session_state.username, start_key, end_key, sort_by, descending)
+            else:
+                data = export_history_parquet(st.session_state.username, start_key, end_key, prefix)
+            st.session_state.history_export = (export_key, data, f"{prefix}_{st.session_state.username}.{extension}", mime)
+        except ImportError:
+            col_prepare.caption("Install pyarrow for Parquet export.")
+
+    prepared = st.session_state.get("history_export")
+    if prepared is not None and prepared[0] == export_key:
+        _, data, file_name, mime = prepared
+        col_download.download_button(label="📥 Download", data=data, file_name=file_name, mime=mime)
+    elif prepared is not None:
+        # Stale export; don't keep its bytes in the session
+        st.session_state.history_export = None
 else:
-    st.write("No history yet.")
+    st.write("No history found for this user.")
@@ -0,0 +1,233 @@
+"""
+Headless batch scanning.
+
+    python batch_scan.py receipts/ --workers 4 --output results.jsonl --checkpoint run.ckpt
+
+Walks directories (or reads --file-list), scans with N worker processes and
+writes one JSON line per receipt as soon as it finishes. Re-running the same
+command after an interruption skips everything the checkpoint marks as done.
+Progress and throughput go to stderr.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from ocr_demo import ReceiptScanner, STRIP_OVERLAP, check_strip_settings
+from preprocess import Preprocessor
+from merchant_index import MerchantIndex
+from reader_pool import ReaderPool
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp")
+
+
+def iter_images(inputs, file_list=None, extensions=IMAGE_EXTENSIONS):
+    """
+    Yields image paths lazily, in a stable order so indices survive a restart.
+    inputs: files and/or directories (walked recursively, sorted per directory)
+    file_list: text file with one path per line ("-" for stdin)
+    """
+    for path in inputs:
+        if os.path.isdir(path):
+            yield from _walk_sorted(path, extensions)
+        else:
+            yield path
+
+    if file_list:
+        f = sys.stdin if file_list == "-" else open(file_list, "r", encoding="utf-8")
+        try:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
+        finally:
+            if f is not sys.stdin:
+                f.close()
+
+
+def _walk_sorted(root, extensions):
+    try:
+        entries = sorted(os.scandir(root), key=lambda e: e.name)
+    except OSError:
+        return
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            yield from _walk_sorted(entry.path, extensions)
+        elif entry.name.lower().endswith(extensions):
+            yield entry.path
+
+
+class Checkpoint:
+    """
+    Tracks finished input indices in constant space.
+    done_through: every index below it is finished
+    extra: finished indices above done_through (bounded by the number in flight)
+    The file is rewritten atomically on every mark_done(); it holds only the
+    indices in flight, and a scan takes far longer than the write.
+    """
+
+    def __init__(self, path, run_key):
+        self.path = path
+        self.run_key = run_key
+        self.done_through = 0
+        self.extra = set()
+
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("run_key") != run_key:
+                raise SystemExit(f"Checkpoint {path} belongs to a different run; delete it or change --checkpoint")
+            self.done_through = state["done_through"]
+            self.extra = set(state.get("extra", []))
+
+    def is_done(self, index):
+        return index < self.done_through or index in self.extra
+
+    def mark_done(self, index):
+        self.extra.add(index)
+        while self.done_through in self.extra:
+            self.extra.remove(self.done_through)
+            self.done_through += 1
+        self.save()
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"run_key": self.run_key, "done_through": self.done_through,
+                       "extra": sorted(self.extra)}, f)
+        os.replace(tmp_path, self.path)
+
+
+class Progress:
+    def __init__(self, stream=sys.stderr, interval=1.0):
+        self.stream = stream
+        self.interval = interval
+        self.start = time.monotonic()
+        self.done = 0
+        self.errors = 0
+        self.skipped = 0
+        self._last = 0.0
+
+    def update(self, error=False, force=False):
+        now = time.monotonic()
+        if not force and now - self._last < self.interval:
+            return
+        self._last = now
+        elapsed = max(now - self.start, 1e-9)
+        self.stream.write(
+            f"\r{self.done} scanned, {self.errors} errors, {self.skipped} skipped "
+            f"| {self.done / elapsed:.2f} img/s | {elapsed:.0f}s elapsed"
+        )
+        self.stream.flush()
+
+
+def run(args):
+    run_key = json.dumps({"inputs": args.inputs, "file_list": args.file_list})
+    checkpoint = Checkpoint(args.checkpoint, run_key)
+    progress = Progress()
+
+    # Maps scan_batch's running index back to (input index, path); only
+    # receipts in flight are held, so memory doesn't grow with the input
+    in_flight = {}
+
+    def pending_images():
+        batch_index = 0
+        for index, path in enumerate(iter_images(args.inputs, args.file_list)):
+            if checkpoint.is_done(index):
+                progress.skipped += 1
+                continue
+            in_flight[batch_index] = (index, path)
+            batch_index += 1
+            yield path
+
+    preprocessor = None
+    if args.preprocess:
+        # max_side would shrink a long receipt until its text is unreadable;
+        # in strip mode only the text-height target limits the size
+        preprocessor = Preprocessor(deskew=True, max_side=None if args.strip_height else 2000)
+    reader_pool = None
+    if args.lang_group:
+        reader_pool = ReaderPool([group.split(",") for group in args.lang_group],
+                                 memory_budget_mb=args.reader_memory_mb)
+    scanner = ReceiptScanner(args.lang, preprocessor=preprocessor, reader_pool=reader_pool)
+    scanner.two_phase = args.two_phase
+    if args.merchants:
+        merchant_index = MerchantIndex()
+        merchant_index.load_csv(args.merchants)
+        scanner.merchant_index = merchant_index
+    scanner.strip_height = args.strip_height
+
+    # Appending keeps earlier output when resuming. The checkpoint is saved right
+    # after each line is written, so a crash between the two repeats at most
+    # that one receipt (at-least-once)
+    out = sys.stdout if args.output in (None, "-") else open(args.output, "a", encoding="utf-8")
+    try:
+        for batch_index, result in scanner.scan_batch(pending_images(), workers=args.workers,
+                                                      batch_size=args.batch_size):
+            index, path = in_flight.pop(batch_index)
+            if not args.include_lines:
+                result.pop("lines", None)
+                result.pop("raw_boxes", None)
+            record = {"index": index, "path": path}
+            record.update(result)
+            out.write(json.dumps(record) + "\n")
+            out.flush()
+
+            checkpoint.mark_done(index)
+            progress.done += 1
+            if "error" in result:
+                progress.errors += 1
+            progress.update()
+    finally:
+        checkpoint.save()
+        progress.update(force=True)
+        progress.stream.write("\n")
+        if out is not sys.stdout:
+            out.close()
+
+    return 1 if progress.errors else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scan receipt images in bulk and stream JSON lines.")
+    parser.add_argument("inputs", nargs="*", help="image files or directories")
+    parser.add_argument("--file-list", help="file with one image path per line ('-' for stdin)")
+    parser.add_argument("-o", "--output", help="JSONL output file (default: stdout)")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=8, help="text boxes recognized per batch")
+    parser.add_argument("--checkpoint", help="checkpoint file for resuming an interrupted run")
+    parser.add_argument("--lang", nargs="+", default=["en"])
+    parser.add_argument("--lang-group", action="append",
+                        help="comma-separated languages of one reader, e.g. ch_sim,en; repeat for several "
+                             "groups and each image is OCR'd with the group matching its script "
+                             "(the first group is used to detect it)")
+    parser.add_argument("--reader-memory-mb", type=float,
+                        help="with --lang-group, evict idle readers beyond this much model memory per process")
+    parser.add_argument("--preprocess", action="store_true", help="run the Preprocessor before OCR")
+    parser.add_argument("--two-phase", action="store_true",
+                        help="fast low-resolution pass, full resolution only for numbers and low-confidence text")
+    parser.add_argument("--strip-height", type=int,
+                        help="OCR images taller than this in overlapping strips (bounded memory for long receipts)")
+    parser.add_argument("--merchants", help="known merchants as merchant_id,name rows, for merchant resolution")
+    parser.add_argument("--include-lines", action="store_true", help="keep grouped line boxes and raw OCR boxes in the output")
+    args = parser.parse_args(argv)
+
+    if not args.inputs and not args.file_list:
+        parser.error("give at least one input path or --file-list")
+    try:
+        check_strip_settings(args.strip_height, STRIP_OVERLAP)
+    except ValueError as e:
+        parser.error(str(e))
+
+    try:
+        return run(args)
+    except KeyboardInterrupt:
+        sys.stderr.write("Interrupted; re-run the same command to resume.\n")
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,410 @@
+"""
+Speed and accuracy benchmark for the receipt pipeline.
+
+Runs a ground-truth corpus (see create_sample_receipt.py) through each
+stage and reports images/sec, p50/p95 latency and peak memory per stage,
+plus field-level accuracy of the parsed result.
+
+    python benchmark.py --generate 50 --seed 1          # real EasyOCR
+    python benchmark.py --corpus bench_corpus --mock-reader
+
+With --mock-reader the OCR stage is replaced by the boxes recorded in the
+ground truth, so grouping and parsing can be measured without model weights.
+
+    python benchmark.py --startup --startup-budget-ms 1500
+
+--startup measures import + ReceiptScanner() time in fresh interpreters and
+fails if it exceeds the budget or if easyocr/torch got imported eagerly.
+
+    python benchmark.py --generate 200 --seed 1 --near-duplicates 300000
+
+--near-duplicates reports how far apart the corpus receipts hash, how many
+re-encoded copies are found, and NearDuplicateIndex lookup time at that many
+entries built from the corpus hashes.
+"""
+import argparse
+import glob
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+
+import numpy as np
+
+from create_sample_receipt import generate_corpus
+from image_io import decode_image
+from line_grouper import group_lines
+from receipt_parser import ReceiptParser
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SCALAR_FIELDS = ["merchant", "date", "subtotal", "tax", "total"]
+
+
+def load_corpus(corpus_dir):
+    """Returns [(image_path, truth_dict)] for every ground-truth JSON in corpus_dir."""
+    corpus = []
+    for json_path in sorted(glob.glob(os.path.join(corpus_dir, "*.json"))):
+        with open(json_path, "r", encoding="utf-8") as f:
+            truth = json.load(f)
+        image_path = os.path.join(corpus_dir, truth["image"])
+        if os.path.exists(image_path):
+            corpus.append((image_path, truth))
+    return corpus
+
+
+def field_accuracy(result, truth):
+    """Per-field exact matches and item precision/recall for one receipt."""
+    scores = {}
+    for field in SCALAR_FIELDS:
+        expected = truth.get(field)
+        actual = result.get(field)
+        scores[field] = actual is not None and str(actual).strip().upper() == str(expected).strip().upper()
+
+    expected_items = Counter((i["name"].strip().upper(), i["price"]) for i in truth.get("items", []))
+    actual_items = Counter((i["name"].strip().upper(), i["price"]) for i in result.get("items", []))
+    matched = sum((expected_items & actual_items).values())
+    scores["item_precision"] = matched / sum(actual_items.values()) if actual_items else float(not expected_items)
+    scores["item_recall"] = matched / sum(expected_items.values()) if expected_items else 1.0
+    return scores
+
+
+def summarize_durations(durations):
+    arr = np.asarray(durations, dtype=np.float64)
+    total = arr.sum()
+    return {
+        "count": len(arr),
+        "images_per_sec": len(arr) / total if total > 0 else float("inf"),
+        "p50_ms": float(np.percentile(arr, 50) * 1000),
+        "p95_ms": float(np.percentile(arr, 95) * 1000),
+        "mean_ms": float(arr.mean() * 1000),
+    }
+
+
+class Pipeline:
+    """The scan stages, run one at a time so each can be timed."""
+
+    def __init__(self, mock_reader=False, preprocess=False, lang=("en",), line_threshold=0.6, deskew_lines=True):
+        self.mock_reader = mock_reader
+        self.line_threshold = line_threshold
+        self.deskew_lines = deskew_lines
+        self.parser = ReceiptParser()
+        self.preprocessor = None
+        self.reader = None
+        if preprocess and not mock_reader:
+            from preprocess import Preprocessor
+            self.preprocessor = Preprocessor(deskew=True)
+        if not mock_reader:
+            import easyocr
+            self.reader = easyocr.Reader(list(lang))
+
+    def stages(self):
+        names = []
+        if not self.mock_reader:
+            names.append("decode")
+            if self.preprocessor:
+                names.append("preprocess")
+            names.append("ocr")
+        return names + ["group", "parse"]
+
+    def run_stage(self, name, value, truth):
+        if name == "decode":
+            return decode_image(value)
+        if name == "preprocess":
+            return self.preprocessor.process(value)[0]
+        if name == "ocr":
+            return self.reader.readtext(value)
+        if name == "group":
+            if self.mock_reader:
+                # Recorded boxes stand in for readtext output
+                value = [(bbox, text, prob) for bbox, text, prob in truth["boxes"]]
+            return group_lines(value, threshold_ratio=self.line_threshold, deskew=self.deskew_lines)
+        if name == "parse":
+            return self.parser.parse([line.text for line in value])
+        raise ValueError(name)
+
+    def run(self, image_path, truth, on_stage=None):
+        value = image_path
+        for name in self.stages():
+            if on_stage:
+                value = on_stage(name, lambda: self.run_stage(name, value, truth))
+            else:
+                value = self.run_stage(name, value, truth)
+        return value
+
+
+def run_benchmark(corpus, pipeline, repeat=1, measure_memory=True):
+    stages = pipeline.stages()
+    durations = {name: [] for name in stages}
+    end_to_end = []
+    accuracy = []
+
+    def timed(name, fn):
+        t = time.perf_counter()
+        out = fn()
+        durations[name].append(time.perf_counter() - t)
+        return out
+
+    for run in range(repeat):
+        for image_path, truth in corpus:
+            t = time.perf_counter()
+            result = pipeline.run(image_path, truth, timed)
+            end_to_end.append(time.perf_counter() - t)
+            if run == 0:
+                accuracy.append(field_accuracy(result, truth))
+
+    report = {
+        "images": len(corpus),
+        "repeat": repeat,
+        "mock_reader": pipeline.mock_reader,
+        "stages": {name: summarize_durations(d) for name, d in durations.items() if d},
+        "end_to_end": summarize_durations(end_to_end) if end_to_end else None,
+        "accuracy": {
+            key: float(np.mean([a[key] for a in accuracy])) for key in (accuracy[0] if accuracy else {})
+        },
+    }
+
+    if measure_memory and corpus:
+        # Separate pass: tracemalloc slows Python code down and would skew the timings.
+        # It only sees Python-level allocations (not torch/OpenCV buffers); max_rss covers those.
+        peaks = {name: 0 for name in stages}
+
+        def traced(name, fn):
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            out = fn()
+            peaks[name] = max(peaks[name], tracemalloc.get_traced_memory()[1] - before)
+            return out
+
+        tracemalloc.start()
+        try:
+            for image_path, truth in corpus:
+                pipeline.run(image_path, truth, traced)
+        finally:
+            tracemalloc.stop()
+        for name, peak in peaks.items():
+            report["stages"][name]["peak_mem_kb"] = peak / 1024
+
+    if resource is not None:
+        report["max_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return report
+
+
+def _reencoded(img_array, scale=1.0, quality=80):
+    """img_array resized by scale and round-tripped through JPEG, as a messaging app would."""
+    from PIL import Image
+    img = Image.fromarray(img_array)
+    if scale != 1.0:
+        img = img.resize((round(img.width * scale), round(img.height * scale)), Image.Resampling.LANCZOS)
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=quality)
+    return decode_image(buf.getvalue())
+
+
+def benchmark_near_duplicates(corpus, entries=300_000, max_distance=8, queries=200, seed=0):
+    """
+    Hash separation on the corpus, and NearDuplicateIndex load/lookup time at
+    `entries` hashes.
+
+    Real receipt hashes share most of their layout bits, so the lookup tables
+    have a few large buckets where uniform random hashes would leave them nearly
+    empty. The synthetic entries keep that skew: each of their table keys is
+    taken from a randomly chosen corpus hash.
+    """
+    from near_duplicates import CHUNK_BITS, CHUNK_ORDER, CHUNKS, HASH_BITS, RECORD, NearDuplicateIndex, phash
+
+    def distance(a, b):
+        return int(np.unpackbits(np.frombuffer(a, np.uint8) ^ np.frombuffer(b, np.uint8)).sum())
+
+    images = [decode_image(path) for path, _ in corpus]
+    hashes = [phash(img) for img in images]
+    pairs = np.array([distance(a, b) for i, a in enumerate(hashes) for b in hashes[i + 1:]])
+    copies = {
+        name: np.array([distance(h, phash(_reencoded(img, scale))) for h, img in zip(hashes, images)])
+        for name, scale in (("jpeg80", 1.0), ("half_jpeg80", 0.5))
+    }
+    report = {
+        "images": len(corpus),
+        "max_distance": max_distance,
+        "distinct_pairs": len(pairs),
+        "distinct_min": int(pairs.min()) if len(pairs) else None,
+        "distinct_p1": float(np.percentile(pairs, 1)) if len(pairs) else None,
+        "false_matches": int((pairs <= max_distance).sum()),
+        "copies_found": {name: float((d <= max_distance).mean()) for name, d in copies.items()},
+    }
+
+    rng = np.random.default_rng(seed)
+    bits = np.unpackbits(np.frombuffer(b"".join(hashes), np.uint8).reshape(len(hashes), -1), axis=1)[:, CHUNK_ORDER]
+    chunks = bits.reshape(len(hashes), CHUNKS, CHUNK_BITS)
+    picks = rng.integers(0, len(hashes), size=(entries, CHUNKS))
+    synthetic = np.empty((entries, HASH_BITS), dtype=np.uint8)
+    synthetic[:, CHUNK_ORDER] = chunks[picks, np.arange(CHUNKS)].reshape(entries, HASH_BITS)
+    synthetic = np.packbits(synthetic, axis=1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index.phash")
+        with open(path, "wb") as f:
+            for row in synthetic:
+                f.write(RECORD.pack(row.tobytes(), bytes(32)))
+        t = time.perf_counter()
+        index = NearDuplicateIndex(path, max_distance=max_distance)
+        report["entries"] = len(index)
+        report["load_ms"] = (time.perf_counter() - t) * 1000
+
+    # Half the queries are stored entries with a few bits flipped (hits), half corpus hashes (mostly misses)
+    durations = []
+    hits = 0
+    for i in range(queries):
+        if i % 2:
+            query = np.unpackbits(synthetic[rng.integers(entries)])
+            query[rng.choice(HASH_BITS, size=max_distance // 2, replace=False)] ^= 1
+            query = np.packbits(query).tobytes()
+        else:
+            query = hashes[i // 2 % len(hashes)]
+        t = time.perf_counter()
+        hits += index.find(query) is not None
+        durations.append(time.perf_counter() - t)
+    report["lookup"] = summarize_durations(durations)
+    report["lookup_hits"] = hits
+    return report
+
+
+def print_near_duplicate_report(report):
+    print(f"{report['images']} images, {report['distinct_pairs']} distinct pairs, max_distance {report['max_distance']}")
+    print(f"  distinct pairs: min {report['distinct_min']} bits, p1 {report['distinct_p1']:.0f} bits, "
+          f"{report['false_matches']} within max_distance")
+    for name, rate in report["copies_found"].items():
+        print(f"  {name} copies found: {rate:.1%}")
+    lookup = report["lookup"]
+    print(f"index of {report['entries']} hashes: load {report['load_ms']:.0f} ms, "
+          f"lookup p50 {lookup['p50_ms']:.2f} ms, p95 {lookup['p95_ms']:.2f} ms ({report['lookup_hits']} hits)")
+
+
+STARTUP_SNIPPET = """
+import json, sys, time
+t0 = time.perf_counter()
+import ocr_demo
+t1 = time.perf_counter()
+scanner = ocr_demo.ReceiptScanner()
+t2 = time.perf_counter()
+result = {
+    "import_ms": (t1 - t0) * 1000,
+    "construct_ms": (t2 - t1) * 1000,
+    "eager_modules": [m for m in ("easyocr", "torch") if m in sys.modules],
+}
+if "--ready" in sys.argv:
+    scanner.warm_up(background=True)
+    scanner.wait_ready()
+    result["ready_ms"] = (time.perf_counter() - t2) * 1000
+print(json.dumps(result))
+"""
+
+
+def measure_startup(repeat=3, until_ready=False):
+    """
+    Startup cost of the scanner in fresh interpreters (so import caches don't hide it).
+    Returns the median of each measurement over `repeat` runs.
+    """
+    runs = []
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    for _ in range(repeat):
+        cmd = [sys.executable, "-c", STARTUP_SNIPPET] + (["--ready"] if until_ready else [])
+        out = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True, check=True).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+    report = {key: float(np.median([r[key] for r in runs])) for key in runs[0] if key.endswith("_ms")}
+    report["startup_ms"] = report["import_ms"] + report["construct_ms"]
+    report["eager_modules"] = sorted({m for r in runs for m in r["eager_modules"]})
+    return report
+
+
+def print_report(report):
+    mode = "mock reader" if report["mock_reader"] else "EasyOCR"
+    print(f"{report['images']} images x {report['repeat']} ({mode})")
+    print(f"{'stage':<12}{'img/s':>12}{'p50 ms':>10}{'p95 ms':>10}{'peak KB':>10}")
+    rows = list(report["stages"].items())
+    if report["end_to_end"]:
+        rows.append(("end-to-end", report["end_to_end"]))
+    for name, s in rows:
+        peak = s.get("peak_mem_kb")
+        peak_str = f"{peak:>10.0f}" if peak is not None else f"{'':>10}"
+        print(f"{name:<12}{s['images_per_sec']:>12.1f}{s['p50_ms']:>10.2f}{s['p95_ms']:>10.2f}{peak_str}")
+    print("\naccuracy:")
+    for key, value in report["accuracy"].items():
+        print(f"  {key:<16}{value:>7.1%}")
+    if "max_rss_kb" in report:
+        print(f"\nmax RSS: {report['max_rss_kb'] / 1024:.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark OCR, line grouping and parsing against ground truth.")
+    parser.add_argument("--corpus", help="directory with sample_receipt_*.png/.json (see create_sample_receipt.py)")
+    parser.add_argument("--generate", type=int, default=0, help="generate this many receipts first")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mock-reader", action="store_true", help="use recorded boxes instead of EasyOCR")
+    parser.add_argument("--preprocess", action="store_true", help="run the Preprocessor before OCR")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--startup", action="store_true", help="measure import/constructor time instead")
+    parser.add_argument("--startup-ready", action="store_true", help="with --startup, also time model warm-up")
+    parser.add_argument("--startup-budget-ms", type=float, help="with --startup, fail above this import+construct time")
+    parser.add_argument("--near-duplicates", type=int, metavar="ENTRIES",
+                        help="benchmark perceptual-hash separation on the corpus and index lookups at ENTRIES hashes")
+    args = parser.parse_args()
+
+    if args.startup:
+        report = measure_startup(repeat=max(args.repeat, 3), until_ready=args.startup_ready)
+        for key, value in report.items():
+            print(f"{key:<16}{value if isinstance(value, list) else f'{value:.1f}'}")
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        failed = False
+        if report["eager_modules"]:
+            print(f"REGRESSION: {', '.join(report['eager_modules'])} imported before first use", file=sys.stderr)
+            failed = True
+        if args.startup_budget_ms and report["startup_ms"] > args.startup_budget_ms:
+            print(f"REGRESSION: startup {report['startup_ms']:.0f} ms > budget {args.startup_budget_ms:.0f} ms",
+                  file=sys.stderr)
+            failed = True
+        sys.exit(1 if failed else 0)
+
+    corpus_dir = args.corpus
+    if args.generate:
+        corpus_dir = corpus_dir or tempfile.mkdtemp(prefix="receipt_corpus_")
+        generate_corpus(corpus_dir, args.generate, args.seed)
+    if not corpus_dir:
+        parser.error("pass --corpus and/or --generate")
+
+    corpus = load_corpus(corpus_dir)
+    if not corpus:
+        parser.error(f"no ground-truth receipts found in {corpus_dir}")
+
+    if args.near_duplicates:
+        report = benchmark_near_duplicates(corpus, entries=args.near_duplicates, seed=args.seed)
+        print_near_duplicate_report(report)
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        return
+
+    pipeline = Pipeline(mock_reader=args.mock_reader, preprocess=args.preprocess)
+    report = run_benchmark(corpus, pipeline, repeat=args.repeat, measure_memory=not args.no_memory)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
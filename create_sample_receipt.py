@@ -1,29 +1,42 @@
 from PIL import Image, ImageDraw, ImageFont
+import argparse
+import json
+import math
 import random
 import os
 
-def create_receipt(index):
-    # Data Pools
-    merchants = ["GROCERY STORE", "TECH HAVEN", "CITY BOOKS", "COFFEE SPOT", "BURGER JOINT"]
-    addresses = ["123 Main St", "456 Oak Ave", "789 Pine Rd", "321 Elm St", "654 Maple Dr"]
-    dates = ["01/15/2026", "02/08/2026", "03/22/2026", "12/05/2025", "11/11/2025"]
-    
-    all_items = [
-        ("Milk", 3.50), ("Eggs", 2.99), ("Bread", 4.25), ("Apples", 5.10), ("Chicken", 12.50),
-        ("USB Cable", 8.99), ("Mouse", 15.50), ("Keyboard", 25.00), ("Monitor", 150.00),
-        ("Novel", 12.99), ("Magazine", 5.99), ("Notebook", 3.50), ("Pen", 1.50),
-        ("Latte", 4.50), ("Muffin", 3.00), ("Sandwich", 8.50), ("Tea", 3.00),
-        ("Burger", 9.99), ("Fries", 3.99), ("Soda", 2.50), ("Shake", 4.50)
-    ]
+# Data Pools
+MERCHANTS = ["GROCERY STORE", "TECH HAVEN", "CITY BOOKS", "COFFEE SPOT", "BURGER JOINT"]
+ADDRESSES = ["123 Main St", "456 Oak Ave", "789 Pine Rd", "321 Elm St", "654 Maple Dr"]
+DATES = ["01/15/2026", "02/08/2026", "03/22/2026", "12/05/2025", "11/11/2025"]
+
+ALL_ITEMS = [
+    ("Milk", 3.50), ("Eggs", 2.99), ("Bread", 4.25), ("Apples", 5.10), ("Chicken", 12.50),
+    ("USB Cable", 8.99), ("Mouse", 15.50), ("Keyboard", 25.00), ("Monitor", 150.00),
+    ("Novel", 12.99), ("Magazine", 5.99), ("Notebook", 3.50), ("Pen", 1.50),
+    ("Latte", 4.50), ("Muffin", 3.00), ("Sandwich", 8.50), ("Tea", 3.00),
+    ("Burger", 9.99), ("Fries", 3.99), ("Soda", 2.50), ("Shake", 4.50)
+]
+
+def create_receipt(index, rng=None, out_dir="."):
+    """
+    Draws one receipt and writes sample_receipt_<index>.png plus a
+    sample_receipt_<index>.json ground truth next to it.
+    The ground truth holds the expected parsed fields and the box of every
+    text run drawn (in final image coordinates), which benchmark.py uses
+    to stand in for the OCR reader.
+    Returns the image path.
+    """
+    rng = rng or random.Random()
 
     # Random Selections
-    merchant = random.choice(merchants)
-    address = random.choice(addresses)
-    date = random.choice(dates)
-    
+    merchant = rng.choice(MERCHANTS)
+    address = rng.choice(ADDRESSES)
+    date = rng.choice(DATES)
+
     # Select 3-6 random items
-    num_items = random.randint(3, 6)
-    selected_items = random.sample(all_items, num_items)
+    num_items = rng.randint(3, 6)
+    selected_items = rng.sample(ALL_ITEMS, num_items)
 
     # Create Image
     width = 400
@@ -39,48 +52,105 @@ def create_receipt(index):
         font = ImageFont.load_default()
         header_font = ImageFont.load_default()
 
+    boxes = []
+
+    def text(xy, value, fnt):
+        draw.text(xy, value, font=fnt, fill='black')
+        boxes.append((draw.textbbox(xy, value, font=fnt), value))
+
     # Draw Header
-    draw.text((50, 20), merchant, font=header_font, fill='black')
-    draw.text((100, 60), address, font=font, fill='black')
-    draw.text((100, 90), "Anytown, USA", font=font, fill='black')
-    draw.text((100, 110), f"Date: {date}", font=font, fill='black')
-    draw.text((20, 140), "-"*40, font=font, fill='black')
+    text((50, 20), merchant, header_font)
+    text((100, 60), address, font)
+    text((100, 90), "Anytown, USA", font)
+    text((100, 110), f"Date: {date}", font)
+    text((20, 140), "-"*40, font)
 
     # Draw Items
     y = 170
-    subtotal_val = 0.0
-    
+    # Amounts are kept in cents, as a till does: the tax is rounded once and
+    # the printed total is exactly subtotal + tax
+    subtotal_cents = 0
+
     for item_name, price in selected_items:
-        draw.text((30, y), item_name, font=font, fill='black')
-        draw.text((300, y), f"{price:.2f}", font=font, fill='black')
-        subtotal_val += price
+        text((30, y), item_name, font)
+        text((300, y), f"{price:.2f}", font)
+        subtotal_cents += round(price * 100)
         y += 30
 
-    draw.text((20, y), "-"*40, font=font, fill='black')
+    text((20, y), "-"*40, font)
     y += 30
-    
-    tax_val = subtotal_val * 0.1
-    total_val = subtotal_val + tax_val
 
-    draw.text((30, y), "Subtotal", font=font, fill='black')
-    draw.text((300, y), f"{subtotal_val:.2f}", font=font, fill='black')
+    tax_cents = (subtotal_cents + 5) // 10  # 10%, half up
+    total_cents = subtotal_cents + tax_cents
+
+    text((30, y), "Subtotal", font)
+    text((300, y), _amount(subtotal_cents), font)
     y += 30
-    draw.text((30, y), "Tax (10%)", font=font, fill='black')
-    draw.text((300, y), f"{tax_val:.2f}", font=font, fill='black')
+    text((30, y), "Tax (10%)", font)
+    text((300, y), _amount(tax_cents), font)
     y += 30
-    draw.text((30, y), "TOTAL", font=header_font, fill='black')
-    draw.text((300, y), f"{total_val:.2f}", font=header_font, fill='black')
-    
+    text((30, y), "TOTAL", header_font)
+    text((300, y), _amount(total_cents), header_font)
+
     y += 60
-    draw.text((80, y), "Thank you for shopping!", font=font, fill='black')
+    text((80, y), "Thank you for shopping!", font)
 
     # Rotation/Noise
-    image = image.rotate(random.uniform(-1, 1), expand=True, fillcolor='white')
+    angle = rng.uniform(-1, 1)
+    image = image.rotate(angle, expand=True, fillcolor='white')
 
-    filename = f"sample_receipt_{index}.png"
+    filename = os.path.join(out_dir, f"sample_receipt_{index}.png")
     image.save(filename)
+
+    truth = {
+        "image": os.path.basename(filename),
+        "merchant": merchant,
+        "date": date,
+        "subtotal": _amount(subtotal_cents),
+        "tax": _amount(tax_cents),
+        "total": _amount(total_cents),
+        # The parser reports the tax line as an item too
+        "items": [{"name": name, "price": f"{price:.2f}"} for name, price in selected_items]
+                 + [{"name": "Tax (10%)", "price": _amount(tax_cents)}],
+        "angle": angle,
+        # readtext-style (bbox, text, prob) entries
+        "boxes": [
+            [_rotate_box(bbox, angle, (width, height), image.size), value, 1.0]
+            for bbox, value in boxes
+        ],
+    }
+    with open(os.path.splitext(filename)[0] + ".json", "w", encoding="utf-8") as f:
+        json.dump(truth, f, indent=2)
+
     print(f"Created {filename}")
+    return filename
+
+def _amount(cents):
+    return f"{cents // 100}.{cents % 100:02d}"
+
+def _rotate_box(bbox, angle, old_size, new_size):
+    """Maps an axis-aligned (l, t, r, b) box through Image.rotate(angle, expand=True)."""
+    l, t, r, b = bbox
+    cx, cy = old_size[0] / 2, old_size[1] / 2
+    ncx, ncy = new_size[0] / 2, new_size[1] / 2
+    a = math.radians(angle)
+    cos_a, sin_a = math.cos(a), math.sin(a)
+    quad = []
+    for x, y in ((l, t), (r, t), (r, b), (l, b)):
+        dx, dy = x - cx, y - cy
+        quad.append([round(ncx + dx * cos_a + dy * sin_a, 1), round(ncy - dx * sin_a + dy * cos_a, 1)])
+    return quad
+
+def generate_corpus(out_dir=".", count=10, seed=0):
+    """Creates count receipts (1-based names) in out_dir. Same seed, same corpus."""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    return [create_receipt(i, rng, out_dir) for i in range(1, count + 1)]
 
 if __name__ == "__main__":
-    for i in range(1, 11):
-        create_receipt(i)
+    parser = argparse.ArgumentParser(description="Generate sample receipts with ground-truth JSON.")
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out-dir", default=".")
+    args = parser.parse_args()
+    generate_corpus(args.out_dir, args.count, args.seed)
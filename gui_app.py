@@ -1,10 +1,22 @@
 import tkinter as tk
-from tkinter import filedialog, messagebox, scrolledtext
-from PIL import Image, ImageTk
-import threading
+from tkinter import filedialog, messagebox, scrolledtext, ttk
+from PIL import ImageTk
 import os
 import csv
+import queue
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from ocr_demo import ReceiptScanner
+from preprocess import Preprocessor
+from preview import Preview, PreviewCache, PreviewLoader
+
+# Scans run on a fixed pool sharing one OCR model; more threads than this
+# only compete for the CPU
+SCAN_WORKERS = 2
+# Files handed to the pool at once; the rest wait in the queue
+MAX_IN_FLIGHT = SCAN_WORKERS * 2
+IMAGE_FILETYPES = [("Image Files", "*.png;*.jpg;*.jpeg;*.bmp")]
+PREVIEW_SIZE = (400, 600)
 
 class ReceiptApp:
     def __init__(self, root):
@@ -12,18 +24,45 @@ class ReceiptApp:
         self.root.title("Receipt Scanner")
         self.root.geometry("900x700")
         
-        # Initialize Scanner
-        try:
-            self.scanner = ReceiptScanner()
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to initialize OCR Engine:\n{e}")
-            self.root.destroy()
-            return
+        # Initialize Scanner; the OCR model loads in the background
+        # so the window appears right away
+        self.scanner = ReceiptScanner(preprocessor=Preprocessor(deskew=True))
+        self.scanner.warm_up(background=True)
 
         self.current_image_path = None
+        # Preview of the selected file; its decoded buffer is reused by the scan
+        self.current_image = None
         self.scan_results = None
 
+        # Previews decode on a background thread at reduced scale; thumbnails
+        # are cached by content, so revisiting a file in the list is instant
+        self.previews = PreviewLoader(PreviewCache(max_entries=64), max_size=PREVIEW_SIZE)
+        self._preview_future = None
+
+        # Scan queue: jobs[i] holds path, status and result for row i of the file list
+        self.pool = ThreadPoolExecutor(max_workers=SCAN_WORKERS)
+        self.jobs = []
+        self.waiting = deque()
+        self.in_flight = {}
+        # Worker threads report here; only the Tk thread touches widgets
+        self.events = queue.Queue()
+        self.single_job = None
+        self._polling = False
+
         self._setup_ui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        self.status_var.set("Loading OCR engine...")
+        self.root.after(250, self._poll_scanner_ready)
+
+    def _poll_scanner_ready(self):
+        status = self.scanner.status
+        if status == "loading":
+            self.root.after(250, self._poll_scanner_ready)
+        elif status == "failed":
+            self.status_var.set("OCR engine failed to load")
+            messagebox.showerror("Error", f"Failed to initialize OCR Engine:\n{self.scanner.load_error}")
+        elif status == "ready" and self.status_var.get() == "Loading OCR engine...":
+            self.status_var.set("Ready")
 
     def _setup_ui(self):
         # Left Frame: Image
@@ -49,6 +88,28 @@ class ReceiptApp:
         self.btn_scan = tk.Button(btn_frame, text="Scan Receipt", command=self.start_scan, height=2, bg="#4CAF50", fg="white", state=tk.DISABLED)
         self.btn_scan.pack(fill=tk.X, pady=2)
 
+        btn_batch = tk.Button(btn_frame, text="Scan Multiple Receipts...", command=self.load_images)
+        btn_batch.pack(fill=tk.X, pady=2)
+
+        # Scan Queue
+        queue_frame = tk.Frame(right_frame)
+        queue_frame.pack(fill=tk.X, pady=5)
+
+        self.progress = ttk.Progressbar(queue_frame, mode="determinate")
+        self.progress.pack(fill=tk.X, pady=2)
+
+        self.btn_cancel = tk.Button(queue_frame, text="Cancel Remaining", command=self.cancel_scans, state=tk.DISABLED)
+        self.btn_cancel.pack(anchor=tk.E, pady=2)
+
+        self.tree = ttk.Treeview(queue_frame, columns=("file", "status", "total"), show="headings", height=6)
+        self.tree.heading("file", text="File")
+        self.tree.heading("status", text="Status")
+        self.tree.heading("total", text="Total")
+        self.tree.column("status", width=80, stretch=False)
+        self.tree.column("total", width=80, stretch=False, anchor=tk.E)
+        self.tree.pack(fill=tk.X)
+        self.tree.bind("<<TreeviewSelect>>", self.on_select_job)
+
         # Results Area
         tk.Label(right_frame, text="Extracted Data:", font=("Arial", 12, "bold")).pack(anchor=tk.W, pady=(20, 5))
         
@@ -68,54 +129,195 @@ class ReceiptApp:
     def load_image(self):
         file_path = filedialog.askopenfilename(
             title="Select Receipt Image",
-            filetypes=[("Image Files", "*.png;*.jpg;*.jpeg;*.bmp")]
+            filetypes=IMAGE_FILETYPES
         )
         
         if not file_path:
             return
 
         self.current_image_path = file_path
+        self.current_image = None
         self.status_var.set(f"Loaded: {os.path.basename(file_path)}")
         self.btn_scan.config(state=tk.NORMAL)
         self.scan_results = None
-        self.btn_export.config(state=tk.DISABLED)
         self.txt_results.delete(1.0, tk.END)
 
-        # Display Image (Resize to fit)
+        self.show_preview(file_path, keep=True)
+
+    def show_preview(self, path, keep=False):
+        """
+        Decodes a preview of path off the Tk thread and shows it when ready.
+        keep: hold on to the Preview so a scan of this file reuses its buffer
+        """
+        future = self.previews.request(path)
+        self._preview_future = future
+        self.lbl_image.config(image="", text="Loading preview...")
+        self.root.after(30, self._poll_preview, future, keep)
+
+    def _poll_preview(self, future, keep):
+        if future is not self._preview_future:
+            return  # another file was selected meanwhile
+        if not future.done():
+            self.root.after(30, self._poll_preview, future, keep)
+            return
+        self._preview_future = None
         try:
-            img = Image.open(file_path)
-            # Calculate resize ratio to fit in 400x600 box (approx)
-            img.thumbnail((400, 600))
-            self.tk_img = ImageTk.PhotoImage(img)
-            self.lbl_image.config(image=self.tk_img, text="")
+            preview = future.result()
         except Exception as e:
+            self.lbl_image.config(image="", text="No preview")
             messagebox.showerror("Error", f"Failed to load image: {e}")
+            return
+        if keep:
+            self.current_image = preview
+        # PhotoImage must be created on the Tk thread; the thumbnail is small
+        self.tk_img = ImageTk.PhotoImage(preview.thumbnail)
+        self.lbl_image.config(image=self.tk_img, text="")
+
+    def load_images(self):
+        paths = filedialog.askopenfilenames(title="Select Receipt Images", filetypes=IMAGE_FILETYPES)
+        if paths:
+            self.enqueue(paths)
 
     def start_scan(self):
         if not self.current_image_path:
             return
 
         self.btn_scan.config(state=tk.DISABLED, text="Scanning... Please Wait")
-        self.status_var.set("Scanning... (This may take a moment)")
-        self.root.update()
+        self.single_job = self.enqueue([self.current_image_path], self.current_image)
+
+    def enqueue(self, paths, image=None):
+        """Adds files to the scan queue. Returns the index of the last job."""
+        for path in paths:
+            index = len(self.jobs)
+            self.jobs.append({"path": path, "image": image, "status": "queued", "result": None})
+            self.tree.insert("", tk.END, iid=str(index), values=(os.path.basename(path), "queued", ""))
+            self.waiting.append(index)
 
-        # Run in separate thread to keep UI responsive
-        thread = threading.Thread(target=self.run_ocr)
-        thread.start()
+        self.btn_cancel.config(state=tk.NORMAL)
+        if self.scanner.status != "ready":
+            self.status_var.set("Waiting for OCR engine to finish loading...")
+        self._fill_pool()
+        self._update_progress()
+        if not self._polling:
+            self._polling = True
+            self.root.after(100, self._poll_events)
+        return len(self.jobs) - 1
 
-    def run_ocr(self):
+    def _fill_pool(self):
+        # Only a few jobs are submitted at a time, so cancelling is instant
+        # and queued files don't pile up in the executor
+        while self.waiting and len(self.in_flight) < MAX_IN_FLIGHT:
+            index = self.waiting.popleft()
+            job = self.jobs[index]
+            image = job["image"] if job["image"] is not None else job["path"]
+            job["image"] = None
+            self.in_flight[index] = self.pool.submit(self.run_ocr, index, image)
+
+    def run_ocr(self, index, image):
+        # Runs on a pool thread
+        self.events.put(("scanning", index, None))
         try:
-            results = self.scanner.scan(self.current_image_path)
-            # Schedule UI update on main thread
-            self.root.after(0, self.display_results, results)
+            if isinstance(image, Preview):
+                # Full-resolution pixels, decoded once with the preview or now
+                image = image.array()
+            self.events.put(("done", index, self.scanner.scan(image)))
         except Exception as e:
-            self.root.after(0, lambda: messagebox.showerror("Scanning Error", str(e)))
-            self.root.after(0, self.reset_scan_button)
+            self.events.put(("error", index, {"error": str(e)}))
+
+    def _poll_events(self):
+        while True:
+            try:
+                kind, index, result = self.events.get_nowait()
+            except queue.Empty:
+                break
+            job = self.jobs[index]
+            if job["status"] == "cancelled":
+                continue
+            if kind == "scanning":
+                self._set_job_status(index, "scanning")
+                continue
+
+            self.in_flight.pop(index, None)
+            job["result"] = result
+            if "error" in result:
+                self._set_job_status(index, "error")
+            else:
+                self._set_job_status(index, "done", result.get('total') or "")
+            self._show_job(index)
+
+        self._fill_pool()
+        self._update_progress()
+        if self.in_flight or self.waiting:
+            self.root.after(100, self._poll_events)
+        else:
+            self._polling = False
+            self.btn_cancel.config(state=tk.DISABLED)
+
+    def _set_job_status(self, index, status, total=""):
+        self.jobs[index]["status"] = status
+        self.tree.set(str(index), "status", status)
+        if total:
+            self.tree.set(str(index), "total", total)
+
+    def _show_job(self, index):
+        """Shows a finished job's result, unless the user is looking at another row."""
+        if index == self.single_job:
+            self.single_job = None
+            self.reset_scan_button()
+        selection = self.tree.selection()
+        if selection and selection != (str(index),):
+            return
+        result = self.jobs[index]["result"]
+        if "error" in result:
+            self.status_var.set(f"{os.path.basename(self.jobs[index]['path'])}: {result['error']}")
+        else:
+            self.display_results(result)
+
+    def on_select_job(self, event=None):
+        selection = self.tree.selection()
+        if not selection:
+            return
+        self.show_preview(self.jobs[int(selection[0])]["path"])
+        if self.jobs[int(selection[0])]["result"] is not None:
+            self._show_job(int(selection[0]))
+
+    def _update_progress(self):
+        finished = sum(1 for job in self.jobs if job["status"] in ("done", "error", "cancelled"))
+        self.progress.config(maximum=max(len(self.jobs), 1), value=finished)
+        if self.jobs and (self.in_flight or self.waiting):
+            self.status_var.set(f"Scanned {finished} of {len(self.jobs)}...")
+        elif self.jobs and len(self.jobs) > 1:
+            errors = sum(1 for job in self.jobs if job["status"] == "error")
+            self.status_var.set(f"Finished {finished} receipts ({errors} errors)")
+
+    def cancel_scans(self):
+        # Scans already running finish, but their results are dropped
+        for index in list(self.waiting) + list(self.in_flight):
+            future = self.in_flight.pop(index, None)
+            if future is not None:
+                future.cancel()
+            self.jobs[index]["image"] = None
+            self._set_job_status(index, "cancelled")
+        self.waiting.clear()
+        if self.single_job is not None:
+            self.single_job = None
+            self.reset_scan_button()
+        self._update_progress()
+        self.btn_cancel.config(state=tk.DISABLED)
+
+    def on_close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.previews.shutdown()
+        self.root.destroy()
 
     def display_results(self, results):
         self.scan_results = results
         self.reset_scan_button()
-        self.status_var.set("Scan Complete")
+        meta = results.get('meta', {})
+        if 'total_ms' in meta:
+            self.status_var.set(f"Scan Complete ({meta['total_ms'] / 1000:.2f} s)")
+        else:
+            self.status_var.set("Scan Complete")
         self.btn_export.config(state=tk.NORMAL)
 
         # Format output
@@ -127,6 +329,12 @@ class ReceiptApp:
         output.append("ITEMS:")
         for item in results.get('items', []):
             output.append(f"  {item['name']:<25} {item['price']}")
+
+        if meta.get('timings_ms'):
+            output.append("-" * 40)
+            output.append("TIMINGS:")
+            for stage, ms in meta['timings_ms'].items():
+                output.append(f"  {stage:<25} {ms:8.1f} ms")
         
         self.txt_results.delete(1.0, tk.END)
         self.txt_results.insert(tk.END, "\n".join(output))
@@ -135,7 +343,8 @@ class ReceiptApp:
         self.btn_scan.config(state=tk.NORMAL, text="Scan Receipt")
 
     def export_csv(self):
-        if not self.scan_results:
+        scanned = [job for job in self.jobs if job["status"] == "done"]
+        if not scanned:
             return
 
         file_path = filedialog.asksaveasfilename(
@@ -152,20 +361,24 @@ class ReceiptApp:
                 writer = csv.writer(f)
                 
                 # Write Header
-                writer.writerow(["Merchant", "Date", "Item Name", "Item Price"])
-                
-                merchant = self.scan_results.get('merchant')
-                date = self.scan_results.get('date')
-                
-                items = self.scan_results.get('items', [])
-                if items:
-                    for item in items:
-                        writer.writerow([merchant, date, item['name'], item['price']])
-                else:
-                    # Write separate row if no items
-                    writer.writerow([merchant, date, "", ""])
+                writer.writerow(["File", "Merchant", "Date", "Item Name", "Item Price"])
+
+                # One file for every receipt scanned this session
+                for job in scanned:
+                    results = job["result"]
+                    file_name = os.path.basename(job["path"])
+                    merchant = results.get('merchant')
+                    date = results.get('date')
+
+                    items = results.get('items', [])
+                    if items:
+                        for item in items:
+                            writer.writerow([file_name, merchant, date, item['name'], item['price']])
+                    else:
+                        # Write separate row if no items
+                        writer.writerow([file_name, merchant, date, "", ""])
             
-            messagebox.showinfo("Success", f"Data saved to {file_path}")
+            messagebox.showinfo("Success", f"{len(scanned)} receipts saved to {file_path}")
             self.status_var.set(f"Saved to {os.path.basename(file_path)}")
             
         except Exception as e:
@@ -0,0 +1,84 @@
+import io
+import os
+
+import numpy as np
+from PIL import Image
+
+
+def read_image_bytes(source):
+    """
+    Returns the encoded bytes behind an image source, or None if the
+    source is already decoded (PIL.Image / NumPy array).
+    source: file path, bytes, bytearray, memoryview or file-like object
+    """
+    if isinstance(source, (str, os.PathLike)):
+        path = os.path.abspath(source)
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        with open(path, "rb") as f:
+            return f.read()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if hasattr(source, "read"):
+        # Streamlit UploadedFile exposes getvalue(); avoids moving the cursor
+        if hasattr(source, "getvalue"):
+            return source.getvalue()
+        if hasattr(source, "seek"):
+            source.seek(0)
+        return source.read()
+    return None
+
+
+def decode_image(source):
+    """
+    Decodes an image source into an RGB uint8 NumPy array (H, W, 3),
+    the layout EasyOCR's readtext accepts directly.
+    """
+    if isinstance(source, np.ndarray):
+        return _normalize_array(source)
+
+    if isinstance(source, Image.Image):
+        img = source
+    else:
+        data = read_image_bytes(source)
+        if data is None:
+            raise ValueError(f"Unsupported image type: {type(source).__name__}")
+        img = Image.open(io.BytesIO(data))
+
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    return np.asarray(img)
+
+
+def image_fingerprint(source):
+    """Bytes that identify the image content, suitable for hashing."""
+    data = read_image_bytes(source)
+    if data is not None:
+        return data
+    arr = decode_image(source)
+    return f"{arr.shape}".encode("ascii") + arr.tobytes()
+
+
+def describe_source(source):
+    """Short label for log messages."""
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.abspath(source)
+    if isinstance(source, np.ndarray):
+        return f"array {source.shape}"
+    if isinstance(source, Image.Image):
+        return f"image {source.size}"
+    return type(source).__name__
+
+
+def _normalize_array(arr):
+    if arr.dtype != np.uint8:
+        arr = np.clip(arr, 0, 255).astype(np.uint8)
+    if arr.ndim == 2:
+        return np.stack([arr] * 3, axis=-1)
+    if arr.ndim == 3 and arr.shape[2] == 1:
+        return np.repeat(arr, 3, axis=2)
+    if arr.ndim == 3 and arr.shape[2] == 4:
+        return np.ascontiguousarray(arr[:, :, :3])
+    if arr.ndim == 3 and arr.shape[2] == 3:
+        return arr
+    raise ValueError(f"Unsupported array shape: {arr.shape}")
@@ -0,0 +1,186 @@
+import cProfile
+import io
+import json
+import logging
+import pstats
+import threading
+import time
+import tracemalloc
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ScanTrace:
+    """
+    Timings and counters for one scan.
+    Use stage() around each pipeline step and count() for sizes; finish()
+    returns the record that goes into the result metadata and the sinks.
+    """
+
+    def __init__(self, label=None, profile=False, trace_memory=False):
+        self.label = label
+        self.timings = {}
+        self.counters = {}
+        self._start = time.perf_counter()
+        self._profiler = None
+        self._started_tracemalloc = False
+
+        if profile:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        if trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracemalloc = True
+            tracemalloc.reset_peak()
+            self._memory_base = tracemalloc.get_traced_memory()[0]
+
+    @contextmanager
+    def stage(self, name):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            # Repeated stages (e.g. per strip) accumulate
+            self.timings[name] = self.timings.get(name, 0.0) + (time.perf_counter() - t) * 1000
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def finish(self):
+        record = {
+            "label": self.label,
+            "total_ms": (time.perf_counter() - self._start) * 1000,
+            "timings_ms": dict(self.timings),
+            "counters": dict(self.counters),
+        }
+        if self._profiler is not None:
+            self._profiler.disable()
+            out = io.StringIO()
+            pstats.Stats(self._profiler, stream=out).sort_stats("cumulative").print_stats(25)
+            record["profile"] = out.getvalue()
+            self._profiler = None
+        if tracemalloc.is_tracing() and hasattr(self, "_memory_base"):
+            record["peak_memory_kb"] = (tracemalloc.get_traced_memory()[1] - self._memory_base) / 1024
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+        return record
+
+
+class Instrumentation:
+    """
+    Creates a ScanTrace per scan and forwards finished records to sinks.
+    profile: run every scan under cProfile (adds the top functions to the record)
+    trace_memory: track peak Python memory per scan with tracemalloc
+    sinks: objects with emit(record), e.g. LoggingSink, JsonLinesSink, MetricsRegistry
+    """
+
+    def __init__(self, sinks=None, profile=False, trace_memory=False):
+        self.sinks = list(sinks or [])
+        self.profile = profile
+        self.trace_memory = trace_memory
+
+    def start(self, label=None):
+        return ScanTrace(label, profile=self.profile, trace_memory=self.trace_memory)
+
+    def finish(self, trace):
+        record = trace.finish()
+        self.emit(record)
+        return record
+
+    def emit(self, record):
+        """Forwards a finished record (e.g. one from a worker process) to the sinks."""
+        for sink in self.sinks:
+            try:
+                sink.emit(record)
+            except Exception:
+                # A broken sink must never fail the scan
+                logger.exception("Instrumentation sink %r failed", sink)
+
+
+class LoggingSink:
+    def __init__(self, logger_name="receipts.scan", level=logging.INFO):
+        self.logger = logging.getLogger(logger_name)
+        self.level = level
+
+    def emit(self, record):
+        stages = " ".join(f"{k}={v:.1f}ms" for k, v in record["timings_ms"].items())
+        counters = " ".join(f"{k}={v}" for k, v in record["counters"].items())
+        self.logger.log(self.level, "scan %s total=%.1fms %s %s",
+                        record.get("label"), record["total_ms"], stages, counters)
+
+
+class JsonLinesSink:
+    """Appends one JSON object per scan to a file path or open text stream."""
+
+    def __init__(self, target):
+        self._lock = threading.Lock()
+        if isinstance(target, str):
+            self._stream = open(target, "a", encoding="utf-8")
+            self._owns_stream = True
+        else:
+            self._stream = target
+            self._owns_stream = False
+
+    def emit(self, record):
+        line = json.dumps({k: v for k, v in record.items() if k != "profile"})
+        with self._lock:
+            self._stream.write(line + "\n")
+            self._stream.flush()
+
+    def close(self):
+        if self._owns_stream:
+            self._stream.close()
+
+
+class MetricsRegistry:
+    """
+    In-process aggregates: per-stage count/total/max plus p50/p95 over the
+    last `window` scans, and summed counters.
+    """
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self._window = window
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.scans = 0
+            self._stages = defaultdict(lambda: {"count": 0, "total_ms": 0.0, "max_ms": 0.0,
+                                                "recent": deque(maxlen=self._window)})
+            self._counters = defaultdict(int)
+
+    def emit(self, record):
+        with self._lock:
+            self.scans += 1
+            for name, ms in list(record["timings_ms"].items()) + [("total", record["total_ms"])]:
+                s = self._stages[name]
+                s["count"] += 1
+                s["total_ms"] += ms
+                s["max_ms"] = max(s["max_ms"], ms)
+                s["recent"].append(ms)
+            for name, value in record["counters"].items():
+                self._counters[name] += value
+
+    def snapshot(self):
+        with self._lock:
+            stages = {}
+            for name, s in self._stages.items():
+                recent = np.asarray(s["recent"]) if s["recent"] else np.zeros(1)
+                stages[name] = {
+                    "count": s["count"],
+                    "mean_ms": s["total_ms"] / s["count"] if s["count"] else 0.0,
+                    "max_ms": s["max_ms"],
+                    "p50_ms": float(np.percentile(recent, 50)),
+                    "p95_ms": float(np.percentile(recent, 95)),
+                }
+            return {"scans": self.scans, "stages": stages, "counters": dict(self._counters)}
+
+
+# Process-wide registry the apps read from
+METRICS = MetricsRegistry()
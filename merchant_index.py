@@ -0,0 +1,236 @@
+import csv
+import re
+import threading
+from array import array
+from collections import namedtuple
+
+import numpy as np
+
+Q = 3
+
+# Characters OCR commonly reads in place of letters; folded the same way on
+# both sides, so "GR0CERY ST0RE" and "GROCERY STORE" compare equal
+OCR_FOLD = str.maketrans({"0": "O", "1": "I", "5": "S", "8": "B", "|": "I", "$": "S", "@": "A"})
+NON_ALNUM = re.compile(r"[^0-9A-Z]+")
+
+MerchantMatch = namedtuple("MerchantMatch", ["merchant_id", "name", "distance", "line"])
+
+
+def normalize(name):
+    """Uppercased, OCR-folded, punctuation collapsed to single spaces."""
+    return NON_ALNUM.sub(" ", name.upper().translate(OCR_FOLD)).strip()
+
+
+def merchant_id_for(name):
+    """Default canonical id: the normalized name as a slug ("grocery-store")."""
+    return normalize(name).lower().replace(" ", "-")
+
+
+def _grams(text):
+    padded = f"#{text}#"
+    return {padded[i:i + Q] for i in range(len(padded) - Q + 1)}
+
+
+def bounded_distance(a, b, limit):
+    """Levenshtein distance of a and b, or limit + 1 once it must exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    # Only cells within `limit` of the diagonal can stay within limit
+    over = limit + 1
+    previous = [j if j <= limit else over for j in range(len(b) + 1)]
+    for i in range(1, len(a) + 1):
+        lo = max(1, i - limit)
+        hi = min(len(b), i + limit)
+        current = [over] * (len(b) + 1)
+        current[0] = i if i <= limit else over
+        ca = a[i - 1]
+        for j in range(lo, hi + 1):
+            cost = previous[j - 1] + (ca != b[j - 1])
+            if previous[j] + 1 < cost:
+                cost = previous[j] + 1
+            if current[j - 1] + 1 < cost:
+                cost = current[j - 1] + 1
+            current[j] = cost
+        if min(current[lo - 1:hi + 1]) > limit:
+            return over
+        previous = current
+    return min(previous[-1], over)
+
+
+class MerchantIndex:
+    """
+    Known merchant names for resolving the merchant line of a receipt.
+
+    Names are indexed by their character trigrams. A lookup gathers the
+    posting lists of the query's trigrams for all candidate lines at once and
+    keeps only entries that share enough trigrams to be within the allowed
+    edit distance (each edit changes at most 3 trigrams); only those few get
+    an exact, bounded Levenshtein check. That keeps lookups in the low
+    milliseconds at 100k names.
+
+    The allowed distance is len // 4 of the normalized line, capped at
+    max_distance, so short names must match exactly.
+
+    Several names (aliases) can share a merchant id; the first name added
+    for an id is its canonical name. add() is incremental and thread-safe.
+    """
+
+    def __init__(self, max_distance=2):
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._gram_ids = {}
+        self._postings = []
+        self._lengths = array("I")
+        self._gram_counts = array("I")
+        self._names = []
+        self._entry_ids = []
+        self._by_name = {}
+        self._canonical = {}
+
+    def __len__(self):
+        return len(self._names)
+
+    # The lock can't be pickled; scan_batch workers get their own
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def add(self, name, merchant_id=None):
+        """Adds name (an alias if merchant_id is already known). Returns the merchant id."""
+        key = normalize(name)
+        if not key:
+            raise ValueError(f"Merchant name has no letters or digits: {name!r}")
+        merchant_id = merchant_id or merchant_id_for(name)
+        with self._lock:
+            existing = self._by_name.get(key)
+            if existing is not None:
+                return self._entry_ids[existing]
+            entry = len(self._names)
+            grams = _grams(key)
+            for gram in grams:
+                gram_id = self._gram_ids.get(gram)
+                if gram_id is None:
+                    gram_id = self._gram_ids[gram] = len(self._postings)
+                    self._postings.append(array("I"))
+                self._postings[gram_id].append(entry)
+            self._names.append(key)
+            self._entry_ids.append(merchant_id)
+            self._lengths.append(len(key))
+            self._gram_counts.append(len(grams))
+            self._by_name[key] = entry
+            self._canonical.setdefault(merchant_id, name.strip())
+        return merchant_id
+
+    def learn(self, name):
+        """
+        Resolves name to a known merchant, adding it as a new one if none
+        is close enough. Returns the merchant id.
+        """
+        match = self.match(name)
+        return match.merchant_id if match else self.add(name)
+
+    def load_csv(self, path):
+        """Adds rows of "merchant_id,name" (repeat an id for aliases). Returns rows read."""
+        count = 0
+        with open(path, "r", newline="", encoding="utf-8") as f:
+            for row in csv.reader(f):
+                if len(row) >= 2 and row[1].strip():
+                    self.add(row[1], row[0].strip() or None)
+                    count += 1
+        return count
+
+    def canonical_name(self, merchant_id):
+        return self._canonical.get(merchant_id)
+
+    def resolve(self, data, lines=None, header_lines=8):
+        """
+        Maps the merchant of a parsed result to a known one, in place: the
+        first header_lines lines (default: data["lines"] texts) are matched
+        together and the closest known name replaces data["merchant"], with
+        its id in data["merchant_id"]. Without a match the parsed merchant is
+        kept and merchant_id is None. Returns data.
+
+        Runs on results already parsed (or served from the scan cache), so
+        merchants learned later apply without re-scanning.
+        """
+        if lines is None:
+            lines = [line["text"] for line in data.get("lines") or []]
+        match = self.match_lines(lines[:header_lines])
+        if match is not None:
+            data["merchant"] = match.name
+            data["merchant_id"] = match.merchant_id
+        else:
+            data["merchant_id"] = None
+        return data
+
+    def match(self, line):
+        """Best MerchantMatch for one line, or None."""
+        return self.match_lines([line])
+
+    def match_lines(self, lines):
+        """
+        Best MerchantMatch over all lines: smallest distance, then earliest
+        line. None if no line is within the allowed distance of a known name.
+        """
+        queries = []
+        for index, line in enumerate(lines):
+            key = normalize(line)
+            if len(key) >= Q:
+                queries.append((index, key, min(self.max_distance, len(key) // 4), _grams(key)))
+        if not queries:
+            return None
+
+        with self._lock:
+            n = len(self._names)
+            if not n:
+                return None
+            # One pass over the postings of every line: entry e of query i
+            # is counted under key i * n + e
+            chunks = []
+            for qi, (_, _, _, grams) in enumerate(queries):
+                for gram in grams:
+                    gram_id = self._gram_ids.get(gram)
+                    if gram_id is not None:
+                        chunks.append(np.frombuffer(self._postings[gram_id], dtype=np.uint32) + np.uint32(qi * n))
+            if not chunks:
+                return None
+            counts = np.bincount(np.concatenate(chunks), minlength=len(queries) * n).reshape(len(queries), n)
+            # Cheapest bound first (it ignores the entry's own trigram count)
+            floor = np.array([len(q[3]) - Q * q[2] for q in queries])
+            query_index, entries = np.nonzero(counts >= np.maximum(floor, 1)[:, None])
+            shared = counts[query_index, entries]
+            lengths = np.frombuffer(self._lengths, dtype=np.uint32)[entries].astype(np.int64)
+            gram_counts = np.frombuffer(self._gram_counts, dtype=np.uint32)[entries].astype(np.int64)
+
+            limits = np.array([q[2] for q in queries])[query_index]
+            query_lengths = np.array([len(q[1]) for q in queries])[query_index]
+            query_grams = np.array([len(q[3]) for q in queries])[query_index]
+            keep = (
+                (np.abs(lengths - query_lengths) <= limits)
+                & (shared >= np.maximum(gram_counts, query_grams) - Q * limits)
+            )
+            # Line order, most shared trigrams first: close matches come early
+            # and tighten the limit for the rest
+            order = np.lexsort((-shared[keep], query_index[keep]))
+            candidates = [
+                (int(qi), self._names[e], self._entry_ids[e])
+                for qi, e in zip(query_index[keep][order].tolist(), entries[keep][order].tolist())
+            ]
+
+        best = None
+        for qi, name, merchant_id in candidates:
+            line_index, key, limit, _ = queries[qi]
+            if best is not None:
+                # A later line has to be strictly closer to win
+                limit = min(limit, best.distance - 1)
+                if limit < 0:
+                    break
+            distance = bounded_distance(key, name, limit)
+            if distance <= limit:
+                best = MerchantMatch(merchant_id, self._canonical[merchant_id], distance, line_index)
+        return best
@@ -0,0 +1,186 @@
+import os
+import struct
+import threading
+from array import array
+
+import cv2
+import numpy as np
+
+from preprocess import content_bbox, estimate_skew_angle
+
+HASH_BITS = 256
+HASH_BYTES = HASH_BITS // 8
+# The image is hashed at DCT_SIZE x DCT_SIZE; the DCT_KEEP x DCT_KEEP
+# lowest-frequency coefficients give the HASH_BITS bits
+DCT_SIZE = 64
+DCT_KEEP = 16
+# Photos are shrunk to this before deskewing and cropping; the hash sees 64 px anyway
+MAX_SIDE = 1024
+
+# The hash is split into CHUNKS 16-bit pieces, each with its own lookup table
+CHUNKS = 16
+CHUNK_BITS = HASH_BITS // CHUNKS
+# Chunk i holds bits CHUNK_ORDER[i * CHUNK_BITS:(i + 1) * CHUNK_BITS]. Neighbouring
+# low-frequency coefficients mostly encode the receipt layout, which every receipt
+# from the same till shares; striding spreads them over all chunks so no table
+# ends up with a few huge buckets
+CHUNK_ORDER = (np.arange(HASH_BITS) * 61) % HASH_BITS
+
+# find() counts candidates with one slot per stored entry once the buckets it
+# reads hold more than 1/DENSE_COUNT_RATIO as many ids as the index has entries
+DENSE_COUNT_RATIO = 8
+
+# On-disk record: 32-byte hash + 32-byte key (a sha256 digest)
+RECORD = struct.Struct(f"<{HASH_BYTES}s32s")
+
+# Set bits per byte value, for vectorized popcount
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def paper_region(img_array):
+    """
+    Grayscale receipt content of an RGB/grayscale array: shrunk to MAX_SIDE,
+    leveled, and cropped to the text on the paper. Borders, the table around a
+    photographed receipt and small rotations then no longer change the hash.
+    """
+    gray = img_array if img_array.ndim == 2 else cv2.cvtColor(img_array, cv2.COLOR_RGB2GRAY)
+    scale = MAX_SIDE / max(gray.shape[:2])
+    if scale < 1.0:
+        size = (max(1, round(gray.shape[1] * scale)), max(1, round(gray.shape[0] * scale)))
+        gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+    angle = estimate_skew_angle(gray)
+    if angle:
+        h, w = gray.shape
+        rotation = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+        gray = cv2.warpAffine(gray, rotation, (w, h), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+    x0, y0, x1, y1 = content_bbox(gray, margin=0)
+    return gray[y0:y1, x0:x1]
+
+
+def phash(img_array):
+    """
+    256-bit DCT hash of the receipt content (see paper_region), as 32 bytes:
+    one bit per low-frequency coefficient, set when it is above the median.
+    Survives recompression, rescaling, lighting changes and small rotations.
+
+    On generated receipts (one layout, small default font, so the hard case)
+    distinct receipts stay at least 10 bits apart and about 90% of JPEG q80
+    copies land within 8; the committed samples are 36+ bits apart. See
+    benchmark.py --near-duplicates. A match is a hint for the user to
+    confirm, not proof.
+    """
+    region = paper_region(img_array).astype(np.float32)
+    px = cv2.resize(region, (DCT_SIZE, DCT_SIZE), interpolation=cv2.INTER_AREA)
+    coeffs = cv2.dct(px)[:DCT_KEEP, :DCT_KEEP].ravel()
+    # The DC term is the overall brightness; it would skew the median
+    return np.packbits(coeffs > np.median(coeffs[1:])).tobytes()
+
+
+def hash_distance(a, b):
+    """Number of differing bits between two hashes from phash."""
+    return int(POPCOUNT[np.frombuffer(bytes(a), dtype=np.uint8) ^ np.frombuffer(bytes(b), dtype=np.uint8)].sum())
+
+
+def hash_chunks(hashes):
+    """(n, CHUNKS) array of the 16-bit table keys of n hashes given as an (n, HASH_BYTES) uint8 array."""
+    bits = np.take(np.unpackbits(hashes, axis=1), CHUNK_ORDER, axis=1)
+    return np.ascontiguousarray(np.packbits(bits, axis=1)).view(">u2").astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """
+    Finds stored image hashes within max_distance bits of a query.
+
+    Multi-index hashing: if two hashes differ in at most max_distance bits,
+    at least CHUNKS - max_distance of their CHUNKS pieces are identical
+    (pigeonhole). Each piece indexes its own table, so a lookup reads one
+    bucket per table, keeps the entries found in enough of them, and checks
+    only those bit by bit. Receipt hashes are far from uniform, so buckets are
+    bigger than for random bits; benchmark.py --near-duplicates measures
+    lookups on hashes built from a corpus.
+
+    Entries map a hash to a 32-byte key (e.g. a ScanCache key) and are appended
+    to `path`, so the index survives restarts.
+    """
+
+    def __init__(self, path=None, max_distance=8):
+        if not 0 <= max_distance < CHUNKS:
+            raise ValueError(f"max_distance must be between 0 and {CHUNKS - 1}")
+        self.path = path
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+        self._hashes = bytearray()
+        self._keys = bytearray()
+        self._tables = [{} for _ in range(CHUNKS)]
+        if path and os.path.exists(path):
+            self._load()
+
+    def __len__(self):
+        return len(self._hashes) // HASH_BYTES
+
+    def _load(self):
+        with open(self.path, "rb") as f:
+            data = f.read()
+        # A torn final record (crash mid-append) is ignored
+        usable = len(data) - len(data) % RECORD.size
+        records = np.frombuffer(data, dtype=np.uint8, count=usable).reshape(-1, RECORD.size)
+        if not len(records):
+            return
+        hashes = records[:, :HASH_BYTES]
+        self._hashes += hashes.tobytes()
+        self._keys += records[:, HASH_BYTES:].tobytes()
+        # Buckets are built per table in one pass instead of one entry at a time
+        chunks = hash_chunks(hashes)
+        for i, table in enumerate(self._tables):
+            order = np.argsort(chunks[:, i], kind="stable")
+            values, starts = np.unique(chunks[order, i], return_index=True)
+            for value, bucket in zip(values.tolist(), np.split(order.astype(np.uint32), starts[1:])):
+                table[value] = array("I", bucket.tobytes())
+
+    def add(self, h, key):
+        """Stores hash h (HASH_BYTES bytes, from phash) for key (hex string or 32 bytes)."""
+        h = bytes(h)
+        key = bytes.fromhex(key) if isinstance(key, str) else bytes(key)
+        chunks = hash_chunks(np.frombuffer(h, dtype=np.uint8).reshape(1, -1))[0].tolist()
+        with self._lock:
+            entry = len(self)
+            self._hashes += h
+            self._keys += key
+            for table, chunk in zip(self._tables, chunks):
+                bucket = table.get(chunk)
+                if bucket is None:
+                    bucket = table[chunk] = array("I")
+                bucket.append(entry)
+            if self.path:
+                with open(self.path, "ab") as f:
+                    f.write(RECORD.pack(h, key))
+
+    def find(self, h):
+        """Returns (key_hex, distance) of the closest stored hash within max_distance, or None."""
+        query = np.frombuffer(bytes(h), dtype=np.uint8)
+        chunks = hash_chunks(query.reshape(1, -1))[0].tolist()
+        with self._lock:
+            buckets = [table.get(chunk) for table, chunk in zip(self._tables, chunks)]
+            buckets = [np.frombuffer(bucket, dtype=np.uint32) for bucket in buckets if bucket]
+            if not buckets:
+                return None
+            # Entries sharing too few pieces with the query can't be within max_distance.
+            # Usually the buckets are small and only their contents are counted; a
+            # table per entry is cheaper only when they hold a large part of the index
+            ids = np.concatenate(buckets)
+            if len(ids) * DENSE_COUNT_RATIO < len(self):
+                entries, counts = np.unique(ids, return_counts=True)
+                entries = entries[counts >= CHUNKS - self.max_distance]
+            else:
+                entries = np.flatnonzero(np.bincount(ids) >= CHUNKS - self.max_distance)
+            if not len(entries):
+                return None
+            hashes = np.frombuffer(self._hashes, dtype=np.uint8).reshape(-1, HASH_BYTES)[entries]
+            distances = POPCOUNT[hashes ^ query].sum(axis=1, dtype=np.int32)
+            best = int(np.argmin(distances))
+            distance = int(distances[best])
+            if distance > self.max_distance:
+                return None
+            entry = int(entries[best])
+            key = bytes(self._keys[entry * 32:(entry + 1) * 32])
+        return key.hex(), distance
@@ -0,0 +1,48 @@
+import struct
+import zlib
+
+import numpy as np
+
+# Blob layout (zlib-compressed):
+#   header: magic, format version, box count
+#   float32[N, 4, 2] quad corners, float16[N] probabilities,
+#   uint32[N] UTF-8 text lengths, then the texts back to back
+MAGIC = b"RBX"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<3sBI")
+
+
+def pack_boxes(raw_results):
+    """Encodes readtext-style (bbox, text, prob) results into a compact blob."""
+    raw_results = list(raw_results)
+    n = len(raw_results)
+    quads = np.asarray([r[0] for r in raw_results], dtype=np.float32).reshape(n, 4, 2)
+    probs = np.asarray([r[2] for r in raw_results], dtype=np.float16)
+    texts = [str(r[1]).encode("utf-8") for r in raw_results]
+    lengths = np.asarray([len(t) for t in texts], dtype=np.uint32)
+    payload = b"".join([
+        HEADER.pack(MAGIC, FORMAT_VERSION, n),
+        quads.tobytes(), probs.tobytes(), lengths.tobytes(), b"".join(texts),
+    ])
+    return zlib.compress(payload, 6)
+
+
+def unpack_boxes(blob):
+    """Inverse of pack_boxes(): list of (bbox, text, prob) with bbox as 4 [x, y] points."""
+    payload = zlib.decompress(blob)
+    magic, version, n = HEADER.unpack_from(payload)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported box blob (magic {magic!r}, version {version})")
+    offset = HEADER.size
+    quads = np.frombuffer(payload, dtype=np.float32, count=n * 8, offset=offset).reshape(n, 4, 2)
+    offset += quads.nbytes
+    probs = np.frombuffer(payload, dtype=np.float16, count=n, offset=offset)
+    offset += probs.nbytes
+    lengths = np.frombuffer(payload, dtype=np.uint32, count=n, offset=offset)
+    offset += lengths.nbytes
+
+    results = []
+    for quad, prob, length in zip(quads.tolist(), probs.tolist(), lengths.tolist()):
+        results.append((quad, payload[offset:offset + length].decode("utf-8"), prob))
+        offset += length
+    return results
@@ -1,157 +1,718 @@
-import easyocr
+import hashlib
+import logging
 import os
-import re
+import sys
+import threading
+import time
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+from image_io import read_image_bytes, decode_image, image_fingerprint, describe_source
+from instrumentation import Instrumentation
+from line_grouper import group_lines, line_labels
+from near_duplicates import phash
+from preview import Preview
+from receipt_parser import ReceiptParser, PARSER_VERSION, DIGIT_PATTERN, PRICE_TOKEN_PATTERN
+from validation import check_totals
+
+logger = logging.getLogger(__name__)
+
+# Default overlap of strip mode; strips must be taller than twice the overlap
+STRIP_OVERLAP = 200
+
+def check_strip_settings(strip_height, strip_overlap):
+    """
+    Raises ValueError unless strips of strip_height overlapping by
+    strip_overlap advance down the image; None disables strip mode.
+    """
+    if strip_height is None:
+        return
+    if strip_overlap < 0:
+        raise ValueError(f"strip_overlap must not be negative, got {strip_overlap}")
+    if strip_height <= 2 * strip_overlap:
+        raise ValueError(
+            f"strip_height must be more than twice strip_overlap ({strip_overlap}), got {strip_height}"
+        )
+
+# Per-process scanner used by scan_batch() worker pools, and the
+# instrumentation records of its scans not yet sent back to the parent
+_worker_scanner = None
+_worker_records = None
+
+class _RecordBuffer:
+    """Instrumentation sink holding a worker's records until they go back with a result."""
+
+    def __init__(self):
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+def _init_worker(lang, preprocessor, settings, reader_pool=None, cache_settings=None, instrumentation_settings=None):
+    global _worker_scanner, _worker_records
+    from scan_cache import ScanCache
+
+    _worker_records = _RecordBuffer()
+    instrumentation = Instrumentation([_worker_records], **(instrumentation_settings or {}))
+    cache = ScanCache(**cache_settings) if cache_settings is not None else None
+    _worker_scanner = ReceiptScanner(lang, cache=cache, preprocessor=preprocessor,
+                                     instrumentation=instrumentation, reader_pool=reader_pool)
+    for name, value in settings.items():
+        setattr(_worker_scanner, name, value)
+
+def _scan_in_worker(image, batch_size):
+    """Returns (result, instrumentation records) for the parent to forward to its sinks."""
+    result = _worker_scanner.scan(image, batch_size=batch_size)
+    records, _worker_records.records = _worker_records.records, []
+    return result, records
+
+def _replace_by_center(results, indices, refined):
+    """
+    Puts the text and confidence of re-recognized boxes back into results.
+    EasyOCR may reorder boxes, so each is matched to the nearest center
+    among results[indices].
+    """
+    centers = np.array([np.mean(results[i][0], axis=0) for i in indices])
+    for bbox, text, prob in refined:
+        center = np.mean(np.asarray(bbox, dtype=np.float64), axis=0)
+        i = indices[int(np.argmin(((centers - center) ** 2).sum(axis=1)))]
+        results[i] = (results[i][0], text, prob)
 
 class ReceiptScanner:
-    def __init__(self, lang=['en']):
-        self.reader = easyocr.Reader(lang)
+    def __init__(self, lang=['en'], cache=None, preprocessor=None, instrumentation=None, reader=None,
+                 near_duplicates=None, reader_pool=None):
+        self.lang = list(lang)
+        # Optional ReaderPool for several language groups; it picks a group
+        # per image and replaces the single reader built from lang
+        self.reader_pool = reader_pool
+        # The EasyOCR reader is built on first use or by warm_up();
+        # importing easyocr pulls in torch, which alone takes seconds
+        self._reader = reader
+        self._reader_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._warm_up_thread = None
+        self.load_error = None
+        self.load_seconds = None
+        if reader is not None:
+            self._ready.set()
+        # Boxes belong to the same line when their centers are within
+        # line_threshold * median glyph height of each other
+        self.line_threshold = 0.6
+        # Compensate for tilted receipts when grouping lines
+        self.deskew = True
+        # Two-phase mode: detect and recognize on a copy scaled by fast_scale,
+        # then re-recognize at full resolution only boxes below min_confidence
+        # and the ones the parser reads values from (numbers, TOTAL/TAX lines)
+        self.two_phase = False
+        self.fast_scale = 0.5
+        self.min_confidence = 0.6
+        # Strip mode for long receipts: images taller than strip_height +
+        # strip_overlap are OCR'd in overlapping horizontal strips, so the
+        # reader's working memory depends on the strip, not the receipt.
+        # The overlap must exceed twice the text height. strip_workers > 1
+        # runs that many strips at once (more memory, lower latency).
+        self.strip_height = None
+        self.strip_overlap = STRIP_OVERLAP
+        self.strip_workers = 1
+        # Every result gets result["validation"] (amounts cross-checked in
+        # cents). On a mismatch the boxes holding amounts are re-recognized
+        # from crops scaled by recheck_scale, one recheck_passes variant at a
+        # time, until the amounts add up; clean receipts cost nothing extra
+        self.recheck_passes = ("upscale", "binarize")
+        self.recheck_scale = 2.0
+        self.parser = ReceiptParser()
+        # Optional ScanCache placed in front of scan()
+        self.cache = cache
+        # Optional Preprocessor run on the decoded image before OCR
+        self.preprocessor = preprocessor
+        # Per-stage timers; records go to the instrumentation's sinks
+        self.instrumentation = instrumentation or Instrumentation()
+        # Optional NearDuplicateIndex of perceptual hashes of scanned images.
+        # Matches are flagged in result["meta"]["near_duplicate"]; with
+        # reuse_near_duplicates the earlier result is returned without OCR
+        # (needs the cache, which holds the earlier results).
+        self.near_duplicates = near_duplicates
+        self.reuse_near_duplicates = False
+        # Optional QualityGate; images it rejects return an error with the
+        # reasons instead of going through OCR
+        self.quality_gate = None
+        # Optional MerchantIndex; the merchant of every result (cached ones
+        # included) is resolved against it after parsing, and gets a
+        # "merchant_id". Cached results don't depend on it.
+        self.merchant_index = None
 
-    def scan(self, image_path):
-        img_path = os.path.abspath(image_path)
-        if not os.path.exists(img_path):
-            return {"error": "Image not found"}
+    @property
+    def reader(self):
+        if self._reader is None:
+            with self._reader_lock:
+                if self._reader is None:
+                    self._reader = self._load_reader()
+                    self.load_error = None
+                    self._ready.set()
+        return self._reader
 
-        print(f"Scanning {img_path}...")
-        # detail=1 returns (bbox, text, prob)
-        raw_results = self.reader.readtext(img_path)
-        
-        # Group text into lines based on Y-coordinate
-        lines = self._group_into_lines(raw_results)
-        
-        # Extract data
-        data = self._parse_lines(lines)
+    def _load_reader(self):
+        import easyocr
+        t = time.perf_counter()
+        reader = easyocr.Reader(self.lang)
+        self.load_seconds = time.perf_counter() - t
+        logger.info("OCR engine loaded in %.1fs", self.load_seconds)
+        return reader
+
+    def warm_up(self, background=True):
+        """
+        Loads the reader ahead of the first scan.
+        With background=True this returns immediately; check status or wait_ready().
+        """
+        if self._ready.is_set():
+            return
+        if not background:
+            self._load_default_reader()
+            return
+        with self._reader_lock:
+            if self._warm_up_thread is None or not self._warm_up_thread.is_alive():
+                self.load_error = None
+                self._warm_up_thread = threading.Thread(target=self._warm_up_in_background, daemon=True)
+                self._warm_up_thread.start()
+
+    def _load_default_reader(self):
+        if self.reader_pool is None:
+            self.reader
+            return
+        self.reader_pool.warm_up()
+        self._ready.set()
+
+    def _warm_up_in_background(self):
+        try:
+            self._load_default_reader()
+        except Exception as e:
+            logger.exception("Failed to load OCR engine")
+            self.load_error = e
+
+    @property
+    def status(self):
+        """One of: ready, loading, failed, cold (not loaded and not loading)."""
+        if self._ready.is_set():
+            return "ready"
+        if self.load_error is not None:
+            return "failed"
+        if self._warm_up_thread is not None and self._warm_up_thread.is_alive():
+            return "loading"
+        return "cold"
+
+    def wait_ready(self, timeout=None):
+        """Blocks until the reader is loaded. Returns False on timeout, raises if loading failed."""
+        thread = self._warm_up_thread
+        if thread is not None:
+            thread.join(timeout)
+        if self.load_error is not None:
+            raise self.load_error
+        return self._ready.is_set()
+
+    def config(self):
+        """Settings that affect scan output; part of the cache key."""
+        return {
+            "lang": self.reader_pool.config() if self.reader_pool else self.lang,
+            "line_threshold": self.line_threshold,
+            "deskew": self.deskew,
+            "two_phase": [self.fast_scale, self.min_confidence] if self.two_phase else None,
+            "strips": [self.strip_height, self.strip_overlap] if self.strip_height else None,
+            "recheck": [list(self.recheck_passes), self.recheck_scale] if self.recheck_passes else None,
+            "parser": PARSER_VERSION,
+            "preprocess": self.preprocessor.config() if self.preprocessor else None,
+        }
+
+    def scan(self, image, batch_size=1):
+        """
+        image: file path, raw bytes, file-like buffer, PIL.Image, RGB NumPy array
+               or a preview.Preview (its bytes key the cache, its array is reused).
+        The image is decoded once in memory and handed straight to the reader.
+        Per-stage timings and counters are added to result["meta"].
+        """
+        trace = self.instrumentation.start(describe_source(image))
+        try:
+            data = self._scan(image, batch_size, trace)
+            if "error" not in data and self.merchant_index is not None:
+                with trace.stage("merchant"):
+                    self.merchant_index.resolve(data)
+        finally:
+            record = self.instrumentation.finish(trace)
+
+        if "error" not in data:
+            meta = data.setdefault("meta", {})
+            meta["total_ms"] = record["total_ms"]
+            meta["timings_ms"] = record["timings_ms"]
+            meta["counters"] = record["counters"]
+            for key in ("profile", "peak_memory_kb"):
+                if key in record:
+                    meta[key] = record[key]
         return data
 
+    def _scan(self, image, batch_size, trace):
+        with trace.stage("decode"):
+            try:
+                # Encoded bytes are read once and reused for the cache key and decoding
+                data = image.data if isinstance(image, Preview) else read_image_bytes(image)
+                img_array = decode_image(image) if data is None else None
+            except FileNotFoundError:
+                return {"error": "Image not found"}
+            except (OSError, ValueError) as e:
+                return {"error": f"Could not read image: {e}"}
+
+        cache_key = None
+        if self.cache is not None:
+            with trace.stage("cache_lookup"):
+                cache_key = self.cache.make_key(image_fingerprint(data if data is not None else img_array), self.config())
+                cached = self.cache.get(cache_key)
+            if cached is not None:
+                trace.count("cache_hits")
+                return cached
+
+        if img_array is None:
+            with trace.stage("decode"):
+                try:
+                    # A preview already holds the pixels of formats it decodes in full
+                    img_array = image.array() if isinstance(image, Preview) else decode_image(data)
+                except (OSError, ValueError) as e:
+                    return {"error": f"Could not read image: {e}"}
+
+        meta = {}
+        if self.quality_gate is not None:
+            with trace.stage("quality"):
+                report = self.quality_gate.assess(img_array)
+            if not report.ok:
+                trace.count("quality_rejects")
+                return {
+                    "error": " ".join(message for _, message in report.problems),
+                    "quality": report._asdict(),
+                }
+            meta["quality"] = report._asdict()
+
+        image_hash = None
+        if self.near_duplicates is not None:
+            with trace.stage("near_duplicate_lookup"):
+                image_hash = phash(img_array)
+                match = self._find_near_duplicate(image_hash)
+            if match is not None:
+                meta["near_duplicate"] = {"distance": match["distance"]}
+                if self.reuse_near_duplicates and match["result"] is not None:
+                    trace.count("near_duplicate_hits")
+                    data = match["result"]
+                    data.setdefault("meta", {})["near_duplicate"] = meta["near_duplicate"]
+                    return data
+        # Rechecks crop from the full-resolution decode, not the prepared copy
+        original = img_array
+        if self.preprocessor is not None:
+            with trace.stage("preprocess"):
+                img_array, meta["preprocess"] = self.preprocessor.process(img_array)
+
+        logger.info("Scanning %s...", trace.label)
+        with self._reader_for(img_array, trace, meta) as reader:
+            if self.strip_height and img_array.shape[0] > self.strip_height + self.strip_overlap:
+                text_lines = []
+                raw_results = []
+
+                def stream_lines():
+                    for line in self._iter_strip_lines(img_array, batch_size, trace, reader, raw_results):
+                        text_lines.append(line)
+                        yield line.text
+
+                # The parser consumes lines as each strip finishes, so OCR, grouping
+                # and parsing interleave; their stages are timed separately inside
+                data = self._parse_lines(stream_lines())
+                trace.count("lines", len(text_lines))
+            else:
+                raw_results = self._recognize(img_array, batch_size, trace, reader)
+
+                # Group text into lines based on Y-coordinate
+                with trace.stage("group"):
+                    text_lines = self._group_text_lines(raw_results)
+                    lines = [line.text for line in text_lines]
+                trace.count("lines", len(lines))
+
+                # Extract data
+                with trace.stage("parse"):
+                    data = self._parse_lines(lines)
+
+            with trace.stage("validate"):
+                validation = check_totals(data)
+            if validation["status"] == "mismatch" and self.recheck_passes:
+                validation["rechecked"] = []
+                for variant in self.recheck_passes:
+                    validation["rechecked"].append(variant)
+                    fixed = self._recheck(original, raw_results, variant, batch_size, trace, reader,
+                                          meta.get("preprocess"))
+                    if fixed is not None:
+                        data, raw_results, text_lines, checks = fixed
+                        validation.update(checks)
+                        trace.count("recheck_fixes")
+                        break
+        data["validation"] = validation
+        trace.count("items", len(data["items"]))
+        data["lines"] = [line._asdict() for line in text_lines]
+        # Kept so stored receipts can be re-grouped and re-parsed without OCR
+        data["raw_boxes"] = [
+            [[[float(x), float(y)] for x, y in bbox], text, float(prob)] for bbox, text, prob in raw_results
+        ]
+        data["meta"] = meta
+
+        if cache_key is not None:
+            self.cache.put(cache_key, data)
+        if image_hash is not None:
+            # Without a cache the key only identifies the image; there is no result to reuse
+            key = cache_key or hashlib.sha256(image_fingerprint(img_array)).hexdigest()
+            self.near_duplicates.add(image_hash, key)
+        return data
+
+    def find_near_duplicate(self, image):
+        """
+        Looks image up in the near-duplicate index without scanning it.
+        Returns {"distance": bits, "result": earlier scan result or None}, or
+        None if nothing similar was scanned before (or there is no index).
+        """
+        if self.near_duplicates is None:
+            return None
+        img_array = image.array() if isinstance(image, Preview) else decode_image(image)
+        match = self._find_near_duplicate(phash(img_array))
+        if match is not None and match["result"] is not None and self.merchant_index is not None:
+            self.merchant_index.resolve(match["result"])
+        return match
+
+    def _find_near_duplicate(self, image_hash):
+        match = self.near_duplicates.find(image_hash)
+        if match is None:
+            return None
+        key, distance = match
+        result = self.cache.get(key) if self.cache is not None else None
+        return {"distance": distance, "result": result}
+
+    def _reader_for(self, img_array, trace, meta):
+        """Context manager yielding the reader to OCR img_array with."""
+        if self.reader_pool is None:
+            return nullcontext(self.reader)
+        with trace.stage("language_detect"):
+            group = self.reader_pool.detect(img_array)
+        # detect() has loaded the probe reader
+        self._ready.set()
+        meta["language_group"] = group
+        return self.reader_pool.use(group)
+
+    def _recognize(self, img_array, batch_size, trace, reader):
+        """(bbox, text, prob) for every text box in img_array."""
+        if self.two_phase and self.fast_scale < 1:
+            return self._two_phase_ocr(img_array, batch_size, trace, reader)
+        return self._ocr(img_array, batch_size, trace, reader)
+
+    def _recheck(self, img_array, raw_results, variant, batch_size, trace, reader, info=None):
+        """
+        Re-recognizes the boxes with digits on amount lines (a price or a
+        TOTAL/TAX keyword), each line from its own crop scaled by
+        recheck_scale; "binarize" also applies CLAHE and Otsu thresholding.
+        img_array is the decoded image before preprocessing and info the
+        Preprocessor's info (None without one): boxes are mapped back with
+        its transform, so crops come from the full-resolution pixels and are
+        resized to recheck_scale times the prepared scale.
+        Returns (data, raw_results, text_lines, validation) if the re-parsed
+        amounts add up, else None.
+        """
+        import cv2
+
+        if info is not None:
+            from preprocess import map_to_original, map_to_prepared
+
+        amount_keywords = [rule.keyword for rule in self.parser.rules if getattr(rule, "keyword", None)]
+        labels = line_labels(raw_results, threshold_ratio=self.line_threshold, deskew=self.deskew).tolist()
+        line_text = {}
+        for label, (_, text, _) in zip(labels, raw_results):
+            line_text[label] = line_text.get(label, "") + " " + text.upper()
+        amount_lines = {
+            label for label, text in line_text.items()
+            if PRICE_TOKEN_PATTERN.search(text) or any(k in text for k in amount_keywords)
+        }
+        by_line = {}
+        for i, ((_, text, _), label) in enumerate(zip(raw_results, labels)):
+            if label in amount_lines and DIGIT_PATTERN.search(text):
+                by_line.setdefault(label, []).append(i)
+
+        results = list(raw_results)
+        # Crop pixels per original pixel
+        scale = self.recheck_scale * (info["scale"] if info is not None else 1.0)
+        interpolation = cv2.INTER_CUBIC if scale > 1 else cv2.INTER_AREA
+        height, width = img_array.shape[:2]
+        with trace.stage("recheck"):
+            for indices in by_line.values():
+                quads = [np.asarray(results[i][0], dtype=np.float64) for i in indices]
+                if info is not None:
+                    quads = [map_to_original(quad, info) for quad in quads]
+                points = np.concatenate(quads)
+                margin = max(4.0, float(np.ptp(points[:, 1])) * 0.3)
+                x0, y0 = (max(0, int(v - margin)) for v in points.min(axis=0))
+                x1 = min(width, int(points[:, 0].max() + margin) + 1)
+                y1 = min(height, int(points[:, 1].max() + margin) + 1)
+                crop = cv2.resize(img_array[y0:y1, x0:x1], None, fx=scale, fy=scale, interpolation=interpolation)
+                if variant == "binarize":
+                    gray = crop if crop.ndim == 2 else cv2.cvtColor(crop, cv2.COLOR_RGB2GRAY)
+                    gray = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8)).apply(gray)
+                    _, crop = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+                quads = [[[(float(x) - x0) * scale, (float(y) - y0) * scale] for x, y in quad] for quad in quads]
+                refined = []
+                for bbox, text, prob in reader.recognize(crop, [], quads, batch_size=batch_size):
+                    # Back to the coordinates of the other boxes
+                    bbox = np.asarray(bbox, dtype=np.float64) / scale + (x0, y0)
+                    if info is not None:
+                        bbox = map_to_prepared(bbox, info)
+                    refined.append(([[float(x), float(y)] for x, y in bbox], text, prob))
+                _replace_by_center(results, indices, refined)
+        trace.count("rechecked_boxes", sum(len(indices) for indices in by_line.values()))
+
+        text_lines = self._group_text_lines(results)
+        data = self._parse_lines([line.text for line in text_lines])
+        validation = check_totals(data)
+        if validation["status"] != "ok":
+            return None
+        validation["fixed_by"] = variant
+        return data, results, text_lines, validation
+
+    def _strip_bands(self, height):
+        """
+        (top, keep_from, keep_to) per strip. Strips overlap by strip_overlap;
+        a box is kept only by the strip whose keep band holds its center, so
+        text in an overlap is reported once and boxes cut by a strip edge
+        (whose centers fall in the outer half of the overlap) are dropped.
+        """
+        check_strip_settings(self.strip_height, self.strip_overlap)
+        step = self.strip_height - self.strip_overlap
+        half = self.strip_overlap / 2
+        tops = [0]
+        while tops[-1] + self.strip_height < height:
+            tops.append(tops[-1] + step)
+        return [
+            (top, top + half if i else 0, top + self.strip_height - half if i < len(tops) - 1 else height)
+            for i, top in enumerate(tops)
+        ]
+
+    def _ocr_strip(self, img_array, top, batch_size, trace, reader):
+        # Slicing is a view; only the reader's working buffers scale with the strip
+        strip = img_array[top:top + self.strip_height]
+        return [
+            ([[float(x), float(y) + top] for x, y in bbox], text, prob)
+            for bbox, text, prob in self._recognize(strip, batch_size, trace, reader)
+        ]
+
+    def _iter_strip_lines(self, img_array, batch_size, trace, reader, boxes_out=None):
+        """
+        Yields TextLines top to bottom while strips are still being OCR'd.
+        The de-duplicated boxes are appended to boxes_out if given.
+        """
+        bands = self._strip_bands(img_array.shape[0])
+        trace.count("strips", len(bands))
+
+        def ocr(band):
+            return self._ocr_strip(img_array, band[0], batch_size, trace, reader)
+
+        pool = ThreadPoolExecutor(max_workers=self.strip_workers) if self.strip_workers > 1 else None
+        try:
+            strip_results = pool.map(ocr, bands) if pool else map(ocr, bands)
+            # Boxes of the bottom line of each strip wait for the next strip,
+            # which may hold more boxes of the same line
+            pending = []
+            for i, ((_, keep_from, keep_to), results) in enumerate(zip(bands, strip_results)):
+                with trace.stage("group"):
+                    pending += [r for r in results if keep_from <= np.mean([p[1] for p in r[0]]) < keep_to]
+                    if i == len(bands) - 1 or not pending:
+                        ready, pending = pending, []
+                    else:
+                        labels = line_labels(pending, threshold_ratio=self.line_threshold, deskew=self.deskew)
+                        last = labels.max()
+                        ready = [r for r, label in zip(pending, labels) if label != last]
+                        pending = [r for r, label in zip(pending, labels) if label == last]
+                    lines = self._group_text_lines(ready)
+                if boxes_out is not None:
+                    boxes_out.extend(ready)
+                yield from lines
+        finally:
+            if pool:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+    def _ocr(self, img_array, batch_size, trace, reader):
+        # detail=1 returns (bbox, text, prob)
+        # Detection and recognition run as separate calls (what readtext does
+        # internally) so each can be timed
+        with trace.stage("detect"):
+            horizontal_list, free_list = reader.detect(img_array)
+            horizontal_list, free_list = horizontal_list[0], free_list[0]
+        trace.count("boxes", len(horizontal_list) + len(free_list))
+
+        with trace.stage("recognize"):
+            # batch_size > 1 lets EasyOCR recognize several text boxes per forward pass
+            return reader.recognize(img_array, horizontal_list, free_list, batch_size=batch_size)
+
+    def _two_phase_ocr(self, img_array, batch_size, trace, reader):
+        """
+        Fast pass on a downscaled copy, then full-resolution recognition of the
+        boxes selected by _select_rescan(). Detection never runs at full size.
+        Returns (bbox, text, prob) in full-resolution coordinates.
+        """
+        import cv2
+
+        scale = self.fast_scale
+        with trace.stage("downscale"):
+            small = cv2.resize(img_array, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        fast = self._ocr(small, batch_size, trace, reader)
+        results = [
+            ([[float(x) / scale, float(y) / scale] for x, y in bbox], text, prob)
+            for bbox, text, prob in fast
+        ]
+
+        with trace.stage("select"):
+            rescan = self._select_rescan(results)
+        trace.count("rescanned", len(rescan))
+        if not rescan:
+            return results
+
+        with trace.stage("rescan"):
+            # Passed as free-form quads, so tilted boxes are cropped exactly
+            refined = reader.recognize(img_array, [], [results[i][0] for i in rescan], batch_size=batch_size)
+        _replace_by_center(results, rescan, refined)
+        return results
+
+    def _select_rescan(self, results):
+        """Indices of fast-pass boxes worth recognizing again at full resolution."""
+        amount_keywords = [rule.keyword for rule in self.parser.rules if getattr(rule, "keyword", None)]
+        labels = line_labels(results, threshold_ratio=self.line_threshold, deskew=self.deskew)
+
+        line_text = {}
+        for label, (_, text, _) in zip(labels.tolist(), results):
+            line_text[label] = line_text.get(label, "") + " " + text.upper()
+        amount_lines = {label for label, text in line_text.items() if any(k in text for k in amount_keywords)}
+
+        return [
+            i for i, ((_, text, prob), label) in enumerate(zip(results, labels.tolist()))
+            if prob < self.min_confidence or DIGIT_PATTERN.search(text) or label in amount_lines
+        ]
+
+    def _settings(self):
+        """Attributes copied onto the scanners in scan_batch() worker processes."""
+        check_strip_settings(self.strip_height, self.strip_overlap)
+        return {name: getattr(self, name) for name in
+                ("line_threshold", "deskew", "two_phase", "fast_scale", "min_confidence",
+                 "strip_height", "strip_overlap", "strip_workers", "merchant_index",
+                 "quality_gate", "recheck_passes", "recheck_scale")}
+
+    def _worker_args(self):
+        """
+        initargs of the scan_batch() pool. Each worker builds a ScanCache like
+        this scanner's: with a cache_dir the disk tier is shared (writes are
+        atomic renames), the memory tier is per process. Records of worker
+        scans come back with each result and go to this scanner's sinks.
+        The near-duplicate index is not shared with workers.
+        """
+        cache_settings = None
+        if self.cache is not None:
+            cache_settings = {"max_entries": self.cache.max_entries, "cache_dir": self.cache.cache_dir,
+                              "max_disk_bytes": self.cache.max_disk_bytes}
+        instrumentation_settings = {"profile": self.instrumentation.profile,
+                                    "trace_memory": self.instrumentation.trace_memory}
+        return (self.lang, self.preprocessor, self._settings(), self.reader_pool,
+                cache_settings, instrumentation_settings)
+
+    def scan_batch(self, images, workers=1, ordered=False, errors="return", batch_size=8):
+        """
+        Scans many images and yields (index, result) pairs as they finish.
+        images: iterable of images, any type scan() accepts (consumed lazily)
+        workers: number of processes; each worker builds its own easyocr.Reader
+                 and applies the same cache, quality gate and settings (see
+                 _worker_args); only near-duplicate lookups are skipped.
+                 With workers <= 1 images are scanned in this process.
+        ordered: if True, results are yielded in input order
+        errors: "return" puts {"error": ...} in the result, "raise" re-raises
+        batch_size: number of text boxes EasyOCR recognizes per batch
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        if workers <= 1:
+            for index, image in enumerate(images):
+                try:
+                    result = self.scan(image, batch_size=batch_size)
+                except Exception as e:
+                    if errors == "raise":
+                        raise
+                    result = {"error": str(e)}
+                yield index, result
+            return
+
+        image_iter = enumerate(images)
+        # Keep a couple of jobs queued per worker so memory stays flat on huge inputs
+        max_pending = workers * 2
+        pending = {}
+        finished = {}
+        next_index = 0
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=self._worker_args()) as pool:
+            exhausted = False
+            while True:
+                # Results held back for ordering count against the window too
+                while not exhausted and len(pending) + len(finished) < max_pending:
+                    try:
+                        index, image = next(image_iter)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending[pool.submit(_scan_in_worker, image, batch_size)] = index
+
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    try:
+                        result, records = future.result()
+                        for record in records:
+                            self.instrumentation.emit(record)
+                    except Exception as e:
+                        if errors == "raise":
+                            pool.shutdown(wait=False, cancel_futures=True)
+                            raise
+                        result = {"error": str(e)}
+
+                    if not ordered:
+                        yield index, result
+                        continue
+
+                    finished[index] = result
+                    while next_index in finished:
+                        yield next_index, finished.pop(next_index)
+                        next_index += 1
+
+    def scan_many(self, images, workers=1, errors="return", batch_size=8):
+        """Scans many images and returns the results as a list in input order."""
+        return [result for _, result in self.scan_batch(
+            images, workers=workers, ordered=True, errors=errors, batch_size=batch_size
+        )]
+
     def _group_into_lines(self, raw_results):
         """
-        Groups OCR results into lines based on vertical usage.
+        Groups OCR results into lines based on vertical position.
         raw_results: list of (bbox, text, prob)
         bbox: [[x1, y1], [x2, y2], [x3, y3], [x4, y4]]
+        Returns the line strings, top to bottom.
         """
-        # Sort by Y1 (top-left vertical coordinate)
-        # We use the average Y of the top two points for sorting
-        sorted_results = sorted(raw_results, key=lambda r: (r[0][0][1] + r[0][1][1]) / 2)
-        
-        lines = []
-        current_line = []
-        last_y = -1
-        
-        # Threshold for considering text on the same line (pixels)
-        # This might need tuning based on image resolution
-        y_threshold = 20 
-
-        for bbox, text, prob in sorted_results:
-            # Calculate center Y of this text block
-            # y_center = (top_left_y + bottom_left_y) / 2
-            y_center = (bbox[0][1] + bbox[3][1]) / 2
-            
-            if last_y == -1:
-                current_line.append((bbox, text))
-                last_y = y_center
-            elif abs(y_center - last_y) < y_threshold:
-                current_line.append((bbox, text))
-                # Update last_y to average, or keep simpler?
-                # Keeping simple for now
-            else:
-                # New line
-                # Sort current line by X coordinate before saving
-                current_line.sort(key=lambda item: item[0][0][0])
-                # Join text with space
-                full_line_text = " ".join([item[1] for item in current_line])
-                lines.append(full_line_text)
-                
-                # Start new line
-                current_line = [(bbox, text)]
-                last_y = y_center
-        
-        # Append last line
-        if current_line:
-            current_line.sort(key=lambda item: item[0][0][0])
-            full_line_text = " ".join([item[1] for item in current_line])
-            lines.append(full_line_text)
-            
-        return lines
+        return [line.text for line in self._group_text_lines(raw_results)]
 
-    def _parse_lines(self, lines):
-        data = {
-            "merchant": None,
-            "date": None,
-            "total": None,
-            "items": []
-        }
-        
-        # Regex Patterns
-        date_patterns = [
-            r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})',
-            r'(\d{4}[/-]\d{1,2}[/-]\d{1,2})',
-            r'(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{1,2},?\s+\d{4}'
-        ]
-        
-        # Price at end of line: "Milk 3.50"
-        item_price_pattern = r'(.*?)\s+(\d+\.\d{2})$'
-
-        # 1. Merchant (Heuristic: First significant text line)
-        for line in lines:
-            if len(line.strip()) > 3 and not any(char.isdigit() for char in line):
-                data["merchant"] = line.strip()
-                break
-                
-        # 2. Date
-        for line in lines:
-            for pat in date_patterns:
-                match = re.search(pat, line, re.IGNORECASE)
-                if match:
-                    data["date"] = match.group(0)
-                    break 
-            if data["date"]: break
-
-        # 3. Total
-        for i, line in enumerate(lines):
-            # Look for TOTAL strictly
-            if "TOTAL" in line.upper() and "SUBTOTAL" not in line.upper():
-                # Check for price in the same line "Total: 31.17"
-                price_match = re.search(r'(\d+\.\d{2})', line)
-                if price_match:
-                     data["total"] = price_match.group(1)
-                # Check next line "Total\n31.17"
-                elif i + 1 < len(lines):
-                     next_line = lines[i+1]
-                     price_match = re.search(r'^\s*(\d+\.\d{2})\s*$', next_line)
-                     if price_match:
-                         data["total"] = price_match.group(1)
-                break
-
-        # 4. Items
-        # Removed "TAX" so it appears as a line item
-        skip_words = ["TOTAL", "SUBTOTAL", "CASH", "CHANGE", "DUE", "THANK", "DATE", "GROCERY"]
-        
-        for line in lines:
-            # Skip metadata lines
-            upper_line = line.upper()
-            if any(w in upper_line for w in skip_words):
-                continue
-            if data["date"] and data["date"] in line:
-                continue
-            if data["merchant"] and data["merchant"] in line:
-                continue
-            if "----------------" in line:
-                continue
-
-            # Check if line ends with a price
-            match = re.search(item_price_pattern, line)
-            if match:
-                name = match.group(1).strip()
-                price = match.group(2)
-                
-                # Filter noise
-                if len(name) > 1 and not re.match(r'^[0-9\W]+$', name):
-                    data["items"].append({"name": name, "price": price})
+    def _group_text_lines(self, raw_results):
+        """Same grouping as _group_into_lines, returning TextLine objects (text, bbox, confidence)."""
+        return group_lines(raw_results, threshold_ratio=self.line_threshold, deskew=self.deskew)
 
-        return data
+    def _parse_lines(self, lines):
+        return self.parser.parse(lines)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     scanner = ReceiptScanner()
-    result = scanner.scan("sample_receipt.png")
+    # For many images use batch_scan.py
+    result = scanner.scan(sys.argv[1] if len(sys.argv) > 1 else "sample_receipt.png")
     
     print("-" * 30)
     print("Structured Receipt Data")
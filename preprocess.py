@@ -0,0 +1,230 @@
+import time
+
+import cv2
+import numpy as np
+
+
+class Preprocessor:
+    """
+    Shrinks the OCR workload before readtext.
+    Receipts are dark text on light paper, so most of a phone photo is
+    background or oversized glyphs that only slow detection down.
+
+    Steps (each optional):
+      - grayscale: drop color channels
+      - crop: cut away the background around the paper and the blank margins
+      - downscale: shrink so the median glyph is about target_text_height px
+        (never upscales); max_side caps very large images regardless
+      - deskew: rotate so text lines are horizontal
+
+    process() returns the prepared image and an info dict with the transform
+    back to original coordinates and per-step timings in milliseconds.
+    """
+
+    def __init__(self, grayscale=True, crop=True, target_text_height=24, max_side=2000,
+                 deskew=False, margin=8):
+        self.grayscale = grayscale
+        self.crop = crop
+        self.target_text_height = target_text_height
+        self.max_side = max_side
+        self.deskew = deskew
+        self.margin = margin
+
+    def config(self):
+        return {
+            "grayscale": self.grayscale,
+            "crop": self.crop,
+            "target_text_height": self.target_text_height,
+            "max_side": self.max_side,
+            "deskew": self.deskew,
+            "margin": self.margin,
+        }
+
+    def process(self, img):
+        """
+        img: RGB (H, W, 3) or grayscale (H, W) uint8 array
+        Returns (prepared_img, info).
+        """
+        timings = {}
+        # 3x3 affine transform from original to prepared coordinates
+        transform = np.eye(3)
+        original_shape = img.shape[:2]
+
+        t = time.perf_counter()
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+        if self.grayscale:
+            img = gray
+        timings["grayscale"] = _ms_since(t)
+
+        if self.crop:
+            t = time.perf_counter()
+            x0, y0, x1, y1 = content_bbox(gray, self.margin)
+            img = img[y0:y1, x0:x1]
+            gray = gray[y0:y1, x0:x1]
+            transform = _translation(-x0, -y0) @ transform
+            timings["crop"] = _ms_since(t)
+
+        t = time.perf_counter()
+        scale = 1.0
+        text_height = None
+        if self.target_text_height:
+            text_height = estimate_text_height(gray)
+            if text_height:
+                scale = min(scale, self.target_text_height / text_height)
+        if self.max_side:
+            scale = min(scale, self.max_side / max(gray.shape[:2]))
+        if scale < 1.0:
+            new_size = (max(1, round(img.shape[1] * scale)), max(1, round(img.shape[0] * scale)))
+            img = cv2.resize(img, new_size, interpolation=cv2.INTER_AREA)
+            gray = img if img.ndim == 2 else cv2.resize(gray, new_size, interpolation=cv2.INTER_AREA)
+            transform = _scaling(scale) @ transform
+        else:
+            scale = 1.0
+        timings["downscale"] = _ms_since(t)
+
+        angle = 0.0
+        if self.deskew:
+            t = time.perf_counter()
+            angle = estimate_skew_angle(gray, text_height * scale if text_height else None)
+            if angle:
+                h, w = img.shape[:2]
+                rotation = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+                border = 255 if img.ndim == 2 else (255, 255, 255)
+                img = cv2.warpAffine(img, rotation, (w, h), flags=cv2.INTER_LINEAR,
+                                     borderMode=cv2.BORDER_CONSTANT, borderValue=border)
+                transform = np.vstack([rotation, [0, 0, 1]]) @ transform
+            timings["deskew"] = _ms_since(t)
+
+        timings["total"] = sum(timings.values())
+        info = {
+            "original_shape": list(original_shape),
+            "shape": list(img.shape[:2]),
+            "scale": scale,
+            "text_height": text_height,
+            "angle": angle,
+            "transform": transform.tolist(),
+            "timings": timings,
+        }
+        return np.ascontiguousarray(img), info
+
+
+def map_to_original(points, info):
+    """Maps (x, y) points from the prepared image back to the original image."""
+    inverse = np.linalg.inv(np.asarray(info["transform"]))
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    pts = np.hstack([pts, np.ones((len(pts), 1))]) @ inverse.T
+    return pts[:, :2]
+
+
+def map_to_prepared(points, info):
+    """Maps (x, y) points from the original image into the prepared image."""
+    transform = np.asarray(info["transform"])
+    pts = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    pts = np.hstack([pts, np.ones((len(pts), 1))]) @ transform.T
+    return pts[:, :2]
+
+
+def paper_mask(gray, min_area=0.2):
+    """
+    Filled mask of the receipt paper: the largest bright region.
+    Falls back to the whole image when no region covers min_area of it.
+    """
+    h, w = gray.shape[:2]
+    _, bright = cv2.threshold(cv2.GaussianBlur(gray, (5, 5), 0), 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    contours, _ = cv2.findContours(bright, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    mask = np.zeros((h, w), dtype=np.uint8)
+    if contours:
+        largest = max(contours, key=cv2.contourArea)
+        if cv2.contourArea(largest) >= min_area * w * h:
+            cv2.drawContours(mask, [largest], -1, 255, thickness=cv2.FILLED)
+            # Pull back from the paper edge so the edge itself isn't read as ink
+            return cv2.erode(mask, np.ones((9, 9), np.uint8))
+    mask[:] = 255
+    return mask
+
+
+def ink_mask(gray, paper=None):
+    """
+    Dark-on-light text as a boolean mask.
+    An adaptive threshold keeps uniform dark background out of the mask;
+    paper (from paper_mask) restricts it to the receipt.
+    """
+    ink = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 31, 15)
+    if paper is None:
+        paper = paper_mask(gray)
+    return (ink & paper) > 0
+
+
+def content_bbox(gray, margin=8):
+    """
+    (x0, y0, x1, y1) of the receipt content.
+    Ink outside the paper (a dark table around a photographed receipt) is
+    ignored, then the box is trimmed to the text plus margin.
+    """
+    h, w = gray.shape[:2]
+    mask = ink_mask(gray)
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    if not len(rows) or not len(cols):
+        return 0, 0, w, h
+    return (max(0, int(cols[0]) - margin), max(0, int(rows[0]) - margin),
+            min(w, int(cols[-1]) + 1 + margin), min(h, int(rows[-1]) + 1 + margin))
+
+
+def estimate_text_height(gray):
+    """
+    Median glyph height in px, from connected components of the ink mask.
+    Works on tilted receipts, unlike a row projection. Returns None without text.
+    """
+    mask = ink_mask(gray).astype(np.uint8)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    heights = stats[1:, cv2.CC_STAT_HEIGHT]
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    # Drop specks and anything too tall to be a glyph (rules, logos, edges)
+    glyphs = heights[(areas >= 8) & (heights >= 4) & (heights < gray.shape[0] / 8)]
+    if not len(glyphs):
+        return None
+    return float(np.median(glyphs))
+
+
+def estimate_skew_angle(gray, text_height=None, max_angle=15.0):
+    """
+    Angle in degrees to pass to cv2.getRotationMatrix2D to level the text, or 0.0.
+    Glyphs are smeared horizontally into line blobs; the orientation of each
+    elongated blob (from its second-order moments) is averaged, weighted by size.
+    """
+    mask = ink_mask(gray).astype(np.uint8) * 255
+    text_height = text_height or estimate_text_height(gray) or 10
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (max(3, int(text_height * 1.5)), 1))
+    mask = cv2.dilate(mask, kernel)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    angles = []
+    weights = []
+    for contour in contours:
+        m = cv2.moments(contour)
+        if m["m00"] < 4 * text_height * text_height:
+            continue
+        # Orientation of the major axis; y points down, so this is clockwise-positive
+        theta = 0.5 * np.degrees(np.arctan2(2 * m["mu11"], m["mu20"] - m["mu02"]))
+        if abs(theta) > max_angle:
+            continue
+        angles.append(theta)
+        weights.append(m["m00"])
+    if not angles:
+        return 0.0
+    angle = float(np.average(angles, weights=weights))
+    if abs(angle) < 0.3:
+        return 0.0
+    return angle
+
+
+def _ms_since(t):
+    return (time.perf_counter() - t) * 1000
+
+
+def _translation(dx, dy):
+    return np.array([[1, 0, dx], [0, 1, dy], [0, 0, 1]], dtype=np.float64)
+
+
+def _scaling(s):
+    return np.array([[s, 0, 0], [0, s, 0], [0, 0, 1]], dtype=np.float64)
@@ -0,0 +1,144 @@
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from image_io import decode_image, read_image_bytes
+
+
+class Preview:
+    """
+    Downsampled preview of an image plus what the OCR call needs later.
+    thumbnail: RGB PIL.Image no larger than the requested size
+    size: (width, height) of the full image
+    data: the encoded bytes, so the file is read only once
+    """
+
+    __slots__ = ("key", "thumbnail", "size", "data", "_array", "_lock")
+
+    def __init__(self, key, thumbnail, size, data, array=None):
+        self.key = key
+        self.thumbnail = thumbnail
+        self.size = size
+        self.data = data
+        self._array = array
+        self._lock = threading.Lock()
+
+    def array(self):
+        """
+        Full-resolution RGB array for OCR, decoded at most once. Formats
+        without reduced-scale decoding were already fully decoded for the
+        thumbnail, and that buffer is returned as is.
+        """
+        with self._lock:
+            if self._array is None:
+                self._array = decode_image(self.data)
+            return self._array
+
+    def release(self):
+        """Drops the full-resolution buffer; the thumbnail stays usable."""
+        with self._lock:
+            self._array = None
+
+
+def decode_preview(data, max_size=(400, 600)):
+    """
+    Returns (thumbnail, full size, full array or None).
+    JPEGs are decoded by the DCT at 1/2, 1/4 or 1/8 scale (draft mode), so a
+    12 MP photo never becomes a full-size bitmap here; other formats are
+    decoded in full and that array is returned for reuse.
+    """
+    img = Image.open(io.BytesIO(data))
+    size = img.size
+    full = None
+    if img.format == "JPEG":
+        # Draft keeps the smallest DCT scale that is still at least max_size
+        img.draft("RGB", max_size)
+        img = img.convert("RGB") if img.mode != "RGB" else img
+    else:
+        full = decode_image(img)
+        img = Image.fromarray(full)
+    thumbnail = img.copy() if full is None else img
+    thumbnail.thumbnail(max_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+    return thumbnail, size, full
+
+
+class PreviewCache:
+    """
+    LRU of thumbnails keyed by a hash of the encoded image, bounded by entry
+    count and by thumbnail pixel bytes. Full-resolution buffers are never
+    cached here.
+    """
+
+    def __init__(self, max_entries=64, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry
+
+    def put(self, key, thumbnail, size):
+        nbytes = thumbnail.width * thumbnail.height * len(thumbnail.getbands())
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = (thumbnail, size)
+            self._bytes += nbytes
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (old, _) = self._entries.popitem(last=False)
+                self._bytes -= old.width * old.height * len(old.getbands())
+                self._stats["evictions"] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+        return stats
+
+
+class PreviewLoader:
+    """
+    Builds previews off the caller's thread. request() returns a Future of a
+    Preview; load() does the same work synchronously.
+    """
+
+    def __init__(self, cache=None, max_size=(400, 600), workers=1):
+        self.cache = cache if cache is not None else PreviewCache()
+        self.max_size = max_size
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="preview")
+
+    def request(self, source, key=None):
+        """source: file path, bytes or file-like object."""
+        return self._pool.submit(self.load, source, key)
+
+    def load(self, source, key=None):
+        """key: sha256 hex digest of the bytes, if the caller already has it."""
+        data = read_image_bytes(source)
+        if data is None:
+            raise ValueError(f"Unsupported image type: {type(source).__name__}")
+        key = key or hashlib.sha256(data).hexdigest()
+        cached = self.cache.get(key)
+        if cached is not None:
+            thumbnail, size = cached
+            return Preview(key, thumbnail, size, data)
+        thumbnail, size, full = decode_preview(data, self.max_size)
+        self.cache.put(key, thumbnail, size)
+        return Preview(key, thumbnail, size, data, full)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,128 @@
+import math
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from preprocess import estimate_text_height, ink_mask, paper_mask
+
+# ok: whether OCR is worth running
+# score: higher is better, for picking among frames
+# problems: (code, message) pairs the user can act on
+QualityReport = namedtuple(
+    "QualityReport",
+    ["ok", "score", "sharpness", "contrast", "coverage", "text_height", "problems", "elapsed_ms"],
+)
+
+MESSAGES = {
+    "no_text": "No text found. Fill the frame with the receipt.",
+    "too_small": "Text is too small. Move closer to the receipt.",
+    "blurry": "Image is blurry. Hold the camera steady and tap to focus.",
+    "low_contrast": "Low contrast. Add light and avoid glare or shadows.",
+    "cluttered": "Too much dark area. Put the receipt on a plain, light background.",
+}
+
+
+def ink_contrast(paper_px):
+    """
+    Median of the light pixels minus median of the dark ones, split at the
+    Otsu threshold. Unlike a percentile spread this doesn't depend on how
+    much of the paper is printed: a receipt with a few short lines has under
+    1% ink, so its 1st percentile is often still paper.
+    """
+    if paper_px.size == 0:
+        return 0.0
+    threshold, _ = cv2.threshold(paper_px.reshape(-1, 1), 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    dark = paper_px[paper_px <= threshold]
+    light = paper_px[paper_px > threshold]
+    if not dark.size or not light.size:
+        return 0.0
+    return float(np.median(light) - np.median(dark))
+
+
+class QualityGate:
+    """
+    Cheap checks that decide whether an image is worth a full OCR pass.
+
+    Metrics are measured on a copy normalized to a text height of
+    norm_text_height px, so they don't depend on camera resolution:
+      - sharpness: Laplacian variance around the text, divided by the squared
+        contrast so a dim but sharp photo isn't called blurry
+      - contrast: median paper brightness minus median ink brightness
+      - coverage: fraction of the paper covered by ink
+      - text_height: median glyph height in the original image
+    """
+
+    def __init__(self, min_sharpness=2500, min_contrast=60, min_coverage=0.005, max_coverage=0.3,
+                 min_text_height=8, norm_text_height=16, work_side=1200):
+        self.min_sharpness = min_sharpness
+        self.min_contrast = min_contrast
+        self.min_coverage = min_coverage
+        self.max_coverage = max_coverage
+        self.min_text_height = min_text_height
+        self.norm_text_height = norm_text_height
+        self.work_side = work_side
+
+    def assess(self, img):
+        """img: RGB or grayscale uint8 array. Returns a QualityReport."""
+        t = time.perf_counter()
+        gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
+        scale = min(1.0, self.work_side / max(gray.shape[:2]))
+        if scale < 1.0:
+            gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+        problems = []
+        work_text_height = estimate_text_height(gray)
+        text_height = work_text_height / scale if work_text_height else None
+        if text_height is None:
+            problems.append("no_text")
+        elif text_height < self.min_text_height:
+            problems.append("too_small")
+        elif work_text_height > self.norm_text_height:
+            f = self.norm_text_height / work_text_height
+            gray = cv2.resize(gray, None, fx=f, fy=f, interpolation=cv2.INTER_AREA)
+
+        paper = paper_mask(gray)
+        ink = ink_mask(gray, paper)
+        contrast = ink_contrast(gray[paper > 0])
+        coverage = float(ink.sum()) / max(int(np.count_nonzero(paper)), 1)
+
+        near_text = cv2.dilate(ink.astype(np.uint8), np.ones((5, 5), np.uint8)) > 0
+        if near_text.any():
+            laplacian = cv2.Laplacian(gray, cv2.CV_64F)
+            sharpness = float(laplacian[near_text].var()) / max(contrast / 255, 0.05) ** 2
+        else:
+            sharpness = 0.0
+
+        if text_height is not None:
+            if coverage < self.min_coverage:
+                problems.append("no_text")
+            elif coverage > self.max_coverage:
+                problems.append("cluttered")
+            if sharpness < self.min_sharpness:
+                problems.append("blurry")
+            if contrast < self.min_contrast:
+                problems.append("low_contrast")
+
+        score = math.log10(1 + sharpness) + contrast / 255
+        return QualityReport(
+            ok=not problems,
+            score=score,
+            sharpness=sharpness,
+            contrast=contrast,
+            coverage=coverage,
+            text_height=text_height,
+            problems=[(code, MESSAGES[code]) for code in problems],
+            elapsed_ms=(time.perf_counter() - t) * 1000,
+        )
+
+    def best_of(self, frames):
+        """
+        Assesses a burst of frames and returns (index, report) of the best one:
+        the highest score among frames that pass, else the highest overall.
+        """
+        reports = [self.assess(frame) for frame in frames]
+        if not reports:
+            raise ValueError("best_of() needs at least one frame")
+        return max(enumerate(reports), key=lambda pair: (pair[1].ok, pair[1].score))
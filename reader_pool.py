@@ -0,0 +1,234 @@
+import logging
+import threading
+import time
+import unicodedata
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Scripts of EasyOCR language codes; codes not listed use the Latin script
+LANG_SCRIPTS = {
+    "ch_sim": {"han"}, "ch_tra": {"han"}, "ja": {"han", "kana"}, "ko": {"hangul"},
+    "ru": {"cyrillic"}, "uk": {"cyrillic"}, "be": {"cyrillic"}, "bg": {"cyrillic"},
+    "mn": {"cyrillic"}, "rs_cyrillic": {"cyrillic"},
+    "ar": {"arabic"}, "fa": {"arabic"}, "ur": {"arabic"}, "ug": {"arabic"},
+    "th": {"thai"}, "hi": {"devanagari"}, "mr": {"devanagari"}, "ne": {"devanagari"},
+    "bn": {"bengali"}, "as": {"bengali"}, "ta": {"tamil"}, "te": {"telugu"}, "kn": {"kannada"},
+}
+
+# First word of a character's Unicode name -> script
+UNICODE_SCRIPTS = {
+    "LATIN": "latin", "CYRILLIC": "cyrillic", "CJK": "han", "HIRAGANA": "kana", "KATAKANA": "kana",
+    "HANGUL": "hangul", "ARABIC": "arabic", "THAI": "thai", "DEVANAGARI": "devanagari",
+    "BENGALI": "bengali", "TAMIL": "tamil", "TELUGU": "telugu", "KANNADA": "kannada",
+}
+
+
+def lang_scripts(langs):
+    return set().union(*(LANG_SCRIPTS.get(lang, {"latin"}) for lang in langs))
+
+
+def text_scripts(results, min_confidence=0.3):
+    """Letters per script in (bbox, text, prob) results, ignoring low-confidence boxes."""
+    counts = Counter()
+    for _, text, prob in results:
+        if prob < min_confidence:
+            continue
+        for ch in text:
+            if ch.isalpha():
+                script = UNICODE_SCRIPTS.get(unicodedata.name(ch, "").split(" ", 1)[0])
+                if script:
+                    counts[script] += 1
+    return counts
+
+
+def _load_easyocr(langs):
+    import easyocr
+    return easyocr.Reader(list(langs))
+
+
+def _reader_bytes(reader):
+    """Size of a reader's model weights, or None if it has no torch modules."""
+    total = None
+    for name in ("detector", "recognizer"):
+        module = getattr(reader, name, None)
+        if module is None or not hasattr(module, "parameters"):
+            continue
+        tensors = list(module.parameters()) + list(module.buffers())
+        total = (total or 0) + sum(t.numel() * t.element_size() for t in tensors)
+    return total
+
+
+class _Entry:
+    __slots__ = ("reader", "bytes", "users")
+
+    def __init__(self, reader, size):
+        self.reader = reader
+        self.bytes = size
+        self.users = 0
+
+
+class ReaderPool:
+    """
+    EasyOCR readers for several language groups, built on first use.
+
+    groups: language lists, one reader each, e.g. [["en"], ["ch_sim", "en"]].
+    EasyOCR only combines some languages in one reader, and every language
+    loaded costs memory in every process, so a bilingual deployment keeps one
+    group per script and lets detect() pick per image.
+
+    detect() runs the probe group (default: the first) on a copy downscaled
+    to probe_side and picks the group whose scripts cover most of the letters
+    it read. The probe has to be able to read the scripts it tells apart
+    (["ch_sim", "en"] reads Latin and Han); pass `detector`, a function of
+    (pool, img_array) returning a group name, to decide differently.
+
+    Readers in use are never evicted. Once the resident readers exceed
+    memory_budget_mb, the least recently used idle ones are dropped.
+    Reader size is the size of its model weights (default_reader_mb when a
+    reader has none to measure, e.g. in tests).
+    """
+
+    def __init__(self, groups, probe=None, memory_budget_mb=None, probe_side=640, loader=None,
+                 detector=None, default_reader_mb=100):
+        self.groups = OrderedDict(("+".join(langs), list(langs)) for langs in groups)
+        if not self.groups:
+            raise ValueError("ReaderPool needs at least one language group")
+        self.probe = probe or next(iter(self.groups))
+        if self.probe not in self.groups:
+            raise ValueError(f"Unknown probe group: {self.probe}")
+        self.memory_budget_mb = memory_budget_mb
+        self.probe_side = probe_side
+        self.loader = loader or _load_easyocr
+        self.detector = detector
+        self.default_reader_mb = default_reader_mb
+        self._init_state()
+
+    def _init_state(self):
+        self._lock = threading.Lock()
+        self._load_locks = {name: threading.Lock() for name in self.groups}
+        self._readers = OrderedDict()
+        self._stats = {"hits": 0, "loads": 0, "load_seconds": 0.0, "evictions": 0, "peak_resident_mb": 0.0}
+        self._detections = Counter()
+
+    # Worker processes get an empty pool with the same settings
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ("_lock", "_load_locks", "_readers", "_stats", "_detections"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_state()
+
+    def config(self):
+        """Settings that affect scan output; part of the scanner's cache key."""
+        return {"groups": list(self.groups.values()), "probe": self.probe, "probe_side": self.probe_side}
+
+    def warm_up(self):
+        """Loads the probe group, which every detect() needs."""
+        with self.use(self.probe):
+            pass
+
+    def detect(self, img_array):
+        """Name of the language group to OCR img_array with."""
+        if len(self.groups) == 1:
+            name = self.probe
+        elif self.detector is not None:
+            name = self.detector(self, img_array)
+        else:
+            name = self._detect_script(img_array)
+        with self._lock:
+            self._detections[name] += 1
+        return name
+
+    def _detect_script(self, img_array):
+        import cv2
+
+        scale = min(1.0, self.probe_side / max(img_array.shape[:2]))
+        small = img_array if scale >= 1.0 else cv2.resize(
+            img_array, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        with self.use(self.probe) as reader:
+            horizontal_list, free_list = reader.detect(small)
+            results = reader.recognize(small, horizontal_list[0], free_list[0])
+        counts = text_scripts(results)
+        if not counts:
+            return self.probe
+
+        with self._lock:
+            resident = set(self._readers)
+        # Most letters covered; ties go to the smaller group, then a loaded one
+        return max(
+            self.groups,
+            key=lambda name: (
+                sum(n for script, n in counts.items() if script in lang_scripts(self.groups[name])),
+                -len(self.groups[name]),
+                name in resident,
+            ),
+        )
+
+    @contextmanager
+    def use(self, name):
+        """Context manager yielding the reader for group `name`, loading it if needed."""
+        entry = self._acquire(name)
+        try:
+            yield entry.reader
+        finally:
+            with self._lock:
+                entry.users -= 1
+                self._evict()
+
+    def _acquire(self, name):
+        if name not in self.groups:
+            raise ValueError(f"Unknown language group: {name}")
+        # One load per group at a time; other groups load and serve meanwhile
+        with self._load_locks[name]:
+            with self._lock:
+                entry = self._readers.get(name)
+                if entry is not None:
+                    self._readers.move_to_end(name)
+                    entry.users += 1
+                    self._stats["hits"] += 1
+                    return entry
+
+            t = time.perf_counter()
+            reader = self.loader(self.groups[name])
+            seconds = time.perf_counter() - t
+            size = _reader_bytes(reader)
+            entry = _Entry(reader, size if size is not None else self.default_reader_mb * 1024 * 1024)
+            entry.users = 1
+            logger.info("OCR reader %s loaded in %.1fs (%.0f MB)", name, seconds, entry.bytes / 2**20)
+
+            with self._lock:
+                self._readers[name] = entry
+                self._stats["loads"] += 1
+                self._stats["load_seconds"] += seconds
+                self._stats["peak_resident_mb"] = max(self._stats["peak_resident_mb"], self._resident_mb())
+                self._evict()
+            return entry
+
+    def _resident_mb(self):
+        return sum(entry.bytes for entry in self._readers.values()) / 2**20
+
+    def _evict(self):
+        # Caller holds self._lock
+        if self.memory_budget_mb is None:
+            return
+        while self._resident_mb() > self.memory_budget_mb:
+            idle = next((name for name, entry in self._readers.items() if entry.users == 0), None)
+            if idle is None:
+                return
+            del self._readers[idle]
+            self._stats["evictions"] += 1
+            logger.info("OCR reader %s evicted", idle)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["resident"] = {name: round(entry.bytes / 2**20, 1) for name, entry in self._readers.items()}
+            stats["resident_mb"] = round(self._resident_mb(), 1)
+            stats["memory_budget_mb"] = self.memory_budget_mb
+            stats["detections"] = dict(self._detections)
+        return stats
@@ -0,0 +1,227 @@
+import re
+
+# Bumped when parsing output changes, so cached scan results are not reused
+PARSER_VERSION = 2
+
+# --- Precompiled patterns ---
+DATE_PATTERNS = [
+    re.compile(r'(\d{1,2}[/-]\d{1,2}[/-]\d{2,4})', re.IGNORECASE),
+    re.compile(r'(\d{4}[/-]\d{1,2}[/-]\d{1,2})', re.IGNORECASE),
+    re.compile(r'(Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)\s+\d{1,2},?\s+\d{4}', re.IGNORECASE),
+]
+
+# Price anywhere in the line: "Total: 31.17"
+PRICE_PATTERN = re.compile(r'(\d+\.\d{2})')
+# Line that is only a price: "Total\n31.17"
+LONE_PRICE_PATTERN = re.compile(r'^\s*(\d+\.\d{2})\s*$')
+# Price as the last whitespace-separated token: "Milk 3.50"
+PRICE_TOKEN_PATTERN = re.compile(r'\d+\.\d{2}')
+# Item names made only of digits/punctuation are OCR noise
+NOISE_PATTERN = re.compile(r'^[0-9\W]+$')
+DIGIT_PATTERN = re.compile(r'\d')
+
+SEPARATOR = "----------------"
+
+# Lines containing any of these are metadata, not items.
+# "TAX" is deliberately absent so tax appears as a line item.
+SKIP_WORDS = frozenset(["TOTAL", "SUBTOTAL", "CASH", "CHANGE", "DUE", "THANK", "DATE", "GROCERY"])
+
+NO_KEYWORDS = frozenset()
+
+# Rule.feed() return values
+CONTINUE = 0   # keep feeding this rule
+DONE = 1       # field found (or given up); stop feeding
+NEXT_LINE = 2  # feed the next line regardless of its keywords
+
+
+class FirstMatchRule:
+    """Field taken from the first line where extract(line, upper) returns a value."""
+
+    # None: the rule sees every line
+    triggers = None
+
+    def __init__(self, field, extract):
+        self.field = field
+        self.extract = extract
+
+    def start(self):
+        return {}
+
+    def feed(self, state, line, upper, keywords):
+        value = self.extract(line, upper)
+        if value is None:
+            return CONTINUE
+        state["value"] = value
+        return DONE
+
+    def finish(self, state, data):
+        data[self.field] = state.get("value")
+
+
+class AmountRule:
+    """
+    Amount on the first line containing keyword (and not exclude),
+    either on that line or alone on the next one.
+    """
+
+    def __init__(self, field, keyword, exclude=None):
+        self.field = field
+        self.keyword = keyword
+        self.exclude = exclude
+        # Only lines containing the keyword are fed to this rule
+        self.triggers = frozenset([keyword])
+
+    def start(self):
+        return {"pending": False}
+
+    def feed(self, state, line, upper, keywords):
+        if state["pending"]:
+            match = LONE_PRICE_PATTERN.match(line)
+            if match:
+                state["value"] = match.group(1)
+            return DONE
+
+        if self.keyword not in keywords or (self.exclude and self.exclude in keywords):
+            return CONTINUE
+
+        match = PRICE_PATTERN.search(line)
+        if match:
+            state["value"] = match.group(1)
+            return DONE
+        # Keyword without a price; look at the next line only
+        state["pending"] = True
+        return NEXT_LINE
+
+    def finish(self, state, data):
+        data[self.field] = state.get("value")
+
+
+class ItemsRule:
+    """Lines ending in a price that aren't metadata become line items."""
+
+    field = "items"
+    triggers = None
+
+    def start(self):
+        return {"candidates": []}
+
+    def feed(self, state, line, upper, keywords):
+        if (keywords and not keywords.isdisjoint(SKIP_WORDS)) or SEPARATOR in line:
+            return CONTINUE
+        # Cheap reject before splitting: the line must end in a digit
+        if not line[-1:].isdigit():
+            return CONTINUE
+        parts = line.rsplit(None, 1)
+        if len(parts) == 2 and PRICE_TOKEN_PATTERN.fullmatch(parts[1]):
+            name = parts[0].strip()
+            # Filter noise
+            if len(name) > 1 and not NOISE_PATTERN.match(name):
+                state["candidates"].append((line, {"name": name, "price": parts[1]}))
+        return CONTINUE
+
+    def finish(self, state, data):
+        # The date and merchant lines may come after an item line that repeats
+        # them, so they are filtered here instead of during the pass
+        date = data.get("date")
+        merchant = data.get("merchant")
+        data[self.field] = [
+            item for line, item in state["candidates"]
+            if not (date and date in line) and not (merchant and merchant in line)
+        ]
+
+
+def _extract_merchant(line, upper):
+    # Heuristic: first significant text line without digits
+    text = line.strip()
+    if len(text) > 3 and not DIGIT_PATTERN.search(line):
+        return text
+    return None
+
+
+def _extract_date(line, upper):
+    for pattern in DATE_PATTERNS:
+        match = pattern.search(line)
+        if match:
+            return match.group(0)
+    return None
+
+
+def default_rules():
+    return [
+        FirstMatchRule("merchant", _extract_merchant),
+        FirstMatchRule("date", _extract_date),
+        AmountRule("total", "TOTAL", exclude="SUBTOTAL"),
+        AmountRule("subtotal", "SUBTOTAL"),
+        AmountRule("tax", "TAX"),
+        ItemsRule(),
+    ]
+
+
+class ReceiptParser:
+    """
+    Single-pass receipt parser.
+    Every line is uppercased and keyword-matched once; each rule sees the
+    line in the same pass and drops out as soon as its field is found.
+    """
+
+    def __init__(self, rules=None):
+        # Rules that read other fields in finish() must come after those fields
+        self.rules = rules if rules is not None else default_rules()
+        keywords = set(SKIP_WORDS)
+        for rule in self.rules:
+            for attr in ("keyword", "exclude"):
+                if getattr(rule, attr, None):
+                    keywords.add(getattr(rule, attr))
+        # Longest first so "SUBTOTAL" wins over "TOTAL" at the same position
+        self.keyword_pattern = re.compile("|".join(
+            re.escape(k) for k in sorted(keywords, key=len, reverse=True)
+        ))
+        # findall doesn't report keywords nested inside a longer match
+        # ("TOTAL" in "SUBTOTAL"), so those are added back from this table
+        self.implied_keywords = {
+            k: frozenset(j for j in keywords if j != k and j in k) for k in keywords
+        }
+
+    def parse(self, lines):
+        rules = self.rules
+        states = [rule.start() for rule in rules]
+        # Rules without triggers see every line; the others only lines with their keywords
+        always = [i for i, rule in enumerate(rules) if rule.triggers is None]
+        triggered = [i for i, rule in enumerate(rules) if rule.triggers is not None]
+        next_line = []
+        find_keywords = self.keyword_pattern.findall
+        implied = self.implied_keywords
+
+        for line in lines:
+            if not always and not triggered:
+                break
+            upper = line.upper()
+            found = find_keywords(upper)
+
+            calls = always
+            if next_line:
+                calls = always + next_line
+                next_line = []
+            if found:
+                keywords = set(found)
+                for k in found:
+                    keywords |= implied[k]
+                calls = calls + [
+                    i for i in triggered
+                    if i not in calls and not keywords.isdisjoint(rules[i].triggers)
+                ]
+            else:
+                keywords = NO_KEYWORDS
+
+            for i in calls:
+                status = rules[i].feed(states[i], line, upper, keywords)
+                if status == DONE:
+                    always = [j for j in always if j != i]
+                    triggered = [j for j in triggered if j != i]
+                elif status == NEXT_LINE:
+                    next_line.append(i)
+
+        data = {"merchant": None, "date": None, "total": None, "items": []}
+        for rule, state in zip(rules, states):
+            rule.finish(state, data)
+        return data
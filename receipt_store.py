@@ -0,0 +1,667 @@
+import csv
+import io
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+from ocr_boxes import pack_boxes
+
+def _add_cents_columns(conn):
+    """Typed amounts in integer cents next to the text as printed on the receipt."""
+    conn.execute("ALTER TABLE receipts ADD COLUMN total_cents INTEGER")
+    conn.execute("ALTER TABLE items ADD COLUMN price_cents INTEGER")
+    # Parsed with to_cents, so existing rows get the same cents a new save would
+    conn.executemany(
+        "UPDATE receipts SET total_cents = ? WHERE id = ?",
+        [(to_cents(total), row_id) for row_id, total in conn.execute("SELECT id, total FROM receipts")],
+    )
+    conn.executemany(
+        "UPDATE items SET price_cents = ? WHERE id = ?",
+        [(to_cents(price), row_id) for row_id, price in conn.execute("SELECT id, price FROM items")],
+    )
+
+
+# Schema migrations, applied in order: SQL scripts, or functions taking the
+# connection for steps SQL can't express. PRAGMA user_version records how many ran.
+SCHEMA = [
+    """
+    CREATE TABLE receipts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL,
+        merchant TEXT,
+        date TEXT,
+        receipt_date TEXT,
+        total TEXT,
+        created_at TEXT NOT NULL
+    );
+    CREATE TABLE items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        receipt_id INTEGER NOT NULL REFERENCES receipts(id) ON DELETE CASCADE,
+        position INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        price TEXT
+    );
+    CREATE TABLE meta (
+        key TEXT PRIMARY KEY,
+        value TEXT
+    );
+    CREATE INDEX idx_receipts_username_date ON receipts(username, receipt_date);
+    CREATE INDEX idx_receipts_date ON receipts(receipt_date);
+    CREATE INDEX idx_items_receipt ON items(receipt_id);
+    """,
+    _add_cents_columns,
+    # Per-user spending rollups, kept current by _update_rollups() on every insert.
+    # Unknown merchants/months are stored as ''.
+    """
+    CREATE TABLE spend_by_merchant (
+        username TEXT NOT NULL,
+        merchant TEXT NOT NULL,
+        receipts INTEGER NOT NULL,
+        total_cents INTEGER NOT NULL,
+        PRIMARY KEY (username, merchant)
+    );
+    CREATE TABLE spend_by_month (
+        username TEXT NOT NULL,
+        month TEXT NOT NULL,
+        receipts INTEGER NOT NULL,
+        total_cents INTEGER NOT NULL,
+        PRIMARY KEY (username, month)
+    );
+    CREATE TABLE spend_by_item (
+        username TEXT NOT NULL,
+        name TEXT NOT NULL,
+        quantity INTEGER NOT NULL,
+        total_cents INTEGER NOT NULL,
+        PRIMARY KEY (username, name)
+    );
+    INSERT INTO spend_by_merchant
+    SELECT username, ifnull(merchant, ''), COUNT(*), ifnull(SUM(total_cents), 0)
+      FROM receipts GROUP BY 1, 2;
+    INSERT INTO spend_by_month
+    SELECT username, ifnull(substr(receipt_date, 1, 7), ''), COUNT(*), ifnull(SUM(total_cents), 0)
+      FROM receipts GROUP BY 1, 2;
+    INSERT INTO spend_by_item
+    SELECT r.username, upper(trim(i.name)), COUNT(*), ifnull(SUM(i.price_cents), 0)
+      FROM items i JOIN receipts r ON r.id = i.receipt_id GROUP BY 1, 2;
+    """,
+    # Raw OCR boxes (ocr_boxes.pack_boxes blobs) so receipts can be re-parsed
+    # without OCR; parser_version is the parser that produced the stored fields
+    """
+    CREATE TABLE ocr_boxes (
+        receipt_id INTEGER PRIMARY KEY REFERENCES receipts(id) ON DELETE CASCADE,
+        data BLOB NOT NULL,
+        parser_version INTEGER
+    );
+    """,
+    # Canonical merchant id from the MerchantIndex; NULL when the merchant
+    # wasn't resolved (older receipts, unknown merchants)
+    """
+    ALTER TABLE receipts ADD COLUMN merchant_id TEXT;
+    """,
+]
+
+DATE_FORMATS = ["%m/%d/%Y", "%m-%d-%Y", "%m/%d/%y", "%m-%d-%y", "%Y/%m/%d", "%Y-%m-%d", "%b %d, %Y", "%b %d %Y"]
+
+# Sort keys accepted by query_history(), mapped to SQL expressions
+SORT_COLUMNS = {
+    "date": "r.receipt_date",
+    "merchant": "r.merchant",
+    "total": "r.total_cents",
+    "saved": "r.id",
+}
+
+HISTORY_COLUMNS = ["Username", "Merchant", "Date", "Total", "Items"]
+
+# Rollup tables read by spending_rollup(): kind -> (table, key column, count column)
+ROLLUPS = {
+    "merchant": ("spend_by_merchant", "merchant", "receipts"),
+    "month": ("spend_by_month", "month", "receipts"),
+    "item": ("spend_by_item", "name", "quantity"),
+}
+
+# "Milk (3.50)" from the legacy CSV "Items" column
+LEGACY_ITEM_PATTERN = re.compile(r'^(.*)\s+\(([^()]*)\)$')
+
+# Columns available to export_parquet(): name -> (SQL expression, Arrow type)
+EXPORT_COLUMNS = {
+    "receipts": {
+        "receipt_id": ("r.id", "int64"),
+        "username": ("r.username", "string"),
+        "merchant": ("r.merchant", "string"),
+        "merchant_id": ("r.merchant_id", "string"),
+        "date": ("r.date", "string"),
+        "receipt_date": ("r.receipt_date", "date32"),
+        "total_cents": ("r.total_cents", "int64"),
+        "created_at": ("r.created_at", "string"),
+    },
+    "items": {
+        "receipt_id": ("i.receipt_id", "int64"),
+        "position": ("i.position", "int32"),
+        "name": ("i.name", "string"),
+        "price": ("i.price", "string"),
+        "price_cents": ("i.price_cents", "int64"),
+        "username": ("r.username", "string"),
+        "receipt_date": ("r.receipt_date", "date32"),
+    },
+}
+
+
+def to_cents(value):
+    """Parses an amount such as "3.50" (or a number) into integer cents; None if it isn't one."""
+    if value is None:
+        return None
+    try:
+        amount = Decimal(str(value).strip().replace(",", ""))
+    except InvalidOperation:
+        return None
+    if not amount.is_finite():
+        return None
+    return int((amount * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def format_cents(cents):
+    """Integer cents back to a "3.50" string."""
+    return None if cents is None else str(Decimal(cents).scaleb(-2))
+
+
+def parse_receipt_date(date_str):
+    """Normalizes a date as printed on the receipt to ISO format, or None."""
+    if not date_str:
+        return None
+    text = str(date_str).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+class ReceiptStore:
+    """
+    SQLite-backed receipt storage.
+    Each save is a single transaction appending one receipt row and its
+    line items, so cost does not depend on how much history exists and
+    concurrent saves don't overwrite each other.
+    """
+
+    def __init__(self, path="receipts.db"):
+        self.path = path
+        self._local = threading.local()
+        self._ensure_schema()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA foreign_keys = ON")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _ensure_schema(self):
+        conn = self._connect()
+        # WAL lets readers (history view) run while another session saves
+        conn.execute("PRAGMA journal_mode = WAL")
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for i, step in enumerate(SCHEMA[version:], start=version + 1):
+            if not callable(step):
+                conn.executescript(f"BEGIN; {step} PRAGMA user_version = {i}; COMMIT;")
+                continue
+            conn.execute("BEGIN")
+            try:
+                step(conn)
+                conn.execute(f"PRAGMA user_version = {i}")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # --- Writes ---
+    def save_receipt(self, username, merchant, date, total, items, boxes=None, parser_version=None,
+                     merchant_id=None):
+        """
+        Appends a receipt and its line items. Returns the new receipt id.
+        boxes: the raw (bbox, text, prob) OCR output, stored for later re-parsing
+        parser_version: version of the parser that produced the fields
+        merchant_id: canonical merchant id (see MerchantIndex), if resolved
+        """
+        conn = self._connect()
+        with conn:
+            receipt_id = self._insert_receipt(conn, username, merchant, date, total, items, merchant_id=merchant_id)
+            if boxes:
+                conn.execute(
+                    "INSERT INTO ocr_boxes (receipt_id, data, parser_version) VALUES (?, ?, ?)",
+                    (receipt_id, pack_boxes(boxes), parser_version),
+                )
+            self._bump_version(conn)
+            return receipt_id
+
+    def update_receipts(self, changes, parser_version=None):
+        """
+        Rewrites the fields and items of existing receipts in one transaction.
+        changes: iterable of dicts with receipt_id, merchant, date, total, items
+        and optionally merchant_id.
+        Rollups are adjusted; stored OCR boxes get parser_version.
+        Returns the number of receipts updated.
+        """
+        conn = self._connect()
+        count = 0
+        with conn:
+            for change in changes:
+                receipt_id = change["receipt_id"]
+                self._remove_from_rollups(conn, receipt_id)
+                conn.execute(
+                    "UPDATE receipts SET merchant = ?, merchant_id = ?, date = ?, receipt_date = ?, total = ?, "
+                    "total_cents = ? WHERE id = ?",
+                    (
+                        change["merchant"],
+                        change.get("merchant_id"),
+                        change["date"],
+                        parse_receipt_date(change["date"]),
+                        None if change["total"] is None else str(change["total"]),
+                        to_cents(change["total"]),
+                        receipt_id,
+                    ),
+                )
+                conn.execute("DELETE FROM items WHERE receipt_id = ?", (receipt_id,))
+                self._insert_items(conn, receipt_id, change["items"])
+                self._update_rollups(conn, receipt_id)
+                if parser_version is not None:
+                    conn.execute(
+                        "UPDATE ocr_boxes SET parser_version = ? WHERE receipt_id = ?", (parser_version, receipt_id)
+                    )
+                count += 1
+            if count:
+                self._bump_version(conn)
+        return count
+
+    def mark_parsed(self, receipt_ids, parser_version):
+        """Records that the stored fields of receipt_ids are current for parser_version."""
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "UPDATE ocr_boxes SET parser_version = ? WHERE receipt_id = ?",
+                [(parser_version, receipt_id) for receipt_id in receipt_ids],
+            )
+
+    def _bump_version(self, conn):
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('data_version', '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+
+    def version(self):
+        """Counter bumped by every write; lets callers cache query results until it changes."""
+        row = self._connect().execute("SELECT value FROM meta WHERE key = 'data_version'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _insert_receipt(self, conn, username, merchant, date, total, items, created_at=None, merchant_id=None):
+        cur = conn.execute(
+            "INSERT INTO receipts (username, merchant, merchant_id, date, receipt_date, total, total_cents, "
+            "created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                username,
+                merchant,
+                merchant_id,
+                date,
+                parse_receipt_date(date),
+                None if total is None else str(total),
+                to_cents(total),
+                created_at or datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            ),
+        )
+        receipt_id = cur.lastrowid
+        self._insert_items(conn, receipt_id, items)
+        self._update_rollups(conn, receipt_id)
+        return receipt_id
+
+    def _insert_items(self, conn, receipt_id, items):
+        conn.executemany(
+            "INSERT INTO items (receipt_id, position, name, price, price_cents) VALUES (?, ?, ?, ?, ?)",
+            [
+                (receipt_id, pos, item["name"], None if item.get("price") is None else str(item["price"]),
+                 to_cents(item.get("price")))
+                for pos, item in enumerate(items or [])
+            ],
+        )
+
+    def _update_rollups(self, conn, receipt_id):
+        # Runs inside the insert's transaction, touching one row per rollup
+        # (one per distinct item name), so saves stay O(receipt size)
+        conn.execute(
+            "INSERT INTO spend_by_merchant (username, merchant, receipts, total_cents) "
+            "SELECT username, ifnull(merchant, ''), 1, ifnull(total_cents, 0) FROM receipts WHERE id = ? "
+            "ON CONFLICT (username, merchant) DO UPDATE SET "
+            "receipts = receipts + 1, total_cents = total_cents + excluded.total_cents",
+            (receipt_id,),
+        )
+        conn.execute(
+            "INSERT INTO spend_by_month (username, month, receipts, total_cents) "
+            "SELECT username, ifnull(substr(receipt_date, 1, 7), ''), 1, ifnull(total_cents, 0) "
+            "FROM receipts WHERE id = ? "
+            "ON CONFLICT (username, month) DO UPDATE SET "
+            "receipts = receipts + 1, total_cents = total_cents + excluded.total_cents",
+            (receipt_id,),
+        )
+        conn.execute(
+            "INSERT INTO spend_by_item (username, name, quantity, total_cents) "
+            "SELECT r.username, upper(trim(i.name)), COUNT(*), ifnull(SUM(i.price_cents), 0) "
+            "FROM items i JOIN receipts r ON r.id = i.receipt_id WHERE i.receipt_id = ? GROUP BY 1, 2 "
+            "ON CONFLICT (username, name) DO UPDATE SET "
+            "quantity = quantity + excluded.quantity, total_cents = total_cents + excluded.total_cents",
+            (receipt_id,),
+        )
+
+    # --- Reads ---
+    def get_receipt(self, receipt_id):
+        conn = self._connect()
+        row = conn.execute("SELECT * FROM receipts WHERE id = ?", (receipt_id,)).fetchone()
+        if row is None:
+            return None
+        receipt = dict(row)
+        receipt["items"] = [
+            {"name": r["name"], "price": r["price"], "price_cents": r["price_cents"]}
+            for r in conn.execute(
+                "SELECT name, price, price_cents FROM items WHERE receipt_id = ? ORDER BY position", (receipt_id,)
+            )
+        ]
+        return receipt
+
+    def count_receipts(self, username=None):
+        conn = self._connect()
+        if username is None:
+            return conn.execute("SELECT COUNT(*) FROM receipts").fetchone()[0]
+        return conn.execute("SELECT COUNT(*) FROM receipts WHERE username = ?", (username,)).fetchone()[0]
+
+    def _remove_from_rollups(self, conn, receipt_id):
+        # Inverse of _update_rollups(), for a receipt about to be rewritten
+        row = conn.execute(
+            "SELECT username, ifnull(merchant, ''), ifnull(substr(receipt_date, 1, 7), ''), ifnull(total_cents, 0) "
+            "FROM receipts WHERE id = ?",
+            (receipt_id,),
+        ).fetchone()
+        if row is None:
+            return
+        username, merchant, month, total_cents = row
+        conn.execute(
+            "UPDATE spend_by_merchant SET receipts = receipts - 1, total_cents = total_cents - ? "
+            "WHERE username = ? AND merchant = ?",
+            (total_cents, username, merchant),
+        )
+        conn.execute(
+            "UPDATE spend_by_month SET receipts = receipts - 1, total_cents = total_cents - ? "
+            "WHERE username = ? AND month = ?",
+            (total_cents, username, month),
+        )
+        conn.executemany(
+            "UPDATE spend_by_item SET quantity = quantity - ?, total_cents = total_cents - ? "
+            "WHERE username = ? AND name = ?",
+            [
+                (quantity, cents, username, name)
+                for name, quantity, cents in conn.execute(
+                    "SELECT upper(trim(name)), COUNT(*), ifnull(SUM(price_cents), 0) FROM items "
+                    "WHERE receipt_id = ? GROUP BY 1",
+                    (receipt_id,),
+                )
+            ],
+        )
+        conn.execute("DELETE FROM spend_by_merchant WHERE username = ? AND receipts <= 0", (username,))
+        conn.execute("DELETE FROM spend_by_month WHERE username = ? AND receipts <= 0", (username,))
+        conn.execute("DELETE FROM spend_by_item WHERE username = ? AND quantity <= 0", (username,))
+
+    def iter_stored_scans(self, chunk_size=500, skip_parser_version=None):
+        """
+        Yields every receipt that has stored OCR boxes as a dict with
+        receipt_id, merchant, merchant_id, date, total, items and boxes (the
+        packed blob).
+        Pages by id, so no cursor stays open and writes between chunks are safe.
+        skip_parser_version: leave out receipts already parsed by this version
+        """
+        conn = self._connect()
+        last_id = 0
+        while True:
+            sql = ("SELECT r.id, r.merchant, r.merchant_id, r.date, r.total, b.data FROM receipts r "
+                   "JOIN ocr_boxes b ON b.receipt_id = r.id WHERE r.id > ?")
+            params = [last_id]
+            if skip_parser_version is not None:
+                sql += " AND (b.parser_version IS NULL OR b.parser_version != ?)"
+                params.append(skip_parser_version)
+            rows = conn.execute(sql + " ORDER BY r.id LIMIT ?", params + [chunk_size]).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+
+            items = {}
+            placeholders = ", ".join("?" * len(rows))
+            for r in conn.execute(
+                f"SELECT receipt_id, name, price FROM items WHERE receipt_id IN ({placeholders}) "
+                "ORDER BY receipt_id, position",
+                [row[0] for row in rows],
+            ):
+                items.setdefault(r[0], []).append({"name": r[1], "price": r[2]})
+
+            for receipt_id, merchant, merchant_id, date, total, data in rows:
+                yield {
+                    "receipt_id": receipt_id,
+                    "merchant": merchant,
+                    "merchant_id": merchant_id,
+                    "date": date,
+                    "total": total,
+                    "items": items.get(receipt_id, []),
+                    "boxes": data,
+                }
+
+    def merchant_names(self):
+        """Distinct merchant names across all users, for seeding a MerchantIndex."""
+        conn = self._connect()
+        return [row[0] for row in conn.execute(
+            "SELECT DISTINCT merchant FROM spend_by_merchant WHERE merchant != '' ORDER BY merchant"
+        )]
+
+    def spending_rollup(self, username, kind, limit=None):
+        """
+        Rows of one rollup ("merchant", "month" or "item") for a user as
+        (key, count, total_cents), biggest spend first (months in calendar order).
+        Reads only the rollup table, so cost doesn't grow with the history.
+        """
+        table, key, count = ROLLUPS[kind]
+        order = f"{key} ASC" if kind == "month" else "total_cents DESC"
+        sql = f"SELECT {key}, {count}, total_cents FROM {table} WHERE username = ? ORDER BY {order}"
+        params = [username]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [tuple(r) for r in self._connect().execute(sql, params)]
+
+    def spending_summary(self, username):
+        """Receipt count and total spend in cents for a user, from the month rollup."""
+        row = self._connect().execute(
+            "SELECT ifnull(SUM(receipts), 0), ifnull(SUM(total_cents), 0) FROM spend_by_month WHERE username = ?",
+            (username,),
+        ).fetchone()
+        return {"receipts": row[0], "total_cents": row[1]}
+
+    def _history_filter(self, username, start_date=None, end_date=None):
+        clauses = ["1 = 1"]
+        params = []
+        if username is not None:
+            clauses.append("r.username = ?")
+            params.append(username)
+        # Dates are ISO strings (YYYY-MM-DD) or date objects, compared against receipt_date
+        if start_date:
+            clauses.append("r.receipt_date >= ?")
+            params.append(str(start_date))
+        if end_date:
+            clauses.append("r.receipt_date <= ?")
+            params.append(str(end_date))
+        return " AND ".join(clauses), params
+
+    def count_history(self, username, start_date=None, end_date=None):
+        where, params = self._history_filter(username, start_date, end_date)
+        return self._connect().execute(f"SELECT COUNT(*) FROM receipts r WHERE {where}", params).fetchone()[0]
+
+    def _history_cursor(self, username, start_date=None, end_date=None, sort_by="date",
+                        descending=True, limit=None, offset=0):
+        if sort_by not in SORT_COLUMNS:
+            raise ValueError(f"Unknown sort column: {sort_by}")
+        where, params = self._history_filter(username, start_date, end_date)
+        direction = "DESC" if descending else "ASC"
+        sql = f"""
+            SELECT r.username AS Username, r.merchant AS Merchant, r.date AS Date, r.total AS Total,
+                   (SELECT group_concat(name || ' (' || ifnull(price, '') || ')', '; ')
+                      FROM (SELECT name, price FROM items WHERE receipt_id = r.id ORDER BY position)) AS Items
+              FROM receipts r
+             WHERE {where}
+             ORDER BY {SORT_COLUMNS[sort_by]} {direction}, r.id {direction}
+        """
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [limit, offset]
+        return self._connect().execute(sql, params)
+
+    def query_history(self, username, start_date=None, end_date=None, sort_by="date",
+                      descending=True, page=0, page_size=50):
+        """
+        One page of a user's history in the legacy CSV layout (Items flattened to a string).
+        Filtering, sorting and paging all run in SQLite on the (username, receipt_date) index.
+        """
+        cur = self._history_cursor(
+            username, start_date, end_date, sort_by, descending,
+            limit=page_size, offset=page * page_size,
+        )
+        return [dict(r) for r in cur.fetchall()]
+
+    def iter_history_csv(self, username, start_date=None, end_date=None, sort_by="date",
+                         descending=True, chunk_size=1000):
+        """Yields a user's history as CSV text, chunk_size rows at a time."""
+        cur = self._history_cursor(username, start_date, end_date, sort_by, descending)
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(HISTORY_COLUMNS)
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            writer.writerows(tuple(r) for r in rows)
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        if buf.tell():
+            yield buf.getvalue()
+
+    # --- Columnar export ---
+    @staticmethod
+    def export_schema(table="receipts", columns=None):
+        """Arrow schema of an export of the given table and columns (default: all)."""
+        import pyarrow as pa
+
+        spec = EXPORT_COLUMNS[table]
+        columns = list(columns or spec)
+        unknown = [c for c in columns if c not in spec]
+        if unknown:
+            raise ValueError(f"Unknown {table} columns: {', '.join(unknown)}")
+        types = {"int64": pa.int64(), "int32": pa.int32(), "string": pa.string(), "date32": pa.date32()}
+        return pa.schema([(c, types[spec[c][1]]) for c in columns])
+
+    def iter_record_batches(self, table="receipts", columns=None, username=None, start_date=None,
+                            end_date=None, batch_size=10000):
+        """
+        Yields pyarrow RecordBatches of the receipts or items table.
+        Only the requested columns are selected from SQLite; username=None exports every user.
+        """
+        import pyarrow as pa
+
+        schema = self.export_schema(table, columns)
+        spec = EXPORT_COLUMNS[table]
+        columns = schema.names
+
+        where, params = self._history_filter(username, start_date, end_date)
+        select = ", ".join(spec[c][0] for c in columns)
+        if table == "items":
+            sql = (f"SELECT {select} FROM items i JOIN receipts r ON r.id = i.receipt_id "
+                   f"WHERE {where} ORDER BY i.receipt_id, i.position")
+        else:
+            sql = f"SELECT {select} FROM receipts r WHERE {where} ORDER BY r.id"
+
+        cur = self._connect().execute(sql, params)
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            arrays = []
+            for field, values in zip(schema, zip(*rows)):
+                if field.type == pa.date32():
+                    # receipt_date is stored as an ISO string
+                    arrays.append(pa.array(values, type=pa.string()).cast(pa.date32()))
+                else:
+                    arrays.append(pa.array(values, type=field.type))
+            yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    def export_parquet(self, target, table="receipts", columns=None, username=None, start_date=None,
+                       end_date=None, compression="zstd"):
+        """
+        Writes the receipts or items table to Parquet, one row group per batch.
+        target: file path or binary file object. Returns the number of rows written.
+        """
+        import pyarrow.parquet as pq
+
+        rows = 0
+        with pq.ParquetWriter(target, self.export_schema(table, columns), compression=compression) as writer:
+            for batch in self.iter_record_batches(table, columns, username, start_date, end_date):
+                writer.write_batch(batch)
+                rows += batch.num_rows
+        return rows
+
+    # --- Migration ---
+    def migrate_from_csv(self, csv_path):
+        """
+        One-shot import of the legacy receipts_db.csv.
+        Returns the number of receipts imported (0 if already migrated or no file).
+        """
+        if not os.path.exists(csv_path):
+            return 0
+
+        conn = self._connect()
+        marker = f"migrated_csv:{os.path.abspath(csv_path)}"
+        if conn.execute("SELECT 1 FROM meta WHERE key = ?", (marker,)).fetchone():
+            return 0
+
+        count = 0
+        with conn, open(csv_path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                items = []
+                for part in (row.get("Items") or "").split("; "):
+                    part = part.strip()
+                    if not part:
+                        continue
+                    match = LEGACY_ITEM_PATTERN.match(part)
+                    if match:
+                        items.append({"name": match.group(1), "price": match.group(2) or None})
+                    else:
+                        items.append({"name": part, "price": None})
+                self._insert_receipt(
+                    conn,
+                    row.get("Username") or "",
+                    row.get("Merchant") or None,
+                    row.get("Date") or None,
+                    row.get("Total") or None,
+                    items,
+                )
+                count += 1
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?)",
+                (marker, datetime.now(timezone.utc).isoformat(timespec="seconds")),
+            )
+            self._bump_version(conn)
+        return count
@@ -0,0 +1,160 @@
+"""
+Re-parse stored receipts without OCR.
+
+    python reparse.py --db receipts.db --workers 4 --dry-run
+
+Receipts saved with their raw OCR boxes are re-grouped and re-parsed with the
+current parser, in worker processes. Receipts whose merchant, date, total or
+items change are rewritten in chunks (one transaction each, rollups kept in
+step); the rest are only marked as parsed by the current PARSER_VERSION, so a
+second run skips them. --dry-run reports the differences and writes nothing.
+
+Merchants are resolved against merchants.csv and the merchants already
+saved, like in the app, and their ids are stored too. Receipts saved before
+merchant ids were stored get them from one run with --all.
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from merchant_index import MerchantIndex
+from ocr_boxes import unpack_boxes
+from ocr_demo import ReceiptScanner
+from receipt_parser import PARSER_VERSION
+from receipt_store import ReceiptStore, to_cents
+
+FIELDS = ("merchant", "merchant_id", "date", "total", "items")
+
+_scanner = None
+
+
+def _init_worker(merchant_index):
+    global _scanner
+    # Grouping and parsing only; the OCR reader is never loaded
+    _scanner = ReceiptScanner()
+    _scanner.merchant_index = merchant_index
+
+
+def _reparse(blob):
+    text_lines = _scanner._group_text_lines(unpack_boxes(blob))
+    lines = [line.text for line in text_lines]
+    data = _scanner._parse_lines(lines)
+    _scanner.merchant_index.resolve(data, lines)
+    return {field: data.get(field) for field in FIELDS}
+
+
+def _normalized(record, field):
+    # Amounts compare in cents: the store keeps "3.5" where the parser says "3.50"
+    value = record[field]
+    if field == "total":
+        return to_cents(value)
+    if field == "items":
+        return [(item["name"], to_cents(item.get("price"))) for item in value or []]
+    return value
+
+
+def changed_fields(stored, parsed):
+    return [field for field in FIELDS if _normalized(stored, field) != _normalized(parsed, field)]
+
+
+def iter_reparsed(scans, pool, window):
+    """
+    Yields (stored, parsed) pairs in input order, keeping at most `window`
+    receipts in flight so memory doesn't grow with the database.
+    """
+    pending = []
+    for stored in scans:
+        pending.append((stored, pool.submit(_reparse, stored.pop("boxes"))))
+        if len(pending) >= window:
+            stored, future = pending.pop(0)
+            yield stored, future.result()
+    for stored, future in pending:
+        yield stored, future.result()
+
+
+def run(args):
+    store = ReceiptStore(args.db)
+    # Same merchant resolution as the app: known merchants plus those saved
+    merchant_index = MerchantIndex()
+    if args.merchants and os.path.exists(args.merchants):
+        merchant_index.load_csv(args.merchants)
+    for name in store.merchant_names():
+        merchant_index.learn(name)
+    skip_version = None if args.all else PARSER_VERSION
+    scanned = 0
+    changed = 0
+    field_counts = Counter()
+    examples = []
+    changes = []
+    unchanged = []
+    written = 0
+    start = time.monotonic()
+
+    def flush():
+        nonlocal written
+        if args.dry_run:
+            changes.clear()
+            unchanged.clear()
+            return
+        written += store.update_receipts(changes, parser_version=PARSER_VERSION)
+        store.mark_parsed(unchanged, PARSER_VERSION)
+        changes.clear()
+        unchanged.clear()
+
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                             initargs=(merchant_index,)) as pool:
+        scans = store.iter_stored_scans(chunk_size=args.chunk_size, skip_parser_version=skip_version)
+        for stored, parsed in iter_reparsed(scans, pool, window=args.workers * 4):
+            scanned += 1
+            fields = changed_fields(stored, parsed)
+            if fields:
+                changed += 1
+                field_counts.update(fields)
+                if len(examples) < args.examples:
+                    examples.append((stored, parsed, fields))
+                parsed["receipt_id"] = stored["receipt_id"]
+                changes.append(parsed)
+            else:
+                unchanged.append(stored["receipt_id"])
+            if len(changes) + len(unchanged) >= args.chunk_size:
+                flush()
+        flush()
+
+    elapsed = time.monotonic() - start
+    print(f"{scanned} receipts re-parsed in {elapsed:.1f}s with parser version {PARSER_VERSION}")
+    print(f"{changed} changed" + (" (dry run, nothing written)" if args.dry_run else f", {written} updated"))
+    for field in FIELDS:
+        if field_counts[field]:
+            print(f"  {field}: {field_counts[field]}")
+    for stored, parsed, fields in examples:
+        print(f"\nReceipt {stored['receipt_id']}:")
+        for field in fields:
+            print(f"  {field}: {stored[field]!r} -> {parsed[field]!r}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-parse stored OCR boxes with the current parser.")
+    parser.add_argument("--db", default="receipts.db", help="receipt database (default: receipts.db)")
+    parser.add_argument("--merchants", default="merchants.csv",
+                        help="known merchants as merchant_id,name rows (default: merchants.csv, if present)")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=500, help="receipts read and written per transaction")
+    parser.add_argument("--all", action="store_true",
+                        help="also re-parse receipts already parsed by the current parser version")
+    parser.add_argument("--dry-run", action="store_true", help="report differences without writing")
+    parser.add_argument("--examples", type=int, default=5, help="changed receipts to show in the summary")
+    args = parser.parse_args(argv)
+
+    try:
+        return run(args)
+    except KeyboardInterrupt:
+        sys.stderr.write("Interrupted; chunks already written are kept, re-run to continue.\n")
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import copy
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+class ScanCache:
+    """
+    Content-addressed cache for ReceiptScanner results.
+    Entries are keyed by a hash of the image bytes plus the scanner config,
+    so the same receipt uploaded under a different filename is still a hit.
+
+    Two tiers:
+      - in-memory LRU (max_entries results)
+      - optional on-disk JSON store in cache_dir, evicted oldest-first
+        once it grows past max_disk_bytes
+    """
+
+    def __init__(self, max_entries=256, cache_dir=None, max_disk_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "memory_hits": 0, "disk_hits": 0, "evictions": 0}
+
+        self._disk_bytes = 0
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, _, size in self._disk_entries())
+
+    @staticmethod
+    def make_key(image_bytes, config=None):
+        h = hashlib.sha256()
+        h.update(image_bytes)
+        # Config is part of the key: a different language list or threshold
+        # can produce a different result for the same image
+        h.update(json.dumps(config or {}, sort_keys=True).encode("utf-8"))
+        return h.hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self._stats["hits"] += 1
+                self._stats["memory_hits"] += 1
+                return copy.deepcopy(self._memory[key])
+
+        result = self._disk_get(key)
+        with self._lock:
+            if result is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits"] += 1
+            self._stats["disk_hits"] += 1
+            self._memory_put(key, result)
+        return copy.deepcopy(result)
+
+    def put(self, key, result):
+        # Never cache failures, the next attempt may succeed
+        if not result or "error" in result:
+            return
+        result = copy.deepcopy(result)
+        with self._lock:
+            self._memory_put(key, result)
+        self._disk_put(key, result)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self.cache_dir:
+                for path, _, _ in self._disk_entries():
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                self._disk_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["disk_bytes"] = self._disk_bytes
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    # --- Memory tier ---
+    def _memory_put(self, key, result):
+        self._memory[key] = result
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    # --- Disk tier ---
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _disk_entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((path, st.st_mtime, st.st_size))
+        return entries
+
+    def _disk_get(self, key):
+        if not self.cache_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                result = json.load(f)
+            # Touch so eviction treats it as recently used
+            os.utime(path, None)
+            return result
+        except (OSError, ValueError):
+            return None
+
+    def _disk_put(self, key, result):
+        if not self.cache_dir:
+            return
+        path = self._disk_path(key)
+        data = json.dumps(result).encode("utf-8")
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            existed = os.path.exists(path)
+            old_size = os.path.getsize(path) if existed else 0
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+
+        with self._lock:
+            self._disk_bytes += len(data) - old_size
+            if self._disk_bytes > self.max_disk_bytes:
+                self._evict_disk()
+
+    def _evict_disk(self):
+        # Oldest mtime first; get() touches entries on hit
+        entries = sorted(self._disk_entries(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            self._stats["evictions"] += 1
+        self._disk_bytes = total
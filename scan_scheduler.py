@@ -0,0 +1,204 @@
+import asyncio
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+import numpy as np
+
+from image_io import image_fingerprint
+
+
+class QueueFull(Exception):
+    """Raised by ScanScheduler.submit() when the queue (or the user's share of it) is full."""
+
+
+class _Job:
+    __slots__ = ("key", "user", "image", "submitted_at", "started_at", "waiters")
+
+    def __init__(self, key, user, image):
+        self.key = key
+        self.user = user
+        self.image = image
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        # One Future per submit() call that was coalesced into this job
+        self.waiters = []
+
+
+class ScanScheduler:
+    """
+    Process-wide front door to a shared ReceiptScanner.
+
+    - bounded queue: submit() raises QueueFull beyond max_queue jobs, or
+      beyond max_per_user jobs for one user
+    - concurrency limit: at most max_concurrency scans run at once
+    - fairness: users are served round-robin, so one user's stack of
+      uploads can't starve everyone else
+    - coalescing: an image that is already queued or running (same content)
+      joins that job instead of being scanned twice
+
+    submit() returns a concurrent.futures.Future right away; callers poll
+    done() or block on result(). scan_async() wraps it for asyncio.
+    """
+
+    def __init__(self, scanner, max_concurrency=1, max_queue=64, max_per_user=8, history=500):
+        self.scanner = scanner
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+
+        self._cond = threading.Condition()
+        # user -> deque of jobs; the first user in the dict is served next
+        self._queues = OrderedDict()
+        # key -> job, for jobs queued or running
+        self._in_flight = {}
+        self._queued = 0
+        self._running = 0
+        self._closed = False
+
+        self._counts = {"submitted": 0, "coalesced": 0, "rejected": 0, "completed": 0, "failed": 0}
+        self._wait_ms = deque(maxlen=history)
+        self._scan_ms = deque(maxlen=history)
+
+        self._workers = [
+            threading.Thread(target=self._worker_loop, name=f"scan-worker-{i}", daemon=True)
+            for i in range(max_concurrency)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, user, image, key=None):
+        """
+        Queues a scan of image for user and returns a Future of the scan() result.
+        key identifies the image content for coalescing; by default it's the
+        sha256 of the image bytes.
+        """
+        if key is None:
+            key = hashlib.sha256(image_fingerprint(image)).hexdigest()
+        caller = Future()
+
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("ScanScheduler is shut down")
+            self._counts["submitted"] += 1
+
+            job = self._in_flight.get(key)
+            if job is not None:
+                if job.started_at is not None:
+                    # Joining a running scan: the caller can no longer cancel it
+                    caller.set_running_or_notify_cancel()
+                job.waiters.append(caller)
+                self._counts["coalesced"] += 1
+                return caller
+
+            user_queue = self._queues.get(user)
+            if self._queued >= self.max_queue:
+                self._counts["rejected"] += 1
+                raise QueueFull(f"Scan queue is full ({self._queued} waiting)")
+            if user_queue is not None and len(user_queue) >= self.max_per_user:
+                self._counts["rejected"] += 1
+                raise QueueFull(f"Too many scans queued for {user}")
+
+            job = _Job(key, user, image)
+            job.waiters.append(caller)
+            if user_queue is None:
+                user_queue = self._queues[user] = deque()
+            user_queue.append(job)
+            self._in_flight[key] = job
+            self._queued += 1
+            self._cond.notify()
+        return caller
+
+    async def scan_async(self, user, image, key=None):
+        return await asyncio.wrap_future(self.submit(user, image, key))
+
+    def stats(self):
+        with self._cond:
+            wait_ms = np.asarray(self._wait_ms) if self._wait_ms else None
+            scan_ms = np.asarray(self._scan_ms) if self._scan_ms else None
+            return {
+                "queued": self._queued,
+                "running": self._running,
+                "per_user": {user: len(q) for user, q in self._queues.items()},
+                "wait_p50_ms": float(np.percentile(wait_ms, 50)) if wait_ms is not None else 0.0,
+                "wait_p95_ms": float(np.percentile(wait_ms, 95)) if wait_ms is not None else 0.0,
+                "scan_mean_ms": float(scan_ms.mean()) if scan_ms is not None else 0.0,
+                **self._counts,
+            }
+
+    def estimated_wait(self, user):
+        """Rough seconds until a new job for user would start, from recent scan times."""
+        with self._cond:
+            if not self._scan_ms:
+                return None
+            mean_s = float(np.mean(self._scan_ms)) / 1000
+            # Round-robin: every other waiting user gets a turn per round
+            ahead = len(self._queues.get(user, ())) * len(self._queues) + self._running
+        return ahead * mean_s / self.max_concurrency
+
+    def shutdown(self, wait=True):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def _next_job(self):
+        # Caller holds the lock. Take from the first user, then move them to the back.
+        user, user_queue = next(iter(self._queues.items()))
+        job = user_queue.popleft()
+        del self._queues[user]
+        if user_queue:
+            self._queues[user] = user_queue
+        self._queued -= 1
+        return job
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._queues and not self._closed:
+                    self._cond.wait()
+                if not self._queues:
+                    return
+                job = self._next_job()
+                # Cancelled callers drop out here; once running, a Future can't be
+                # cancelled, so results are never set on a cancelled one
+                job.waiters = [w for w in job.waiters if w.set_running_or_notify_cancel()]
+                # Nobody is waiting any more (all callers cancelled); skip the scan
+                if not job.waiters:
+                    del self._in_flight[job.key]
+                    continue
+                job.started_at = time.monotonic()
+                self._wait_ms.append((job.started_at - job.submitted_at) * 1000)
+                self._running += 1
+
+            error = None
+            result = None
+            try:
+                result = self.scanner.scan(job.image)
+            except Exception as e:
+                error = e
+
+            with self._cond:
+                # Late joiners can no longer attach once the job leaves _in_flight
+                del self._in_flight[job.key]
+                self._running -= 1
+                self._scan_ms.append((time.monotonic() - job.started_at) * 1000)
+                self._counts["failed" if error is not None else "completed"] += 1
+                waiters = list(job.waiters)
+            job.image = None
+
+            for i, waiter in enumerate(waiters):
+                if error is not None:
+                    waiter.set_exception(error)
+                    continue
+                try:
+                    # Each caller gets its own copy so sessions can't mutate each other's results
+                    waiter.set_result(result if i == 0 else copy.deepcopy(result))
+                except Exception as e:
+                    # A result that can't be copied fails that caller, not the worker thread
+                    waiter.set_exception(e)
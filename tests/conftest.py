@@ -0,0 +1,25 @@
+import glob
+import json
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from create_sample_receipt import generate_corpus  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def sample_corpus(tmp_path_factory):
+    """Ground truth of 40 generated receipts (image path under "path")."""
+    out_dir = tmp_path_factory.mktemp("corpus")
+    generate_corpus(str(out_dir), count=40, seed=0)
+    truths = []
+    for json_path in sorted(glob.glob(os.path.join(out_dir, "*.json"))):
+        with open(json_path, encoding="utf-8") as f:
+            truth = json.load(f)
+        truth["path"] = os.path.join(out_dir, truth["image"])
+        truths.append(truth)
+    return truths
@@ -0,0 +1,13 @@
+from batch_scan import Checkpoint
+
+
+def test_checkpoint_is_on_disk_after_every_record(tmp_path):
+    path = str(tmp_path / "run.ckpt")
+    checkpoint = Checkpoint(path, "run")
+    for index in (0, 2, 1, 4):
+        checkpoint.mark_done(index)
+        # A crash right after this record resumes without scanning it again
+        resumed = Checkpoint(path, "run")
+        assert resumed.is_done(index)
+    assert resumed.done_through == 3 and resumed.extra == {4}
+    assert not resumed.is_done(3)
@@ -0,0 +1,145 @@
+import os
+
+from image_io import image_fingerprint
+from merchant_index import MerchantIndex, bounded_distance, normalize
+from ocr_demo import ReceiptScanner
+from receipt_store import ReceiptStore
+from scan_cache import ScanCache
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _index():
+    index = MerchantIndex()
+    index.add("Grocery Store", "grocery")
+    index.add("Tech Haven", "tech")
+    index.add("TechHaven Outlet", "tech")
+    index.add("Coffee Spot")
+    index.add("KFC")
+    return index
+
+
+def test_normalize_folds_ocr_confusions():
+    assert normalize("GR0CERY  ST0RE!") == normalize("grocery store") == "GROCERY STORE"
+    assert normalize("***") == ""
+
+
+def test_bounded_distance():
+    assert bounded_distance("GROCERY", "GROCERY", 2) == 0
+    assert bounded_distance("GROCERY", "GROCRY", 2) == 1
+    assert bounded_distance("KITTEN", "SITTING", 2) == 3
+    assert bounded_distance("A", "ABCDE", 2) == 3
+
+
+def test_matches_known_names():
+    index = _index()
+    assert index.match("GR0CERY STORE").merchant_id == "grocery"
+    assert index.match("GROCERY ST0RF") == ("grocery", "Grocery Store", 1, 0)
+    assert index.match("T3CH HAVN").merchant_id == "tech"
+    # Aliases resolve to the canonical name of their id
+    assert index.match("TECHHAVEN OUTLET") == ("tech", "Tech Haven", 0, 0)
+    assert index.match("Coffee Spot").merchant_id == "coffee-spot"
+
+
+def test_rejects_other_names():
+    index = _index()
+    assert index.match("GROCERY OUTLET") is None
+    assert index.match("BURGER JOINT") is None
+    # Short names must match exactly
+    assert index.match("KFC") is not None
+    assert index.match("KFO") is None
+    assert index.match("") is None
+    assert MerchantIndex().match("GROCERY STORE") is None
+
+
+def test_match_lines_prefers_closest_then_earliest():
+    index = _index()
+    match = index.match_lines(["123 Main St", "GROCERY ST0RF", "Tech Haven"])
+    assert (match.merchant_id, match.distance, match.line) == ("tech", 0, 2)
+    match = index.match_lines(["Tech Haven", "Grocery Store"])
+    assert (match.merchant_id, match.line) == ("tech", 0)
+
+
+def test_learn_adds_new_merchants_once():
+    index = _index()
+    assert index.learn("Burger Joint") == "burger-joint"
+    assert index.learn("BURGER J0INT") == "burger-joint"
+    assert index.learn("Grocery Store") == "grocery"
+    assert len(index) == 6
+
+
+def test_load_csv_with_aliases(tmp_path):
+    path = tmp_path / "merchants.csv"
+    path.write_text("m1,Fresh Mart\nm1,FreshMart Express\n,City Books\nm2,\n", encoding="utf-8")
+    index = MerchantIndex()
+    assert index.load_csv(str(path)) == 3
+    assert index.match("FRESHMART EXPRESS") == ("m1", "Fresh Mart", 0, 0)
+    assert index.match("CITY B00KS").merchant_id == "city-books"
+
+
+def test_resolve_uses_header_lines():
+    index = _index()
+    data = {"merchant": "GR0CERY STORE", "lines": [{"text": "GR0CERY STORE"}, {"text": "123 Main St"}]}
+    assert index.resolve(data) is data
+    assert (data["merchant"], data["merchant_id"]) == ("Grocery Store", "grocery")
+
+    unknown = {"merchant": "BURGER JOINT", "lines": [{"text": "BURGER JOINT"}]}
+    index.resolve(unknown)
+    assert (unknown["merchant"], unknown["merchant_id"]) == ("BURGER JOINT", None)
+
+    # Only the header is searched
+    late = {"merchant": "X", "lines": [{"text": "line"}] * 8 + [{"text": "Tech Haven"}]}
+    assert index.resolve(late)["merchant_id"] is None
+
+
+def test_cached_results_resolve_against_later_merchants():
+    with open(os.path.join(REPO, "sample_receipt_1.png"), "rb") as f:
+        image = f.read()
+    scanner = ReceiptScanner(cache=ScanCache())
+    scanner.merchant_index = MerchantIndex()
+    config = scanner.config()
+    cached = {"merchant": "BURGER J0INT", "date": None, "total": None, "items": [],
+              "lines": [{"text": "BURGER J0INT"}, {"text": "321 Elm St"}]}
+    scanner.cache.put(scanner.cache.make_key(image_fingerprint(image), config), cached)
+
+    first = scanner.scan(image)
+    assert (first["merchant"], first["merchant_id"]) == ("BURGER J0INT", None)
+
+    scanner.merchant_index.learn("Burger Joint")
+    # Learning a merchant doesn't change the cache key, so this is still a hit
+    assert scanner.config() == config
+    second = scanner.scan(image)
+    assert second["meta"]["counters"].get("cache_hits") == 1
+    assert (second["merchant"], second["merchant_id"]) == ("Burger Joint", "burger-joint")
+
+
+def test_store_keeps_merchant_id(tmp_path):
+    store = ReceiptStore(str(tmp_path / "receipts.db"))
+    receipt_id = store.save_receipt("alice", "Grocery Store", None, "1.00", [], merchant_id="grocery")
+    other_id = store.save_receipt("alice", "Corner Shop", None, "2.00", [])
+    assert store.get_receipt(receipt_id)["merchant_id"] == "grocery"
+    assert store.get_receipt(other_id)["merchant_id"] is None
+
+    store.update_receipts([{"receipt_id": other_id, "merchant": "Tech Haven", "merchant_id": "tech",
+                            "date": None, "total": "2.00", "items": []}])
+    assert store.get_receipt(other_id)["merchant_id"] == "tech"
+    store.close()
+
+
+def test_reparse_backfills_merchant_ids(tmp_path, sample_corpus):
+    import reparse
+
+    db = str(tmp_path / "receipts.db")
+    merchants = tmp_path / "merchants.csv"
+    merchants.write_text("tech,Tech Haven\n", encoding="utf-8")
+    store = ReceiptStore(db)
+    truth = next(t for t in sample_corpus if t["merchant"] == "TECH HAVEN")
+    receipt_id = store.save_receipt("alice", truth["merchant"], truth["date"], truth["total"], truth["items"],
+                                    boxes=truth["boxes"], parser_version=reparse.PARSER_VERSION)
+    store.close()
+
+    assert reparse.main(["--db", db, "--merchants", str(merchants), "-w", "1"]) == 0
+    assert ReceiptStore(db).get_receipt(receipt_id)["merchant_id"] is None
+    assert reparse.main(["--db", db, "--merchants", str(merchants), "-w", "1", "--all"]) == 0
+    receipt = ReceiptStore(db).get_receipt(receipt_id)
+    assert (receipt["merchant"], receipt["merchant_id"]) == ("Tech Haven", "tech")
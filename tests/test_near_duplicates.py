@@ -0,0 +1,115 @@
+import glob
+import io
+import itertools
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from image_io import decode_image
+from near_duplicates import HASH_BITS, RECORD, NearDuplicateIndex, hash_distance, phash
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAX_DISTANCE = NearDuplicateIndex().max_distance
+
+
+def distance(a, b):
+    return int(np.unpackbits(np.frombuffer(a, np.uint8) ^ np.frombuffer(b, np.uint8)).sum())
+
+
+def jpeg(img_array, quality=80):
+    buf = io.BytesIO()
+    Image.fromarray(img_array).save(buf, "JPEG", quality=quality)
+    return decode_image(buf.getvalue())
+
+
+def test_distinct_generated_receipts_do_not_match(sample_corpus):
+    hashes = [phash(decode_image(truth["path"])) for truth in sample_corpus]
+    closest = min(distance(a, b) for a, b in itertools.combinations(hashes, 2))
+    assert closest > MAX_DISTANCE
+
+
+def test_distinct_committed_samples_do_not_match():
+    paths = sorted(glob.glob(os.path.join(REPO, "sample_receipt_*.png")))
+    hashes = [phash(decode_image(path)) for path in paths]
+    closest = min(distance(a, b) for a, b in itertools.combinations(hashes, 2))
+    assert closest > MAX_DISTANCE
+
+
+def test_copies_match():
+    img = decode_image(os.path.join(REPO, "sample_receipt_1.png"))
+    h = phash(img)
+    assert distance(h, phash(jpeg(img))) <= MAX_DISTANCE
+    # Photographed on a table: the background is cropped away
+    assert phash(np.pad(img, ((60, 60), (50, 50), (0, 0)), constant_values=90)) == h
+    brighter = np.clip(img.astype(np.int16) - 30, 0, 255).astype(np.uint8)
+    assert distance(h, phash(brighter)) <= MAX_DISTANCE
+
+
+def test_index_finds_copy_and_not_other_receipts(sample_corpus):
+    index = NearDuplicateIndex()
+    images = [decode_image(truth["path"]) for truth in sample_corpus[:10]]
+    for i, img in enumerate(images):
+        index.add(phash(img), bytes([i]) * 32)
+    assert index.find(phash(decode_image(sample_corpus[10]["path"]))) is None
+    found = index.find(phash(images[3]))
+    assert found == ((bytes([3]) * 32).hex(), 0)
+
+
+def _flip(h, bits):
+    arr = np.unpackbits(np.frombuffer(h, np.uint8))
+    arr[list(bits)] ^= 1
+    return np.packbits(arr).tobytes()
+
+
+# Few distinct chunk values, as with real receipts, so buckets overlap heavily and
+# find() counts densely; with many, buckets are small and only their contents are counted
+@pytest.mark.parametrize("bases", [4, 500])
+def test_lookup_matches_brute_force(bases):
+    rng = np.random.default_rng(0)
+    base = rng.integers(0, 256, size=(bases, HASH_BITS // 8), dtype=np.uint8)
+    stored = [_flip(base[rng.integers(bases)].tobytes(), rng.choice(HASH_BITS, size=rng.integers(10, 40), replace=False))
+              for _ in range(500)]
+    index = NearDuplicateIndex()
+    for i, h in enumerate(stored):
+        index.add(h, i.to_bytes(32, "big"))
+    for _ in range(200):
+        target = stored[rng.integers(len(stored))]
+        query = _flip(target, rng.choice(HASH_BITS, size=rng.integers(0, 2 * MAX_DISTANCE), replace=False))
+        nearest = min(distance(query, h) for h in stored)
+        found = index.find(query)
+        if nearest <= MAX_DISTANCE:
+            assert found is not None and found[1] == nearest
+            assert distance(query, stored[int(found[0], 16)]) == nearest
+        else:
+            assert found is None
+
+
+def test_hash_distance_counts_differing_bits():
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        a, b = (rng.integers(0, 256, size=HASH_BITS // 8, dtype=np.uint8).tobytes() for _ in range(2))
+        assert hash_distance(a, b) == distance(a, b)
+    assert hash_distance(a, a) == 0
+
+
+def test_index_survives_restart(tmp_path):
+    path = str(tmp_path / "receipts.phash")
+    h = bytes(range(32))
+    index = NearDuplicateIndex(path)
+    index.add(h, "ab" * 32)
+    index.add(_flip(h, range(100)), "cd" * 32)
+    with open(path, "ab") as f:
+        # Torn record from a crash mid-append
+        f.write(RECORD.pack(h, b"\xff" * 32)[:40])
+
+    reloaded = NearDuplicateIndex(path)
+    assert len(reloaded) == 2
+    assert reloaded.find(_flip(h, [5, 77])) == ("ab" * 32, 2)
+    assert reloaded.find(_flip(h, range(100))) == ("cd" * 32, 0)
+
+
+def test_max_distance_must_leave_an_exact_chunk():
+    with pytest.raises(ValueError):
+        NearDuplicateIndex(max_distance=16)
@@ -0,0 +1,134 @@
+import os
+
+import numpy as np
+import pytest
+
+import batch_scan
+import ocr_demo
+from near_duplicates import NearDuplicateIndex
+from ocr_demo import ReceiptScanner, check_strip_settings
+from preview import PreviewLoader
+from scan_cache import ScanCache
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _BlankReader:
+    """Finds no text; enough for scanner paths that don't depend on OCR output."""
+
+    def detect(self, img_array):
+        return [[]], [[]]
+
+    def recognize(self, img_array, horizontal_list, free_list, batch_size=1):
+        return []
+
+
+@pytest.mark.parametrize("height, overlap", [(150, 200), (200, 200), (400, 200), (100, -10)])
+def test_bad_strip_settings_raise(height, overlap):
+    with pytest.raises(ValueError):
+        check_strip_settings(height, overlap)
+
+
+def test_strip_settings_that_advance():
+    check_strip_settings(None, 200)
+    check_strip_settings(401, 200)
+    check_strip_settings(100, 0)
+
+
+def test_scan_with_bad_strips_raises_instead_of_hanging():
+    scanner = ReceiptScanner(reader=_BlankReader())
+    scanner.strip_height = 150
+    with pytest.raises(ValueError):
+        scanner.scan(np.full((2000, 100, 3), 255, dtype=np.uint8))
+    with pytest.raises(ValueError):
+        list(scanner.scan_batch([np.zeros((10, 10, 3), dtype=np.uint8)], workers=2))
+
+
+def test_batch_scan_rejects_bad_strip_height(capsys):
+    with pytest.raises(SystemExit):
+        batch_scan.main(["receipt.png", "--strip-height", "150"])
+    assert "strip_height" in capsys.readouterr().err
+
+
+@pytest.mark.parametrize("height", [401, 1000, 5000, 12345])
+def test_strip_bands_cover_the_image_once(height):
+    scanner = ReceiptScanner(reader=_BlankReader())
+    scanner.strip_height = 401
+    bands = scanner._strip_bands(height)
+    assert bands[0][1] == 0 and bands[-1][2] == height
+    for (_, _, keep_to), (_, keep_from, _) in zip(bands, bands[1:]):
+        assert keep_to == keep_from
+
+
+class _RecordingReader(_BlankReader):
+    def __init__(self):
+        self.images = []
+
+    def detect(self, img_array):
+        self.images.append(img_array)
+        return super().detect(img_array)
+
+
+def test_scan_reuses_the_pixels_a_preview_decoded(monkeypatch):
+    with open(os.path.join(REPO, "sample_receipt_1.png"), "rb") as f:
+        data = f.read()
+    loader = PreviewLoader()
+    try:
+        preview = loader.load(data)
+    finally:
+        loader.shutdown()
+    full = preview.array()
+
+    reader = _RecordingReader()
+    scanner = ReceiptScanner(reader=reader, cache=ScanCache(), near_duplicates=NearDuplicateIndex())
+    scanner.recheck_passes = ()
+
+    def no_decode(source):
+        raise AssertionError("the PNG was decoded again")
+
+    monkeypatch.setattr(ocr_demo, "decode_image", no_decode)
+    assert scanner.find_near_duplicate(preview) is None
+    result = scanner.scan(preview)
+    assert "error" not in result
+    assert reader.images[0] is full
+    # The preview's bytes key the cache, so the same upload as bytes is a hit
+    assert scanner.scan(data)["meta"]["counters"]["cache_hits"] == 1
+    preview.release()
+
+
+class _ListSink:
+    def __init__(self):
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_scan_batch_workers_apply_cache_gate_and_instrumentation(monkeypatch, tmp_path, workers):
+    from instrumentation import Instrumentation
+    from quality import QualityGate
+
+    # Worker processes are forked, so they build this reader too
+    monkeypatch.setattr(ReceiptScanner, "_load_reader", lambda self: _BlankReader())
+    receipt = os.path.join(REPO, "sample_receipt_1.png")
+    blank = np.full((800, 600, 3), 255, dtype=np.uint8)
+
+    def make_scanner():
+        sink = _ListSink()
+        scanner = ReceiptScanner(cache=ScanCache(cache_dir=str(tmp_path / "cache")),
+                                 instrumentation=Instrumentation([sink]))
+        scanner.quality_gate = QualityGate()
+        return scanner, sink
+
+    scanner, sink = make_scanner()
+    first = scanner.scan_many([receipt, blank], workers=workers)
+    assert "error" not in first[0]
+    assert "quality" in first[1]
+    assert len(sink.records) == 2
+
+    # A fresh scanner (empty memory tier) finds the result on disk
+    scanner, sink = make_scanner()
+    again = scanner.scan_many([receipt], workers=workers)
+    assert "error" not in again[0]
+    assert [record["counters"].get("cache_hits") for record in sink.records] == [1]
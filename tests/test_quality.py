@@ -0,0 +1,47 @@
+import glob
+import os
+
+import cv2
+import numpy as np
+
+from image_io import decode_image
+from quality import QualityGate, ink_contrast
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_generated_receipts_pass(sample_corpus):
+    gate = QualityGate()
+    for truth in sample_corpus:
+        report = gate.assess(decode_image(truth["path"]))
+        assert report.ok, (truth["image"], report.problems)
+
+
+def test_committed_samples_pass():
+    gate = QualityGate()
+    for path in sorted(glob.glob(os.path.join(REPO, "sample_receipt_*.png"))):
+        report = gate.assess(decode_image(path))
+        assert report.ok, (path, report.problems)
+
+
+def test_blurred_receipt_is_rejected(sample_corpus):
+    img = cv2.GaussianBlur(decode_image(sample_corpus[0]["path"]), (0, 0), 2.5)
+    report = QualityGate().assess(img)
+    assert "blurry" in [code for code, _ in report.problems]
+
+
+def test_washed_out_receipt_is_rejected(sample_corpus):
+    img = decode_image(sample_corpus[0]["path"]).astype(np.float32)
+    report = QualityGate().assess((img * 0.15 + 200).astype(np.uint8))
+    assert "low_contrast" in [code for code, _ in report.problems]
+
+
+def test_contrast_does_not_depend_on_ink_coverage():
+    paper = np.full(10000, 235, dtype=np.uint8)
+    sparse = paper.copy()
+    sparse[:30] = 40
+    dense = paper.copy()
+    dense[:2000] = 40
+    assert ink_contrast(sparse) == ink_contrast(dense) == 195
+    assert ink_contrast(paper) == 0.0
+    assert ink_contrast(np.array([], dtype=np.uint8)) == 0.0
@@ -0,0 +1,242 @@
+import random
+import sqlite3
+
+import pytest
+
+from receipt_store import SCHEMA, ReceiptStore, format_cents, to_cents
+
+
+def _first_schema_db(path):
+    """A database as the first release created it: migration 1 only, amounts as text."""
+    conn = sqlite3.connect(path)
+    conn.executescript(f"BEGIN; {SCHEMA[0]} PRAGMA user_version = 1; COMMIT;")
+    conn.executemany(
+        "INSERT INTO receipts (username, merchant, date, receipt_date, total, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            ("alice", "FRESH MART", "01/15/2026", "2026-01-15", "12.50", "2026-01-15T10:00:00+00:00"),
+            ("alice", "FRESH MART", "02/01/2026", "2026-02-01", "3.5", "2026-02-01T10:00:00+00:00"),
+            ("bob", None, None, None, "N/A", "2026-02-02T10:00:00+00:00"),
+        ],
+    )
+    conn.executemany(
+        "INSERT INTO items (receipt_id, position, name, price) VALUES (?, ?, ?, ?)",
+        [(1, 0, "Milk", "2.50"), (1, 1, "Cheese", "10.00"), (2, 0, "milk ", "3.5"), (3, 0, "Bag", None)],
+    )
+    conn.commit()
+    conn.close()
+
+
+def test_migrates_first_schema_database(tmp_path):
+    path = str(tmp_path / "receipts.db")
+    _first_schema_db(path)
+    store = ReceiptStore(path)
+    conn = store._connect()
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(SCHEMA)
+
+    first = store.get_receipt(1)
+    assert (first["total"], first["total_cents"]) == ("12.50", 1250)
+    assert [item["price_cents"] for item in first["items"]] == [250, 1000]
+    assert store.get_receipt(2)["total_cents"] == 350
+    assert store.get_receipt(3)["total_cents"] is None
+
+    assert store.spending_rollup("alice", "merchant") == [("FRESH MART", 2, 1600)]
+    assert store.spending_rollup("alice", "month") == [("2026-01", 1, 1250), ("2026-02", 1, 350)]
+    assert store.spending_rollup("alice", "item") == [("CHEESE", 1, 1000), ("MILK", 2, 600)]
+    assert store.spending_rollup("bob", "merchant") == [("", 1, 0)]
+    store.close()
+
+
+def test_migration_parses_amounts_like_to_cents(tmp_path):
+    path = str(tmp_path / "receipts.db")
+    _first_schema_db(path)
+    amounts = ["1,234.56", "1.2.3", "12.345", " 7 ", "$5.00", "", "1e2"]
+    conn = sqlite3.connect(path)
+    conn.executemany(
+        "INSERT INTO receipts (username, total, created_at) VALUES ('carol', ?, '2026-03-01T10:00:00+00:00')",
+        [(amount,) for amount in amounts],
+    )
+    conn.executemany("INSERT INTO items (receipt_id, position, name, price) VALUES (4, ?, 'X', ?)",
+                     list(enumerate(amounts)))
+    conn.commit()
+    conn.close()
+
+    store = ReceiptStore(path)
+    expected = [to_cents(amount) for amount in amounts]
+    assert expected[:3] == [123456, None, 1235]
+    assert [store.get_receipt(receipt_id)["total_cents"] for receipt_id in range(4, 4 + len(amounts))] == expected
+    assert [item["price_cents"] for item in store.get_receipt(4)["items"]] == expected
+    assert store.spending_rollup("carol", "merchant") == [("", len(amounts), sum(c for c in expected if c))]
+    store.close()
+
+
+def test_failed_migration_step_rolls_back(tmp_path, monkeypatch):
+    import receipt_store
+
+    path = str(tmp_path / "receipts.db")
+    _first_schema_db(path)
+
+    def broken(conn):
+        conn.execute("ALTER TABLE receipts ADD COLUMN total_cents INTEGER")
+        raise RuntimeError("interrupted")
+
+    monkeypatch.setattr(receipt_store, "SCHEMA", [SCHEMA[0], broken] + SCHEMA[2:])
+    with pytest.raises(RuntimeError):
+        ReceiptStore(path)
+    conn = sqlite3.connect(path)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 1
+    assert "total_cents" not in [row[1] for row in conn.execute("PRAGMA table_info(receipts)")]
+    conn.close()
+
+    # The real migration still runs afterwards
+    monkeypatch.setattr(receipt_store, "SCHEMA", SCHEMA)
+    assert ReceiptStore(path).get_receipt(1)["total_cents"] == 1250
+
+
+def test_migrated_database_accepts_new_receipts(tmp_path):
+    path = str(tmp_path / "receipts.db")
+    _first_schema_db(path)
+    store = ReceiptStore(path)
+    receipt_id = store.save_receipt("alice", "FRESH MART", "2026-02-10", "1.00", [{"name": "Milk", "price": "1.00"}],
+                                    boxes=[([[0, 0], [1, 0], [1, 1], [0, 1]], "Milk 1.00", 0.9)], parser_version=2)
+    assert receipt_id == 4
+    assert store.spending_rollup("alice", "merchant") == [("FRESH MART", 3, 1700)]
+    assert [scan["receipt_id"] for scan in store.iter_stored_scans()] == [4]
+    store.close()
+
+    # Reopening runs no migration twice
+    reopened = ReceiptStore(path)
+    assert reopened.count_receipts() == 4
+    reopened.close()
+
+
+def test_imports_legacy_csv_once(tmp_path):
+    csv_path = tmp_path / "receipts_db.csv"
+    csv_path.write_text(
+        "Username,Merchant,Date,Total,Items\n"
+        "alice,FRESH MART,01/15/2026,12.50,Milk (2.50); Cheese (10.00)\n"
+        "alice,,,,Bag\n",
+        encoding="utf-8",
+    )
+    store = ReceiptStore(str(tmp_path / "receipts.db"))
+    assert store.migrate_from_csv(str(csv_path)) == 2
+    assert store.migrate_from_csv(str(csv_path)) == 0
+    assert store.get_receipt(1)["items"][1] == {"name": "Cheese", "price": "10.00", "price_cents": 1000}
+    assert store.get_receipt(2)["items"] == [{"name": "Bag", "price": None, "price_cents": None}]
+    assert store.spending_summary("alice") == {"receipts": 2, "total_cents": 1250}
+    store.close()
+
+
+@pytest.mark.parametrize("value, cents", [
+    ("3.50", 350),
+    ("3.5", 350),
+    ("3", 300),
+    (" 12.34 ", 1234),
+    ("1,234.56", 123456),
+    ("0.005", 1),
+    ("0.004", 0),
+    ("2.675", 268),
+    ("-1.25", -125),
+    (3.5, 350),
+    (0.1 + 0.2, 30),
+    (7, 700),
+    ("", None),
+    ("N/A", None),
+    ("12.34.56", None),
+    ("NaN", None),
+    ("Infinity", None),
+    (None, None),
+])
+def test_to_cents(value, cents):
+    assert to_cents(value) == cents
+
+
+@pytest.mark.parametrize("cents, text", [
+    (350, "3.50"),
+    (5, "0.05"),
+    (0, "0.00"),
+    (-125, "-1.25"),
+    (123456, "1234.56"),
+    (None, None),
+])
+def test_format_cents(cents, text):
+    assert format_cents(cents) == text
+
+
+def test_cents_round_trip():
+    for cents in range(-1000, 100000, 7):
+        assert to_cents(format_cents(cents)) == cents
+
+
+def _rollups(conn):
+    return {
+        table: sorted(tuple(row) for row in conn.execute(f"SELECT * FROM {table}"))
+        for table in ("spend_by_merchant", "spend_by_month", "spend_by_item")
+    }
+
+
+def _rollups_from_scratch(conn):
+    """What the rollup migration would compute over the current rows."""
+    return {
+        "spend_by_merchant": sorted(tuple(row) for row in conn.execute(
+            "SELECT username, ifnull(merchant, ''), COUNT(*), ifnull(SUM(total_cents), 0) "
+            "FROM receipts GROUP BY 1, 2")),
+        "spend_by_month": sorted(tuple(row) for row in conn.execute(
+            "SELECT username, ifnull(substr(receipt_date, 1, 7), ''), COUNT(*), ifnull(SUM(total_cents), 0) "
+            "FROM receipts GROUP BY 1, 2")),
+        "spend_by_item": sorted(tuple(row) for row in conn.execute(
+            "SELECT r.username, upper(trim(i.name)), COUNT(*), ifnull(SUM(i.price_cents), 0) "
+            "FROM items i JOIN receipts r ON r.id = i.receipt_id GROUP BY 1, 2")),
+    }
+
+
+def test_rollups_stay_consistent_after_update_receipts(tmp_path):
+    rng = random.Random(3)
+    merchants = ["FRESH MART", "TECH HAVEN", None]
+    names = ["Milk", "milk", "Eggs", "Bread", "Tax (10%)"]
+
+    def random_fields():
+        return {
+            "merchant": rng.choice(merchants),
+            "date": rng.choice(["01/15/2026", "2026-02-03", "Mar 4, 2026", None]),
+            "total": rng.choice([f"{rng.randint(0, 5000) / 100:.2f}", None, "N/A"]),
+            "items": [{"name": rng.choice(names), "price": rng.choice([f"{rng.randint(1, 999) / 100:.2f}", None])}
+                      for _ in range(rng.randint(0, 4))],
+        }
+
+    store = ReceiptStore(str(tmp_path / "receipts.db"))
+    ids = []
+    for _ in range(40):
+        fields = random_fields()
+        ids.append(store.save_receipt(rng.choice(["alice", "bob"]), fields["merchant"], fields["date"],
+                                      fields["total"], fields["items"]))
+    conn = store._connect()
+    assert _rollups(conn) == _rollups_from_scratch(conn)
+
+    for _ in range(5):
+        changes = [dict(random_fields(), receipt_id=receipt_id) for receipt_id in rng.sample(ids, 15)]
+        assert store.update_receipts(changes, parser_version=2) == 15
+        assert _rollups(conn) == _rollups_from_scratch(conn)
+
+    # Rewriting a receipt with its own fields leaves the rollups unchanged
+    before = _rollups(conn)
+    receipt = store.get_receipt(ids[0])
+    store.update_receipts([{"receipt_id": ids[0], "merchant": receipt["merchant"], "date": receipt["date"],
+                            "total": receipt["total"], "items": receipt["items"]}])
+    assert _rollups(conn) == before
+    store.close()
+
+
+def test_update_receipts_marks_parser_version(tmp_path):
+    store = ReceiptStore(str(tmp_path / "receipts.db"))
+    boxes = [([[0, 0], [1, 0], [1, 1], [0, 1]], "Milk 1.00", 0.9)]
+    old = store.save_receipt("alice", "FRESH MART", None, "1.00", [], boxes=boxes, parser_version=1)
+    current = store.save_receipt("alice", "FRESH MART", None, "1.00", [], boxes=boxes, parser_version=2)
+    version = store.version()
+    assert [scan["receipt_id"] for scan in store.iter_stored_scans(skip_parser_version=2)] == [old]
+
+    store.update_receipts([{"receipt_id": old, "merchant": "FRESH MART", "date": None, "total": "1.00",
+                            "items": [{"name": "Milk", "price": "1.00"}]}], parser_version=2)
+    assert store.version() == version + 1
+    assert list(store.iter_stored_scans(skip_parser_version=2)) == []
+    assert [scan["receipt_id"] for scan in store.iter_stored_scans()] == [old, current]
+    store.close()
@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+from scan_scheduler import ScanScheduler
+
+
+class _BlockingScanner:
+    """scan() waits for release; started is set when a scan begins."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.scanned = []
+
+    def scan(self, image):
+        self.scanned.append(image)
+        self.started.set()
+        assert self.release.wait(5)
+        return {"image": image}
+
+
+@pytest.fixture
+def scheduler():
+    scanner = _BlockingScanner()
+    scheduler = ScanScheduler(scanner, max_concurrency=1)
+    yield scheduler
+    scanner.release.set()
+    scheduler.shutdown()
+
+
+def test_cancel_while_running_keeps_the_worker_alive(scheduler):
+    scanner = scheduler.scanner
+    future = scheduler.submit("alice", b"a", key="a")
+    assert scanner.started.wait(5)
+    # A running scan can't be cancelled, so delivering its result can't fail
+    assert not future.cancel()
+    joined = scheduler.submit("bob", b"a", key="a")
+    assert not joined.cancel()
+    scanner.release.set()
+    assert future.result(5) == {"image": b"a"}
+    assert joined.result(5) == {"image": b"a"}
+
+    # The worker thread survived and serves the next submit
+    assert scheduler.submit("alice", b"b", key="b").result(5) == {"image": b"b"}
+
+
+def test_cancelled_queued_job_is_skipped(scheduler):
+    scanner = scheduler.scanner
+    first = scheduler.submit("alice", b"a", key="a")
+    assert scanner.started.wait(5)
+    queued = scheduler.submit("bob", b"b", key="b")
+    assert queued.cancel()
+    scanner.release.set()
+    assert first.result(5) == {"image": b"a"}
+    assert scheduler.submit("carol", b"c", key="c").result(5) == {"image": b"c"}
+    assert scanner.scanned == [b"a", b"c"]
+
+
+def test_uncopyable_result_fails_only_the_joined_caller(scheduler):
+    scanner = scheduler.scanner
+    scanner.scan = lambda image: {"lock": threading.Lock()} if scanner.release.wait(5) else None
+    first = scheduler.submit("alice", b"x", key="x")
+    joined = scheduler.submit("bob", b"x", key="x")
+    scanner.release.set()
+    assert "lock" in first.result(5)
+    with pytest.raises(TypeError):
+        joined.result(5)
+    assert "lock" in scheduler.submit("alice", b"y", key="y").result(5)
@@ -0,0 +1,116 @@
+import numpy as np
+
+from instrumentation import Instrumentation
+from ocr_demo import ReceiptScanner
+from receipt_parser import ReceiptParser
+from line_grouper import group_lines
+from validation import check_totals
+
+
+def _receipt(total="7.14", subtotal="6.49", tax=None, items=None):
+    items = items if items is not None else [
+        {"name": "Milk", "price": "3.50"}, {"name": "Eggs", "price": "2.99"}, {"name": "Tax (10%)", "price": "0.65"},
+    ]
+    return {"total": total, "subtotal": subtotal, "tax": tax, "items": items}
+
+
+def _failed(result):
+    return [check["check"] for check in result["checks"] if not check["ok"]]
+
+
+def test_consistent_receipt_is_ok():
+    result = check_totals(_receipt())
+    assert result["status"] == "ok"
+    assert [check["check"] for check in result["checks"]] == ["items_total", "subtotal", "subtotal_tax"]
+
+
+def test_misread_total_is_a_mismatch():
+    result = check_totals(_receipt(total="7.44"))
+    assert result["status"] == "mismatch"
+    assert _failed(result) == ["items_total", "subtotal_tax"]
+    assert result["checks"][0]["expected"] == 744 and result["checks"][0]["found"] == 714
+
+
+def test_misread_item_is_a_mismatch():
+    items = [{"name": "Milk", "price": "8.50"}, {"name": "Eggs", "price": "2.99"}, {"name": "TAX", "price": "0.65"}]
+    assert _failed(check_totals(_receipt(items=items))) == ["items_total", "subtotal"]
+
+
+def test_tax_field_used_without_a_tax_item():
+    items = [{"name": "Milk", "price": "3.50"}, {"name": "Eggs", "price": "2.99"}]
+    assert check_totals(_receipt(items=items, tax="0.65"))["status"] == "ok"
+    # Without any tax the goods must add up to the total on their own
+    assert _failed(check_totals(_receipt(items=items, subtotal=None))) == ["items_total"]
+
+
+def test_amounts_compare_in_cents():
+    items = [{"name": "A", "price": "0.10"}, {"name": "B", "price": "0.20"}]
+    assert check_totals({"total": "0.3", "items": items})["status"] == "ok"
+    assert check_totals({"total": "1,000.30", "items": [{"name": "TV", "price": "1000.30"}]})["status"] == "ok"
+
+
+def test_unreadable_amounts_are_unchecked():
+    assert check_totals({"items": []})["status"] == "unchecked"
+    assert check_totals({"total": "N/A", "items": [{"name": "Milk", "price": "3.50"}]})["status"] == "unchecked"
+    # An item without a readable price skips the item checks but not subtotal + tax
+    items = [{"name": "Milk", "price": "3.5O"}, {"name": "TAX", "price": "0.65"}]
+    result = check_totals(_receipt(items=items))
+    assert [check["check"] for check in result["checks"]] == ["subtotal_tax"]
+
+
+def test_generated_receipts_add_up(sample_corpus):
+    parser = ReceiptParser()
+    for truth in sample_corpus:
+        assert check_totals(truth)["status"] == "ok", truth["image"]
+        data = parser.parse([line.text for line in group_lines(truth["boxes"], deskew=True)])
+        assert check_totals(data)["status"] == "ok", truth["image"]
+
+
+class _PixelReader:
+    """Reads the amount encoded in each box's pixel value, so crops from the wrong place read wrong."""
+
+    def __init__(self, amounts):
+        self.amounts = amounts
+        self.crops = []
+
+    def recognize(self, crop, horizontal_list, free_list, batch_size=1):
+        self.crops.append(crop.shape)
+        results = []
+        for quad in free_list:
+            x, y = np.mean(quad, axis=0)
+            value = int(crop[int(y), int(x)])
+            results.append((quad, self.amounts.get(value, "?"), 0.99))
+        return results
+
+
+def test_recheck_crops_from_the_original_image():
+    # (prepared-image box, text as first read, pixel value in the original, true text)
+    lines = [("Milk", "3.50"), ("Eggs", "2.99"), ("SUBTOTAL", "6.49"), ("TAX", "0.65"), ("TOTAL", "7.44")]
+    truth = {"7.44": "7.14"}
+    original = np.full((400, 500), 255, dtype=np.uint8)
+    amounts = {}
+    raw_results = []
+    for i, (name, price) in enumerate(lines):
+        top = 20 + 30 * i
+        raw_results.append(([[10, top], [80, top], [80, top + 12], [10, top + 12]], name, 0.9))
+        raw_results.append(([[150, top], [190, top], [190, top + 12], [150, top + 12]], price, 0.9))
+        # The preprocessor halved the image: the original box is twice as large
+        value = 40 + 20 * i
+        original[2 * top:2 * (top + 12), 300:380] = value
+        amounts[value] = truth.get(price, price)
+    info = {"scale": 0.5, "transform": [[0.5, 0, 0], [0, 0.5, 0], [0, 0, 1]]}
+
+    scanner = ReceiptScanner()
+    trace = Instrumentation().start("test")
+    data = scanner._parse_lines([f"{name} {price}" for name, price in lines])
+    assert check_totals(data)["status"] == "mismatch"
+
+    reader = _PixelReader(amounts)
+    fixed = scanner._recheck(original, raw_results, "upscale", 1, trace, reader, info)
+    assert fixed is not None
+    data, results, _, validation = fixed
+    assert data["total"] == "7.14" and validation["status"] == "ok"
+    # Boxes keep their prepared-image coordinates
+    assert [bbox for bbox, _, _ in results] == [bbox for bbox, _, _ in raw_results]
+    # recheck_scale 2 of a half-size prepared image: original pixels at 1:1
+    assert all(height >= 24 for height, _ in reader.crops)
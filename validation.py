@@ -0,0 +1,45 @@
+from receipt_store import to_cents
+
+# Items whose name contains this are tax lines, not goods
+TAX_WORD = "TAX"
+
+
+def check_totals(data):
+    """
+    Cross-checks the parsed amounts in integer cents.
+    Tax usually appears as a line item; the parsed "tax" field is only
+    added when no item is a tax line.
+
+    Checks (each runs only when its amounts were found):
+      items_total: goods + tax == total
+      subtotal: goods == subtotal
+      subtotal_tax: subtotal + tax == total
+
+    Returns {"status", "checks"}; status is "ok" when every check that ran
+    passed, "mismatch" when one failed and "unchecked" when none could run.
+    """
+    total = to_cents(data.get("total"))
+    subtotal = to_cents(data.get("subtotal"))
+    items = data.get("items") or []
+    goods = [to_cents(item.get("price")) for item in items if TAX_WORD not in item["name"].upper()]
+    tax_items = [to_cents(item.get("price")) for item in items if TAX_WORD in item["name"].upper()]
+    readable = None not in goods and None not in tax_items
+    tax = sum(tax_items) if tax_items else to_cents(data.get("tax"))
+
+    checks = []
+    if total is not None and goods and readable:
+        checks.append({"check": "items_total", "expected": total, "found": sum(goods) + (tax or 0)})
+    if subtotal is not None and goods and readable:
+        checks.append({"check": "subtotal", "expected": subtotal, "found": sum(goods)})
+    if subtotal is not None and total is not None and tax is not None:
+        checks.append({"check": "subtotal_tax", "expected": total, "found": subtotal + tax})
+    for check in checks:
+        check["ok"] = check["expected"] == check["found"]
+
+    if not checks:
+        status = "unchecked"
+    elif all(check["ok"] for check in checks):
+        status = "ok"
+    else:
+        status = "mismatch"
+    return {"status": status, "checks": checks}